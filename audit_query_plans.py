@@ -0,0 +1,61 @@
+import argparse
+import sqlite3
+import sys
+
+from serve_map_data import server_queries
+
+def partial_indexes(conn):
+    """Names of indexes that carry a WHERE clause (they only hold matching rows)"""
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    return {name for name, sql in rows if ' WHERE ' in ' '.join(sql.upper().split())}
+
+def is_full_scan(detail, partial, subqueries=()):
+    """True when a query plan step reads a whole table or a whole full index"""
+    if not detail.startswith('SCAN '):
+        return False
+    if detail.split()[1] in subqueries:
+        # Reading back the rows of a subquery, not a table
+        return False
+    if 'VIRTUAL TABLE' in detail:
+        return False
+    if ' INDEX ' in detail:
+        index_name = detail.split(' INDEX ', 1)[1].split()[0]
+        return index_name not in partial
+    return True
+
+def audit(db_path):
+    """Run EXPLAIN QUERY PLAN on every server query; return the number of failures"""
+    conn = sqlite3.connect(db_path)
+    partial = partial_indexes(conn)
+    failures = 0
+    try:
+        for name, sql, params, full_export in server_queries():
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+            subqueries = {step.split()[1] for step in plan if step.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+            scans = [step for step in plan if is_full_scan(step, partial, subqueries)]
+
+            if not scans:
+                status = 'ok'
+            elif full_export:
+                status = 'ok (full export)'
+            else:
+                status = 'FULL SCAN'
+                failures += 1
+
+            print(f"{status:<17} {name}")
+            for step in plan:
+                print(f"{'':<17}   {step}")
+    finally:
+        conn.close()
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that server queries are served from indexes")
+    parser.add_argument('--db', default='data/targets.db')
+    args = parser.parse_args()
+
+    failures = audit(args.db)
+    if failures:
+        print(f"\n{failures} queries fall back to a full scan; run python init_database.py to build indexes")
+        sys.exit(1)
+    print("\nAll queries use indexes")
@@ -0,0 +1,73 @@
+"""Time the clustering engine on the delivered ZIPs and on a synthetic national ZCTA set.
+
+Run from the repository root:
+
+    python benchmarks/bench_clustering.py [--national 33000] [--repeat 3]
+
+The national set is --national points scattered around the delivered ZIP
+centroids (about +/- 25 km), graded in equal fifths at random, so it has
+the density of the real data at roughly the national ZCTA count. All eight
+analyses are run serially and with one worker process per CPU.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clustering import cluster_all  # noqa: E402
+from ingest import ZIPS_CSV, read_zips  # noqa: E402
+from scoring import GRADES  # noqa: E402
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def delivered_zips():
+    df = read_zips(ZIPS_CSV, usecols=['ZIP', 'latitude', 'longitude', 'grade'])
+    df = df.rename(columns={'ZIP': 'zip_code'}).dropna(subset=['latitude', 'longitude'])
+    return df.astype({'grade': str})
+
+
+def national_zips(seeds, n, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(seeds), n)
+    return pd.DataFrame({
+        'zip_code': [f'{i:05d}' for i in range(n)],
+        'latitude': seeds['latitude'].to_numpy()[picks] + rng.normal(0, 0.2, n),
+        'longitude': seeds['longitude'].to_numpy()[picks] + rng.normal(0, 0.25, n),
+        'grade': rng.permutation(np.resize(GRADES, n)),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--national', type=int, default=33000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    delivered = delivered_zips()
+    datasets = [('delivered', delivered), ('national', national_zips(delivered, args.national))]
+    cpus = os.cpu_count() or 1
+
+    print(f"{'dataset':<10} {'ZIPs':>7} {'workers':>8} {'seconds':>8} {'clusters':>9} {'memberships':>12}")
+    for label, zips in datasets:
+        for workers in sorted({1, cpus}):
+            clusters, elapsed = timed(lambda: cluster_all(zips, workers=workers), args.repeat)
+            print(f"{label:<10} {len(zips):7d} {workers:8d} {elapsed:8.2f} "
+                  f"{clusters.groupby('analysis_type')['cluster_id'].nunique().sum():9d} {len(clusters):12d}")
+
+
+if __name__ == "__main__":
+    main()
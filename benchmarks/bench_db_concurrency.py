@@ -0,0 +1,118 @@
+"""Concurrent read/write load test: per-request connections vs the pooled WAL layer.
+
+Run from the repository root (after python init_database.py):
+
+    python benchmarks/bench_db_concurrency.py [--readers 8] [--writers 2] [--seconds 5]
+
+Readers run the /api/clusters query, writers run the /api/update_status
+transaction, both against a temporary copy of data/targets.db.
+"before" opens a fresh rollback-journal connection per operation, as the
+server used to; "after" borrows connections from db.ConnectionPool in WAL mode.
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import serve_map_data as server  # noqa: E402
+
+STATUSES = ['not contacted', 'initial contact', 'in discussion', 'partnership agreed']
+
+
+def legacy_connection(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def read_once(conn, analysis_type):
+    conn.execute(server.CLUSTERS_QUERY, (analysis_type,)).fetchall()
+
+
+def legacy_write_once(conn, organization):
+    current = conn.execute(server.STATUS_QUERY, (organization,)).fetchone()
+    conn.execute(server.UPDATE_STATUS_QUERY, (random.choice(STATUSES), organization))
+    conn.execute(server.LOG_ACTIVITY_QUERY, (organization, current[0], 'x'))
+    conn.commit()
+
+
+def pooled_write_once(conn, organization):
+    with db.write_transaction(conn):
+        current = conn.execute(server.STATUS_QUERY, (organization,)).fetchone()
+        conn.execute(server.UPDATE_STATUS_QUERY, (random.choice(STATUSES), organization))
+        conn.execute(server.LOG_ACTIVITY_QUERY, (organization, current[0], 'x'))
+
+
+def run(mode, db_path, readers, writers, seconds):
+    if mode == 'before':
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('PRAGMA journal_mode = DELETE')
+        acquire = lambda: legacy_connection(db_path)  # noqa: E731
+        write_once = legacy_write_once
+    else:
+        pool = db.ConnectionPool(db_path, size=readers + writers)
+        acquire = pool.acquire
+        write_once = pooled_write_once
+
+    with sqlite3.connect(db_path) as conn:
+        analysis_types = [row[0] for row in conn.execute('SELECT DISTINCT analysis_type FROM zip_cluster')]
+        organizations = [row[0] for row in conn.execute('SELECT organization FROM targets')]
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(kind):
+        done = errors = 0
+        while time.perf_counter() < deadline:
+            conn = acquire()
+            try:
+                if kind == 'reads':
+                    read_once(conn, random.choice(analysis_types))
+                else:
+                    write_once(conn, random.choice(organizations))
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+            finally:
+                conn.close()
+        with lock:
+            counts[kind] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=('reads',)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=('writes',)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"{mode:>6}: {counts['reads'] / seconds:8.0f} reads/s  "
+          f"{counts['writes'] / seconds:8.0f} writes/s  {counts['errors']:5d} lock errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('before', 'after'):
+            db_path = os.path.join(tmp, f'{mode}.db')
+            shutil.copy(args.db, db_path)
+            run(mode, db_path, args.readers, args.writers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Load time and memory per entry point: pd.read_csv as the scripts used to call it vs ingest.
+
+Run from the repository root:
+
+    python benchmarks/bench_ingest.py [--repeat 5]
+
+"csv" is the old call with default dtype inference. "typed" parses the CSV
+with the ingest schema and usecols, without the cache. "cached" reads the
+same columns from the Parquet cache, which is built once in a temporary
+directory first. Memory is the deep size of the returned frame.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+from create_cluster_map import ATHLETIC_CENTER_COLUMNS, zip_map_column  # noqa: E402
+from init_database import zip_source_column  # noqa: E402
+
+ENTRY_POINTS = [
+    # (label, legacy read, path, schema, default dtype, usecols)
+    ('create_cluster_map ZIPs', lambda: pd.read_csv(ingest.ZIPS_CSV),
+     ingest.ZIPS_CSV, ingest.ZIP_SCHEMA, ingest.ZIP_DEFAULT_DTYPE, zip_map_column),
+    ('create_cluster_map centers', lambda: pd.read_csv(ingest.TARGETS_CSV, encoding='latin1'),
+     ingest.TARGETS_CSV, ingest.TARGET_SCHEMA, ingest.TARGET_DEFAULT_DTYPE, ATHLETIC_CENTER_COLUMNS),
+    ('init_database ZIPs', lambda: pd.read_csv(ingest.ZIPS_CSV, encoding='latin1', usecols=zip_source_column),
+     ingest.ZIPS_CSV, ingest.ZIP_SCHEMA, ingest.ZIP_DEFAULT_DTYPE, zip_source_column),
+    ('init_database targets', lambda: pd.read_csv(ingest.TARGETS_CSV, encoding='latin1'),
+     ingest.TARGETS_CSV, ingest.TARGET_SCHEMA, ingest.TARGET_DEFAULT_DTYPE, None),
+    ('geocode_addresses ZIPs', lambda: pd.read_csv('data/A_5mi.csv', encoding='latin1'),
+     'data/A_5mi.csv', ingest.ZIP_SCHEMA, ingest.ZIP_DEFAULT_DTYPE, ['ZIP', 'latitude', 'longitude']),
+]
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'entry point':<28} {'mode':<7} {'ms':>8} {'MB':>7} {'columns':>8}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for label, legacy, path, schema, default_dtype, usecols in ENTRY_POINTS:
+            ingest.read_table(path, schema, default_dtype, cache_dir=cache_dir)
+            runs = [
+                ('csv', legacy),
+                ('typed', lambda: ingest.read_table(path, schema, default_dtype, usecols, cache=False)),
+                ('cached', lambda: ingest.read_table(path, schema, default_dtype, usecols, cache_dir=cache_dir)),
+            ]
+            for mode, fn in runs:
+                df, elapsed = timed(fn, args.repeat)
+                memory = df.memory_usage(deep=True).sum() / 1e6
+                print(f"{label:<28} {mode:<7} {elapsed * 1000:8.1f} {memory:7.2f} {len(df.columns):8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Time the bulk loader in init_database.py at 1x, 10x and 100x the ZIP data.
+
+Run from the repository root:
+
+    python benchmarks/bench_init_database.py [--scales 1 10 100] [--legacy-max-scale 10]
+
+The ZIP CSV is replicated with shifted ZIP codes to build the larger inputs.
+The old row-by-row loader is also timed, up to --legacy-max-scale.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import init_database  # noqa: E402
+
+ZIPS_CSV = 'data/high-priority-ZIPs-with-clusters.csv'
+TARGETS_CSV = 'data/athletic-center-targets-2024-01-02.csv'
+
+
+def legacy_load_zips(db_path, zips_csv):
+    """The per-row zip_data insert init_database used before the bulk loader"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE IF EXISTS zip_data')
+    init_database.create_schema(cursor)
+
+    zips_df = pd.read_csv(zips_csv, encoding='latin1')
+    zips_df['Number HH'] = zips_df['Number HH'].astype(int)
+    zips_df['ZCTA5'] = zips_df['ZIP'].astype(str).str.zfill(5)
+    median_income_col = [col for col in zips_df.columns if 'Median' in col][0]
+    zips_df[median_income_col] = zips_df[median_income_col].astype(float)
+
+    for _, row in zips_df.iterrows():
+        cluster_values = {}
+        for analysis_type in init_database.ANALYSIS_TYPES:
+            matching_cols = [col for col in zips_df.columns if analysis_type in col]
+            value = row[matching_cols[0]] if matching_cols else None
+            cluster_values[f'cluster_{analysis_type.lower()}'] = None if pd.isna(value) else value
+        cursor.execute('''
+        INSERT OR REPLACE INTO zip_data (
+            zip_code, geographic_area, households, total_pop, median_income,
+            latitude, longitude, grade,
+            cluster_a_5mi, cluster_a_10mi, cluster_ab_5mi, cluster_ab_10mi,
+            cluster_abc_5mi, cluster_abc_10mi, cluster_bc_5mi, cluster_bc_10mi
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            row['ZCTA5'], row['Geographic Area Name'], int(row['Number HH']), int(row['Total Pop']),
+            float(row[median_income_col]), float(row['latitude']), float(row['longitude']),
+            row.get('grade', 'Ungraded'), *cluster_values.values()
+        ))
+    conn.commit()
+    conn.close()
+    return len(zips_df)
+
+
+def scaled_zip_csv(scale, directory):
+    """Write the ZIP CSV replicated `scale` times with unique ZIP codes"""
+    df = pd.read_csv(ZIPS_CSV, encoding='latin1')
+    copies = []
+    for i in range(scale):
+        copy = df.copy()
+        copy['ZIP'] = copy['ZIP'] + i * 100000
+        copies.append(copy)
+    path = os.path.join(directory, f'zips_{scale}x.csv')
+    pd.concat(copies, ignore_index=True).to_csv(path, index=False, encoding='latin1')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--legacy-max-scale', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scales:
+            zips_csv = scaled_zip_csv(scale, tmp)
+            db_path = os.path.join(tmp, f'bench_{scale}x.db')
+
+            rows, elapsed = init_database.init_database(db_path, TARGETS_CSV, zips_csv)
+            print(f"{scale:>4}x bulk:   {rows:>8} rows in {elapsed:7.2f}s "
+                  f"({rows / elapsed:>10,.0f} rows/s)")
+
+            if scale <= args.legacy_max_scale:
+                start = time.perf_counter()
+                legacy_rows = legacy_load_zips(db_path, zips_csv)
+                legacy_elapsed = time.perf_counter() - start
+                print(f"{scale:>4}x legacy: {legacy_rows:>8} rows in {legacy_elapsed:7.2f}s "
+                      f"({legacy_rows / legacy_elapsed:>10,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the old iterrows nearest-ZIP loop with ZipSpatialIndex.
+
+Run from the repository root:
+
+    python benchmarks/bench_spatial_index.py [--lookups 10000] [--legacy-sample 200]
+
+The legacy loop is far too slow to run 10k times against the 5,994-row file,
+so it is timed on a sample and extrapolated to the full lookup count.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geocode_addresses import haversine_distance  # noqa: E402
+from spatial_index import ZipSpatialIndex  # noqa: E402
+
+
+def legacy_nearest(target_loc, zip_data, max_distance=10):
+    """The loop find_nearby_zip used before the spatial index"""
+    nearest_distance = float('inf')
+    nearest_coords = None
+    for idx, row in zip_data.iterrows():
+        if pd.isna(row['latitude']) or pd.isna(row['longitude']):
+            continue
+        distance = haversine_distance(target_loc[0], target_loc[1], row['latitude'], row['longitude'])
+        if distance < nearest_distance and distance <= max_distance:
+            nearest_distance = distance
+            nearest_coords = (row['latitude'], row['longitude'])
+    return nearest_coords
+
+
+def random_queries(zip_data, n, seed=0):
+    """Sample query points near real ZIP centroids (about +/- 10 km)"""
+    rng = np.random.default_rng(seed)
+    coords = zip_data[['latitude', 'longitude']].dropna().to_numpy()
+    picks = coords[rng.integers(0, len(coords), n)]
+    return picks + rng.normal(scale=0.08, size=picks.shape)
+
+
+def bench_file(path, lookups, legacy_sample):
+    zip_data = pd.read_csv(path, encoding='latin1').set_index('ZIP')
+    queries = random_queries(zip_data, lookups)
+
+    start = time.perf_counter()
+    index = ZipSpatialIndex.from_frame(zip_data)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    distances, positions = index.query_nearest(queries[:, 0], queries[:, 1], max_distance_km=10)
+    index_time = time.perf_counter() - start
+
+    sample = min(legacy_sample, lookups)
+    start = time.perf_counter()
+    legacy_results = [legacy_nearest(q, zip_data) for q in queries[:sample]]
+    legacy_time = (time.perf_counter() - start) * lookups / sample
+
+    # Both approaches must agree on the sampled lookups
+    mismatches = 0
+    for legacy, pos in zip(legacy_results, positions[:sample, 0]):
+        indexed = None if pos < 0 else (index.latitudes[pos], index.longitudes[pos])
+        if legacy != indexed:
+            mismatches += 1
+
+    print(f"{os.path.basename(path)} ({len(index)} ZIPs, {lookups} lookups)")
+    print(f"  index build:      {build_time * 1000:9.1f} ms")
+    print(f"  indexed lookups:  {index_time * 1000:9.1f} ms")
+    print(f"  legacy lookups:   {legacy_time * 1000:9.1f} ms (extrapolated from {sample})")
+    print(f"  speedup:          {legacy_time / index_time:9.0f}x")
+    print(f"  hits within 10km: {np.count_nonzero(positions[:, 0] >= 0)}")
+    print(f"  sample mismatches: {mismatches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--legacy-sample', type=int, default=200)
+    args = parser.parse_args()
+
+    for path in ['data/A_5mi.csv', 'data/high-priority-ZIPs-with-clusters.csv']:
+        bench_file(path, args.lookups, args.legacy_sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Payload size and encode time: jsonify of row dicts vs the columnar wire formats.
+
+Run from the repository root (after python init_database.py):
+
+    python benchmarks/bench_wire_formats.py [--repeat 5]
+
+The baseline is the original /api/zips handler, jsonify([dict(row) for row in zips]).
+Each columnar format is built straight from the cursor tuples, as the server
+does for ?format=columns|msgpack|arrow. msgpack and arrow are skipped when
+the package is not installed. Parse time is Python-side only, as a proxy for
+the browser's cost.
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify  # noqa: E402
+
+import db  # noqa: E402
+import serve_map_data as server  # noqa: E402
+from wire_formats import available_formats, encode_columns, fetch_columns, msgpack, pa  # noqa: E402
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def parse(fmt, body):
+    if fmt in ('json', 'columns'):
+        return json.loads(body)
+    if fmt == 'msgpack':
+        return msgpack.unpackb(body)
+    return pa.ipc.open_stream(body).read_all()
+
+
+def report(label, sql, params, conn, repeat):
+    print(f"\n{label}")
+    print(f"{'format':<10} {'encode ms':>10} {'bytes':>11} {'gzip bytes':>11} {'parse ms':>9}")
+
+    def baseline():
+        with server.app.app_context():
+            return jsonify([dict(row) for row in conn.execute(sql, params)]).get_data()
+
+    runs = [('json', baseline)]
+    for fmt in available_formats():
+        runs.append((fmt, lambda fmt=fmt: encode_columns(*fetch_columns(conn, sql, params), fmt)[0]))
+
+    baseline_size = None
+    for fmt, fn in runs:
+        body, encode_time = timed(fn, repeat)
+        _, parse_time = timed(lambda: parse(fmt, body), repeat)
+        baseline_size = baseline_size or len(body)
+        print(f"{fmt:<10} {encode_time * 1000:10.1f} {len(body):11,} {len(gzip.compress(body)):11,} "
+              f"{parse_time * 1000:9.1f}   {len(body) / baseline_size:.0%} of json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    zips_sql, zips_params = server.zips_query(server.parse_viewport_args({}, server.ZIP_FIELDS))
+    report('/api/zips (all ZIPs, all fields)', zips_sql, zips_params, conn, args.repeat)
+
+    analysis_type, = conn.execute(
+        'SELECT analysis_type FROM zip_cluster GROUP BY analysis_type ORDER BY COUNT(*) DESC LIMIT 1'
+    ).fetchone()
+    report(f'/api/clusters/{analysis_type} (member rows)', server.CLUSTERS_QUERY, (analysis_type,), conn, args.repeat)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
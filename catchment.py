@@ -0,0 +1,260 @@
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+import db
+from routing import IsochroneCache, RoadGraph, target_isochrones
+from scoring import GRADES
+from spatial_index import KM_PER_MILE, ZipSpatialIndex
+
+TARGETS_QUERY = '''
+    SELECT organization, drive_radius, latitude, longitude
+    FROM targets
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+ZIPS_QUERY = '''
+    SELECT zip_code, latitude, longitude, total_pop, households, families_with_children,
+           median_income, composite_score, grade
+    FROM zip_data
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+# Drive-time catchments already stored, with their ZIPs; zip_code is NULL for
+# an empty catchment or one written before target_catchment_zip existed
+STORED_ISOCHRONES_QUERY = '''
+    SELECT c.organization, c.drive_minutes, c.zip_count, m.zip_code
+    FROM target_catchment c
+    LEFT JOIN target_catchment_zip m ON m.organization = c.organization
+    WHERE c.drive_minutes IS NOT NULL
+'''
+
+CATCHMENT_COLUMNS = [
+    'organization', 'radius_miles', 'drive_minutes', 'home_zip', 'zip_count', 'total_pop', 'households',
+    'families_with_children', 'median_income', 'composite_score', 'best_grade', 'mean_grade',
+]
+
+
+def target_radius(drive_radius):
+    """'7 mi' -> 7.0; anything else (e.g. 'ZIP') -> None, a center serving only its own ZIP"""
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*mi', str(drive_radius or ''))
+    return float(match.group(1)) if match else None
+
+
+def catchment_matrix(latitudes, longitudes, radii_miles, index, home_positions):
+    """Sparse (targets, indexed ZIPs) 0/1 matrix of each target's catchment:
+    the ZIPs within its radius, or only its home ZIP (a position in index,
+    -1 for none) where the radius is NaN"""
+    radii = np.asarray(radii_miles, dtype=float)
+    by_radius = ~np.isnan(radii)
+    hits = index.query_radius(latitudes, longitudes, np.where(by_radius, radii, 0) * KM_PER_MILE)
+    empty = np.empty(0, dtype=np.int64)
+    hits = [h if r else (np.array([home]) if home >= 0 else empty)
+            for h, r, home in zip(hits, by_radius, home_positions)]
+    return hits_matrix(hits, len(index))
+
+
+def hits_matrix(hits, n_zips):
+    """Sparse 0/1 matrix with one row per array of ZIP positions"""
+    rows = np.repeat(np.arange(len(hits)), [len(h) for h in hits])
+    cols = np.concatenate(hits) if hits else np.empty(0, dtype=np.int64)
+    return csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(hits), n_zips))
+
+
+def target_matrix(targets, index):
+    """(catchment matrix, radii in miles, home ZIP positions) for a targets
+    frame with drive_radius, latitude and longitude"""
+    _, home = index.query_nearest(targets['latitude'], targets['longitude'])
+    home = home[:, 0]
+    radii = targets['drive_radius'].map(target_radius).astype(float).to_numpy()
+    return catchment_matrix(targets['latitude'], targets['longitude'], radii, index, home), radii, home
+
+
+def weighted_mean(cover, values, weights):
+    """Per-row mean of values over each row's ZIPs, weighted by weights; NaN
+    values are left out and rows without any weight are NaN"""
+    known = ~np.isnan(values)
+    weight = np.where(known, weights, 0)
+    total = cover @ weight
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, (cover @ np.where(known, values * weight, 0)) / total, np.nan)
+
+
+def compute_catchments(targets, zips, zip_sets=None, minutes=None):
+    """One row of catchment aggregates per target, from a single sparse
+    target x ZIP matrix: every sum is one matrix-vector product.
+
+    Catchments are the ZIPs within each drive radius, except for the
+    organizations in zip_sets, which maps them to their ZIP codes, such as
+    routing.py's drive-time isochrones. minutes is their drive time, one
+    number or a dict by organization. zip_codes lists each catchment's ZIPs.
+
+    median_income and composite_score are population-weighted means over
+    the catchment's ZIPs. best_grade is the best grade in the catchment and
+    mean_grade the population-weighted mean grade, rounded.
+    """
+    targets = targets.reset_index(drop=True)
+    zips = zips.reset_index(drop=True)
+    index = ZipSpatialIndex.from_frame(zips, 'zip_code')
+    cover, radii, home = target_matrix(targets, index)
+    drive_minutes = np.full(len(targets), np.nan)
+    timed = targets['organization'].isin(list(zip_sets or {})).to_numpy()
+    if timed.any():
+        hits = [cover.indices[cover.indptr[i]:cover.indptr[i + 1]] for i in range(len(targets))]
+        for i in np.flatnonzero(timed):
+            positions = (index.position(z) for z in zip_sets[targets.at[i, 'organization']])
+            hits[i] = np.array([p for p in positions if p is not None], dtype=np.int64)
+        cover = hits_matrix(hits, len(index))
+        radii = np.where(timed, np.nan, radii)
+        by_target = minutes if isinstance(minutes, dict) else {}
+        drive_minutes[timed] = targets['organization'][timed].map(
+            lambda org: by_target.get(org, minutes)).to_numpy(dtype=float)
+
+    def column(name):
+        return zips[name].astype(float).to_numpy()
+
+    population = np.nan_to_num(column('total_pop'))
+    codes = zips['grade'].map({grade: code for code, grade in enumerate(GRADES)}).astype(float).to_numpy()
+
+    # Best grade: the largest code among each row's ZIPs (reduceat needs non-empty rows)
+    row_codes = np.nan_to_num(codes, nan=-1)[cover.indices]
+    sizes = np.diff(cover.indptr)
+    best = np.full(len(targets), -1.0)
+    filled = sizes > 0
+    if len(row_codes):
+        best[filled] = np.maximum.reduceat(row_codes, cover.indptr[:-1][filled])
+    mean = weighted_mean(cover, codes, population)
+
+    letters = np.array(GRADES + [None], dtype=object)
+    return pd.DataFrame({
+        'organization': targets['organization'],
+        'radius_miles': radii,
+        'drive_minutes': drive_minutes,
+        'home_zip': np.where(home >= 0, index.zip_codes[np.maximum(home, 0)], None),
+        'zip_count': sizes,
+        'total_pop': cover @ population,
+        'households': cover @ np.nan_to_num(column('households')),
+        'families_with_children': cover @ np.nan_to_num(column('families_with_children')),
+        'median_income': weighted_mean(cover, column('median_income'), population),
+        'composite_score': weighted_mean(cover, column('composite_score'), population),
+        'best_grade': letters[best.astype(int)],
+        'mean_grade': letters[np.where(np.isnan(mean), -1, np.round(np.nan_to_num(mean))).astype(int)],
+        'zip_codes': [list(index.zip_codes[cover.indices[cover.indptr[i]:cover.indptr[i + 1]]])
+                      for i in range(len(targets))],
+    })
+
+
+def catchment_rows(catchments):
+    """Plain Python tuples for sqlite3, integers for the counts"""
+    out = catchments[CATCHMENT_COLUMNS].astype(object)
+    for col in ['zip_count', 'total_pop', 'households', 'families_with_children']:
+        out[col] = catchments[col].round().astype(int)
+    out = out.where(catchments[CATCHMENT_COLUMNS].notna(), None)
+    return list(out.itertuples(index=False, name=None))
+
+
+def stored_isochrones(conn):
+    """({organization: [ZIP codes]}, {organization: minutes}) of the drive-time
+    catchments in target_catchment. Rows whose ZIPs were never stored are
+    left out."""
+    zip_sets, minutes = {}, {}
+    for organization, drive_minutes, zip_count, zip_code in conn.execute(STORED_ISOCHRONES_QUERY):
+        if zip_code is None and zip_count:
+            continue
+        minutes[organization] = drive_minutes
+        zip_codes = zip_sets.setdefault(organization, [])
+        if zip_code is not None:
+            zip_codes.append(zip_code)
+    return zip_sets, minutes
+
+
+def rebuild_catchments(conn, road_graph=None, minutes=None, cache=None, keep_drive_time=True):
+    """Recompute target_catchment and target_catchment_zip for every target;
+    returns (written, deleted).
+
+    The whole table is recomputed in one pass, and only rows that changed
+    are written, so the caller can skip the generation bump when nothing did.
+    With a routing.RoadGraph, catchments are drive-time isochrones of the
+    given minutes instead of drive radii, except for targets with no road node
+    in reach, which keep their drive radius. Without one, drive-time catchments
+    already stored keep their ZIPs and only their aggregates are refreshed,
+    unless keep_drive_time is off; targets without one use their drive radius.
+    Both tables are written in one transaction, so conn must not have one
+    open.
+    """
+    start = time.perf_counter()
+    targets = pd.read_sql_query(TARGETS_QUERY, conn)
+    zips = pd.read_sql_query(ZIPS_QUERY, conn)
+    zip_sets = None
+    if road_graph is not None:
+        zip_index = ZipSpatialIndex.from_frame(zips, 'zip_code')
+        zip_sets = target_isochrones(targets, road_graph, zip_index, minutes, cache)
+        off_graph = len(targets) - len(zip_sets)
+        if off_graph:
+            print(f"target_catchment: {off_graph} targets have no road node within {minutes:g} minutes "
+                  f"and use their drive radius")
+    elif keep_drive_time:
+        drive_time = conn.execute('SELECT COUNT(*) FROM target_catchment WHERE drive_minutes IS NOT NULL').fetchone()[0]
+        zip_sets, minutes = stored_isochrones(conn)
+        radius_only = (~targets['organization'].isin(list(zip_sets))).sum()
+        if drive_time and radius_only:
+            print(f"target_catchment: {radius_only} targets have no stored drive-time catchment and use "
+                  f"their drive radius: off the last catchment.py --osm extract, or added since")
+    catchments = compute_catchments(targets, zips, zip_sets, minutes)
+    rows = catchment_rows(catchments)
+    members = {(organization, zip_code) for organization, zip_codes in
+               zip(catchments['organization'], catchments['zip_codes']) for zip_code in zip_codes}
+
+    existing = {tuple(row) for row in conn.execute(f'SELECT {", ".join(CATCHMENT_COLUMNS)} FROM target_catchment')}
+    changed = [row for row in rows if row not in existing]
+    removed = sorted({row[0] for row in existing} - {row[0] for row in rows})
+    existing_members = {tuple(row) for row in conn.execute('SELECT organization, zip_code FROM target_catchment_zip')}
+    added_members = sorted(members - existing_members)
+    removed_members = sorted(existing_members - members)
+    # A ZIP swapped for another can leave every aggregate unchanged
+    moved = {organization for organization, _ in added_members + removed_members} - set(removed)
+    written = len({row[0] for row in changed} | moved)
+    with db.write_transaction(conn):
+        conn.executemany(
+            f'INSERT OR REPLACE INTO target_catchment ({", ".join(CATCHMENT_COLUMNS)}) '
+            f'VALUES ({", ".join("?" for _ in CATCHMENT_COLUMNS)})',
+            changed
+        )
+        conn.executemany('DELETE FROM target_catchment WHERE organization = ?', [(org,) for org in removed])
+        conn.executemany('DELETE FROM target_catchment_zip WHERE organization = ? AND zip_code = ?', removed_members)
+        conn.executemany('INSERT INTO target_catchment_zip (organization, zip_code) VALUES (?, ?)', added_members)
+
+    elapsed = time.perf_counter() - start
+    print(f"target_catchment: {written} targets updated, {len(removed)} removed in {elapsed:.2f}s")
+    return written, len(removed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute each target's catchment in target_catchment")
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('--osm', help="use drive-time isochrones over this OSM extract instead of drive radii")
+    parser.add_argument('--minutes', type=float, default=15, help="drive-time budget with --osm")
+    parser.add_argument('--radius-only', action='store_true',
+                        help="replace stored drive-time catchments with drive-radius ones")
+    args = parser.parse_args()
+
+    road_graph = cache = None
+    if args.osm:
+        road_graph, cache = RoadGraph.from_osm(args.osm), IsochroneCache()
+    conn = db.connect(args.db)
+    try:
+        if any(rebuild_catchments(conn, road_graph, args.minutes, cache, keep_drive_time=not args.radius_only)):
+            with db.write_transaction(conn):
+                db.bump_generation(conn, 'targets')
+    finally:
+        conn.close()
+        if cache:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
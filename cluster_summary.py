@@ -0,0 +1,172 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import ConvexHull, QhullError
+
+SUMMARY_COLUMNS = [
+    'analysis_type', 'cluster_id', 'zip_count', 'total_pop', 'mean_income',
+    'centroid_lat', 'centroid_lon', 'hull', 'source_hash'
+]
+
+MEMBERS_QUERY = '''
+    SELECT c.analysis_type, c.cluster_id, z.zip_code, z.latitude, z.longitude,
+           z.total_pop, z.median_income
+    FROM zip_cluster c
+    JOIN zip_data z ON z.zip_code = c.zip_code
+    WHERE z.latitude IS NOT NULL AND z.longitude IS NOT NULL
+'''
+
+
+def encode_polyline(coords, precision=5):
+    """Encode [(lat, lon), ...] with the Google polyline algorithm"""
+    factor = 10 ** precision
+    encoded = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        lat_i, lon_i = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat_i - prev_lat, lon_i - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            encoded.append(chr(value + 63))
+        prev_lat, prev_lon = lat_i, lon_i
+    return ''.join(encoded)
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a Google polyline string back to [(lat, lon), ...]"""
+    factor = 10 ** precision
+    coords = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append((lat / factor, lon / factor))
+    return coords
+
+
+def hull_features(rows, min_zips=3):
+    """GeoJSON Polygon features for cluster_summary rows with at least min_zips members"""
+    features = []
+    for row in rows:
+        if row['zip_count'] < min_zips:
+            continue
+        ring = [[lon, lat] for lat, lon in decode_polyline(row['hull'])]
+        ring.append(ring[0])
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'properties': {
+                'cluster_id': row['cluster_id'],
+                'zip_count': row['zip_count'],
+                'total_pop': row['total_pop'],
+                'mean_income': row['mean_income'],
+            },
+        })
+    return features
+
+
+def hull_points(coords):
+    """Convex hull vertices of an (n, 2) array; small or degenerate sets are returned as-is"""
+    if len(coords) < 3:
+        return coords
+    try:
+        return coords[ConvexHull(coords).vertices]
+    except QhullError:
+        # All points collinear or coincident
+        return coords
+
+
+def member_hashes(members):
+    """Content hash per (analysis_type, cluster_id) over its member rows"""
+    row_hashes = pd.util.hash_pandas_object(
+        members[['zip_code', 'latitude', 'longitude', 'total_pop', 'median_income']], index=False
+    )
+    # Order-independent combination; uint64 addition wraps around
+    keys = [members['analysis_type'], members['cluster_id']]
+    combined = row_hashes.groupby(keys).agg(lambda h: np.add.reduce(h.to_numpy(), dtype=np.uint64))
+    return combined.map('{:016x}'.format)
+
+
+def summarize_members(members):
+    """One summary row per cluster: counts, sums, means, centroid and encoded hull"""
+    keys = ['analysis_type', 'cluster_id']
+    stats = members.groupby(keys).agg(
+        zip_count=('zip_code', 'size'),
+        total_pop=('total_pop', 'sum'),
+        mean_income=('median_income', 'mean'),
+        centroid_lat=('latitude', 'mean'),
+        centroid_lon=('longitude', 'mean'),
+    )
+    hulls = {
+        key: encode_polyline(hull_points(group[['latitude', 'longitude']].to_numpy()))
+        for key, group in members.groupby(keys)
+    }
+    stats['hull'] = pd.Series(hulls)
+    return stats
+
+
+def rebuild_cluster_summary(conn, full=False):
+    """Refresh cluster_summary from zip_cluster and zip_data.
+
+    Only clusters whose member rows changed since the last build are
+    recomputed, and clusters that no longer exist are removed. Pass
+    full=True to recompute everything. Returns (updated, deleted).
+    """
+    start = time.perf_counter()
+    members = pd.read_sql_query(MEMBERS_QUERY, conn)
+    members['total_pop'] = members['total_pop'].fillna(0)
+
+    hashes = member_hashes(members) if len(members) else pd.Series(dtype=str)
+    existing = {} if full else {
+        (analysis_type, cluster_id): source_hash
+        for analysis_type, cluster_id, source_hash in conn.execute(
+            'SELECT analysis_type, cluster_id, source_hash FROM cluster_summary'
+        )
+    }
+
+    changed = [key for key, source_hash in hashes.items() if existing.get(key) != source_hash]
+    removed = sorted(set(existing) - set(hashes.index)) if not full else []
+
+    if changed:
+        changed_index = pd.MultiIndex.from_tuples(changed, names=['analysis_type', 'cluster_id'])
+        keyed = members.set_index(['analysis_type', 'cluster_id'])
+        subset = keyed[keyed.index.isin(changed_index)].reset_index()
+        summary = summarize_members(subset)
+        summary['source_hash'] = hashes.reindex(summary.index)
+        rows = [
+            (analysis_type, cluster_id, int(r.zip_count), int(r.total_pop), float(r.mean_income),
+             float(r.centroid_lat), float(r.centroid_lon), r.hull, r.source_hash)
+            for (analysis_type, cluster_id), r in summary.iterrows()
+        ]
+    else:
+        rows = []
+
+    with conn:
+        if full:
+            conn.execute('DELETE FROM cluster_summary')
+        conn.executemany(
+            f'INSERT OR REPLACE INTO cluster_summary ({", ".join(SUMMARY_COLUMNS)}) '
+            f'VALUES ({", ".join("?" for _ in SUMMARY_COLUMNS)})',
+            rows
+        )
+        conn.executemany(
+            'DELETE FROM cluster_summary WHERE analysis_type = ? AND cluster_id = ?', removed
+        )
+
+    elapsed = time.perf_counter() - start
+    print(f"cluster_summary: {len(rows)} clusters rebuilt, {len(removed)} removed in {elapsed:.2f}s")
+    return len(rows), len(removed)
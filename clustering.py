@@ -0,0 +1,207 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import db
+from cluster_summary import rebuild_cluster_summary
+from ingest import ANALYSIS_TYPES
+from spatial_index import KM_PER_MILE, ZipSpatialIndex
+
+# A ZIP with at least MIN_SAMPLES ZIPs (itself included) within the radius
+# is a core ZIP. Clusters are the connected groups of core ZIPs plus the
+# non-core ZIPs in reach of one; ZIPs in reach of none are left unclustered.
+MIN_SAMPLES = 3
+# Clusters smaller than this are dropped, as in the delivered CSVs
+MIN_CLUSTER_SIZE = 3
+
+ZIPS_QUERY = '''
+    SELECT zip_code, latitude, longitude, grade
+    FROM zip_data
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+
+def parse_analysis(analysis_type):
+    """'ABC_10mi' -> ('ABC', 10.0)"""
+    match = re.fullmatch(r'([A-Za-z]+)_(\d+(?:\.\d+)?)mi', analysis_type)
+    if not match:
+        raise ValueError(f"Analysis types look like ABC_10mi, not {analysis_type!r}")
+    return match.group(1).upper(), float(match.group(2))
+
+
+def analysis_name(grades, radius_miles):
+    """('ABC', 10.0) -> 'ABC_10mi'"""
+    return f'{grades}_{radius_miles:g}mi'
+
+
+def cluster_label(grades, radius_miles, number):
+    """Cluster ids as in the CSVs: ('ABC', 10.0, 3) -> 'A,B,C_10mi_C3'"""
+    return f'{",".join(grades)}_{radius_miles:g}mi_C{number}'
+
+
+def dbscan(index, radius_km, min_samples=MIN_SAMPLES, min_cluster_size=MIN_CLUSTER_SIZE):
+    """Cluster number (1 = largest) for each indexed point, 0 where unclustered.
+
+    One query_pairs call finds every neighbour pair; core points are joined
+    by connected components and each border point goes to its nearest core
+    neighbour, so the result does not depend on the point order.
+    """
+    n = len(index)
+    labels = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return labels
+    pairs = index.query_pairs(radius_km)
+    core = np.bincount(pairs.ravel(), minlength=n) + 1 >= min_samples
+
+    core_pairs = pairs[core[pairs[:, 0]] & core[pairs[:, 1]]]
+    graph = coo_matrix((np.ones(len(core_pairs)), (core_pairs[:, 0], core_pairs[:, 1])), shape=(n, n))
+    _, components = connected_components(graph, directed=False)
+    component = np.where(core, components, -1)
+
+    # (border, core) pairs, nearest core neighbour first
+    mixed = pairs[core[pairs[:, 0]] != core[pairs[:, 1]]]
+    mixed = np.where(core[mixed[:, :1]], mixed[:, ::-1], mixed)
+    if len(mixed):
+        vectors = index.tree.data
+        similarity = np.einsum('ij,ij->i', vectors[mixed[:, 0]], vectors[mixed[:, 1]])
+        mixed = mixed[np.lexsort((-similarity, mixed[:, 0]))]
+        border, first = np.unique(mixed[:, 0], return_index=True)
+        component[border] = component[mixed[first, 1]]
+
+    clustered = component >= 0
+    ids, first_member, sizes = np.unique(component[clustered], return_index=True, return_counts=True)
+    # Number by size, largest first; ties by the first member's position
+    order = np.lexsort((first_member, -sizes))
+    kept = order[sizes[order] >= min_cluster_size]
+    numbers = np.zeros(len(ids), dtype=np.int64)
+    numbers[kept] = np.arange(1, len(kept) + 1)
+    labels[clustered] = numbers[np.searchsorted(ids, component[clustered])]
+    return labels
+
+
+def cluster_analysis(zips, analysis_type, min_samples=MIN_SAMPLES):
+    """(zip_code, analysis_type, cluster_id) rows for one grade set and radius"""
+    grades, radius_miles = parse_analysis(analysis_type)
+    members = zips[zips['grade'].isin(list(grades))]
+    index = ZipSpatialIndex.from_frame(members, 'zip_code')
+    labels = dbscan(index, radius_miles * KM_PER_MILE, min_samples)
+
+    clustered = labels > 0
+    return pd.DataFrame({
+        'zip_code': np.asarray(index.zip_codes)[clustered],
+        'analysis_type': analysis_name(grades, radius_miles).lower(),
+        'cluster_id': [cluster_label(grades, radius_miles, n) for n in labels[clustered]],
+    })
+
+
+def _cluster_analysis(args):
+    return cluster_analysis(*args)
+
+
+def cluster_all(zips, analysis_types=ANALYSIS_TYPES, min_samples=MIN_SAMPLES, workers=None):
+    """Run every analysis, one per worker process; returns the concatenated rows"""
+    zips = zips[['zip_code', 'latitude', 'longitude', 'grade']]
+    jobs = [(zips, analysis_type, min_samples) for analysis_type in analysis_types]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_cluster_analysis, jobs))
+    else:
+        results = [_cluster_analysis(job) for job in jobs]
+    return pd.concat(results, ignore_index=True)
+
+
+def write_clusters(conn, clusters, analysis_types):
+    """Replace the memberships of analysis_types in zip_cluster (and the matching
+    cluster_<type> columns of zip_data) with clusters; returns (inserted, deleted).
+
+    Only the difference is written, so an unchanged analysis leaves the
+    cluster summaries alone. The caller bumps the 'zips' generation once
+    everything derived from the clusters is rebuilt. conn must be in
+    autocommit mode, as from db.connect().
+    """
+    keys = [analysis_type.lower() for analysis_type in analysis_types]
+    placeholders = ', '.join('?' for _ in keys)
+    existing = {tuple(row) for row in conn.execute(
+        f'SELECT zip_code, analysis_type, cluster_id FROM zip_cluster WHERE analysis_type IN ({placeholders})', keys
+    )}
+    incoming = set(clusters[['zip_code', 'analysis_type', 'cluster_id']].itertuples(index=False, name=None))
+    added = sorted(incoming - existing)
+    removed = sorted(existing - incoming)
+    if not added and not removed:
+        return 0, 0
+
+    wide_columns = {row['name'] for row in conn.execute('PRAGMA table_info(zip_data)')}
+    with db.write_transaction(conn):
+        conn.executemany(
+            'DELETE FROM zip_cluster WHERE zip_code = ? AND analysis_type = ? AND cluster_id = ?', removed
+        )
+        conn.executemany('INSERT INTO zip_cluster (zip_code, analysis_type, cluster_id) VALUES (?, ?, ?)', added)
+        # The wide columns hold one cluster per ZIP and exist only for the delivered analyses
+        for key in sorted({analysis_type for _, analysis_type, _ in added + removed}):
+            col = f'cluster_{key}'
+            if col not in wide_columns:
+                continue
+            conn.execute(f'UPDATE zip_data SET {col} = NULL WHERE {col} IS NOT NULL')
+            conn.execute(f'''
+                UPDATE zip_data SET {col} = (
+                    SELECT cluster_id FROM zip_cluster
+                    WHERE zip_cluster.zip_code = zip_data.zip_code AND analysis_type = ?
+                )
+                WHERE zip_code IN (SELECT zip_code FROM zip_cluster WHERE analysis_type = ?)
+            ''', (key, key))
+    return len(added), len(removed)
+
+
+def recluster_database(conn, analysis_types=ANALYSIS_TYPES, min_samples=MIN_SAMPLES, workers=None):
+    """Cluster the graded ZIPs in zip_data for each analysis and store the result"""
+    start = time.perf_counter()
+    zips = pd.read_sql_query(ZIPS_QUERY, conn)
+    clusters = cluster_all(zips, analysis_types, min_samples, workers)
+    elapsed = time.perf_counter() - start
+
+    counts = clusters.groupby('analysis_type', sort=False)['cluster_id'].agg(['nunique', 'size'])
+    print(f"Clustered {len(zips)} ZIPs for {len(analysis_types)} analyses in {elapsed:.2f}s")
+    for analysis_type in analysis_types:
+        key = analysis_type.lower()
+        n_clusters, n_zips = counts.loc[key] if key in counts.index else (0, 0)
+        print(f"  {analysis_type}: {n_clusters} clusters, {n_zips} ZIPs")
+
+    added, removed = write_clusters(conn, clusters, analysis_types)
+    print(f"zip_cluster: {added} memberships added, {removed} removed")
+    if added or removed:
+        rebuild_cluster_summary(conn)
+        # Bump only now, so no request caches the old summaries under the new generation
+        with db.write_transaction(conn):
+            db.bump_generation(conn, 'zips')
+    return added, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster the graded ZIPs in zip_data")
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('analysis_types', nargs='*', default=ANALYSIS_TYPES, metavar='ANALYSIS',
+                        help="grade set and radius, e.g. AB_5mi or ABC_7.5mi (default: the eight delivered analyses)")
+    parser.add_argument('--min-samples', type=int, default=MIN_SAMPLES,
+                        help="ZIPs within the radius, itself included, that make a ZIP a core ZIP")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    for analysis_type in args.analysis_types:
+        parse_analysis(analysis_type)
+    conn = db.connect(args.db)
+    try:
+        recluster_database(conn, args.analysis_types, args.min_samples, args.workers)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
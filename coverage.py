@@ -0,0 +1,188 @@
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+from clustering import parse_analysis
+from ingest import ANALYSIS_TYPES
+from spatial_index import KM_PER_MILE, ZipSpatialIndex, chord_to_km
+
+# Each ZIP is treated as the center of a service circle of this radius, the
+# athletic centers' 7 mile drive radius. With these defaults
+# data/A_5mi_optimized.csv is reproduced exactly, and so are the rows, their
+# order and can_skip of data/A_5mi_coverage_analysis.csv. Its overlaps came
+# from slightly different centroids: about 1 in 7 is 0.1 off, which moves 26
+# coverage_pct values, and one pair right at 10% is listed here but not there.
+COVERAGE_RADIUS_MILES = 7
+# Neighbours overlapping less than this are not listed
+MIN_OVERLAP_PCT = 10
+# A ZIP whose circle a single neighbour covers this much needs no search of its own
+SKIP_COVERAGE_PCT = 90
+# The delivered per-analysis CSVs (<type>.csv) that the optimized CSVs extend
+SOURCE_DIR = 'data'
+
+MEMBERS_QUERY = '''
+    SELECT c.zip_code, c.cluster_id, z.latitude, z.longitude
+    FROM zip_cluster c
+    JOIN zip_data z ON z.zip_code = c.zip_code
+    WHERE c.analysis_type = ? AND z.latitude IS NOT NULL AND z.longitude IS NOT NULL
+    ORDER BY z.rowid
+'''
+
+COVERAGE_COLUMNS = ['analysis_type', 'zip_code', 'neighbor', 'overlap_pct']
+
+
+def overlap_pct(distance, radius):
+    """Percent of a circle covered by an equal circle whose center is distance away"""
+    x = np.clip(np.asarray(distance, dtype=float) / (2 * radius), 0, 1)
+    return 200 / np.pi * (np.arccos(x) - x * np.sqrt(1 - x * x))
+
+
+def cluster_order(members):
+    """Members sorted by cluster number ('..._C2' before '..._C10'), keeping
+    their order within a cluster: zip_data's row order, that of the CSVs"""
+    number = members['cluster_id'].str.extract(r'_C(\d+)$', expand=False).astype(float)
+    return (members.assign(_number=number).sort_values(['_number', 'cluster_id'], kind='stable')
+            .drop(columns='_number'))
+
+
+def coverage_pairs(members, radius_miles=COVERAGE_RADIUS_MILES, min_overlap=MIN_OVERLAP_PCT):
+    """(zip_code, neighbor, overlap_pct) for every ordered pair of ZIPs in the same
+    cluster whose service circles overlap by at least min_overlap percent.
+
+    Circles only overlap within two radii, so the candidate pairs come from
+    one query_pairs call on the spatial index rather than all N^2 pairs.
+    Rows follow the order of members, then of the neighbours within it.
+    """
+    members = members.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    index = ZipSpatialIndex.from_frame(members, 'zip_code')
+    pairs = index.query_pairs(2 * radius_miles * KM_PER_MILE)
+
+    clusters = members['cluster_id'].to_numpy()
+    pairs = pairs[clusters[pairs[:, 0]] == clusters[pairs[:, 1]]]
+    vectors = index.tree.data
+    chord = np.linalg.norm(vectors[pairs[:, 0]] - vectors[pairs[:, 1]], axis=1)
+    pct = overlap_pct(chord_to_km(chord) / KM_PER_MILE, radius_miles)
+    keep = pct >= min_overlap
+    pairs, pct = pairs[keep], pct[keep]
+
+    both = np.concatenate([pairs, pairs[:, ::-1]])
+    pct = np.concatenate([pct, pct])
+    order = np.lexsort((both[:, 1], both[:, 0]))
+    both, pct = both[order], pct[order]
+    return pd.DataFrame({
+        'zip_code': index.zip_codes[both[:, 0]],
+        'neighbor': index.zip_codes[both[:, 1]],
+        'overlap_pct': pct,
+    })
+
+
+def coverage_summary(members, pairs, skip_pct=SKIP_COVERAGE_PCT):
+    """The per-ZIP coverage table of the CSV: ZIP, cluster_id, coverage_pct
+    (the largest overlap), can_skip and covered_by"""
+    rounded = pairs.assign(overlap_pct=pairs['overlap_pct'].round(1))
+    if rounded.empty:
+        # No overlaps at all: every ZIP gets the fill values below
+        covered_by = pd.Series(dtype=object)
+    else:
+        items = "('" + rounded['neighbor'] + "', " + rounded['overlap_pct'].astype(str) + ')'
+        covered_by = '[' + items.groupby(rounded['zip_code'], sort=False).agg(', '.join) + ']'
+    coverage = rounded.groupby('zip_code')['overlap_pct'].max()
+
+    summary = members[['zip_code', 'cluster_id']].rename(columns={'zip_code': 'ZIP'})
+    summary['coverage_pct'] = summary['ZIP'].map(coverage).fillna(0.0)
+    summary['can_skip'] = summary['coverage_pct'] >= skip_pct
+    summary['covered_by'] = summary['ZIP'].map(covered_by).fillna('[]')
+    return summary
+
+
+def write_coverage(conn, analysis_type, pairs):
+    """Replace analysis_type's rows in zip_coverage. conn must be in autocommit
+    mode, as from db.connect()."""
+    rows = list(zip(itertools.repeat(analysis_type), pairs['zip_code'].tolist(),
+                    pairs['neighbor'].tolist(), pairs['overlap_pct'].tolist()))
+    with db.write_transaction(conn):
+        conn.execute('DELETE FROM zip_coverage WHERE analysis_type = ?', (analysis_type,))
+        conn.executemany(
+            f'INSERT INTO zip_coverage ({", ".join(COVERAGE_COLUMNS)}) '
+            f'VALUES ({", ".join("?" for _ in COVERAGE_COLUMNS)})',
+            rows
+        )
+
+
+def write_flagged_csv(analysis_type, flags, column, suffix, output_dir='data'):
+    """Write <output_dir>/<type>_<suffix>.csv: data/<type>.csv plus column, from
+    flags, a boolean Series indexed by ZIP (False where missing). Skipped when
+    there is no data/<type>.csv."""
+    source = os.path.join(SOURCE_DIR, f'{analysis_type}.csv')
+    if not os.path.exists(source):
+        print(f"  {analysis_type}: no {source}, {analysis_type}_{suffix}.csv not written")
+        return
+    # Read as text so every other column is written back unchanged
+    zips = pd.read_csv(source, encoding='latin1', dtype=str, keep_default_na=False)
+    zips[column] = zips['ZIP'].str.zfill(5).map(flags).fillna(False).astype(bool)
+    zips.to_csv(os.path.join(output_dir, f'{analysis_type}_{suffix}.csv'), index=False)
+
+
+def write_optimized_csv(analysis_type, needs_search, output_dir='data'):
+    """Write <output_dir>/<type>_optimized.csv with the needs_search column"""
+    write_flagged_csv(analysis_type, needs_search, 'needs_search', 'optimized', output_dir)
+
+
+def write_csvs(analysis_type, summary, output_dir='data'):
+    """Write <type>_coverage_analysis.csv and <type>_optimized.csv into
+    output_dir, where needs_search is not can_skip"""
+    summary.to_csv(os.path.join(output_dir, f'{analysis_type}_coverage_analysis.csv'), index=False)
+    write_optimized_csv(analysis_type, ~summary.set_index('ZIP')['can_skip'], output_dir)
+
+
+def analyze_coverage(conn, analysis_types=ANALYSIS_TYPES, radius_miles=COVERAGE_RADIUS_MILES,
+                     min_overlap=MIN_OVERLAP_PCT, skip_pct=SKIP_COVERAGE_PCT, csv_dir=None):
+    """Compute and store the coverage pairs of each analysis; returns the number of pairs"""
+    total = 0
+    start = time.perf_counter()
+    for analysis_type in analysis_types:
+        key = analysis_type.lower()
+        members = cluster_order(pd.read_sql_query(MEMBERS_QUERY, conn, params=(key,)))
+        pairs = coverage_pairs(members, radius_miles, min_overlap)
+        write_coverage(conn, key, pairs)
+        summary = coverage_summary(members, pairs, skip_pct)
+        if csv_dir:
+            write_csvs(analysis_type, summary, csv_dir)
+        total += len(pairs)
+        print(f"  {analysis_type}: {len(members)} ZIPs, {len(pairs)} overlaps, "
+              f"{int(summary['can_skip'].sum())} can skip")
+    print(f"Coverage for {len(analysis_types)} analyses in {time.perf_counter() - start:.2f}s")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service-area overlap between the ZIPs of each cluster")
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('analysis_types', nargs='*', default=ANALYSIS_TYPES, metavar='ANALYSIS',
+                        help="analysis types in zip_cluster, e.g. A_5mi (default: the eight delivered analyses)")
+    parser.add_argument('--radius', type=float, default=COVERAGE_RADIUS_MILES,
+                        help="service circle radius around each ZIP, in miles")
+    parser.add_argument('--min-overlap', type=float, default=MIN_OVERLAP_PCT,
+                        help="smallest overlap percent stored")
+    parser.add_argument('--skip-pct', type=float, default=SKIP_COVERAGE_PCT,
+                        help="coverage percent at which a ZIP can be skipped")
+    parser.add_argument('--csv', nargs='?', const='data', metavar='DIR',
+                        help="also write <type>_coverage_analysis.csv and <type>_optimized.csv (default dir: data)")
+    args = parser.parse_args()
+
+    for analysis_type in args.analysis_types:
+        parse_analysis(analysis_type)
+    conn = db.connect(args.db)
+    try:
+        analyze_coverage(conn, args.analysis_types, args.radius, args.min_overlap, args.skip_pct, args.csv)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
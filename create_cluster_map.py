@@ -1,100 +1,306 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from scipy.spatial import ConvexHull
 import folium
+from branca.element import Element, MacroElement
 from folium.plugins import GroupedLayerControl, MarkerCluster
+from jinja2 import Template
 
-def load_cluster_data():
-    """Load cluster data from CSV files"""
+from cluster_summary import hull_points
+from ingest import ANALYSIS_TYPES, TARGETS_CSV, ZIPS_CSV, file_hash, read_targets, read_zips
+
+# Bump when cluster_members, cluster_stats or hull_points change, so a
+# --cache Parquet file built by older code is recomputed
+CLUSTER_CACHE_VERSION = 1
+
+MEMBER_COLUMNS = ['ZCTA5', 'latitude', 'longitude', 'Total Pop', 'Median Income']
+
+ATHLETIC_CENTER_COLUMNS = [
+    'Organization', 'Address', 'Phone', 'Website', 'Population', 'Median HH Income', 'Latitude', 'Longitude'
+]
+
+def zip_map_column(col):
+    """usecols filter: only load the ZIP CSV columns the map draws"""
+    return (col in ('ZIP', 'latitude', 'longitude', 'grade', 'Total Pop', 'Median Income', 'Families with Children <18')
+            or col.startswith('Cluster_'))
+
+def load_cluster_data(cache_path=None, workers=1):
+    """Load the ZIPs and build one stats row per (analysis_type, cluster)
+
+    Returns (all ZIPs, cluster stats). With cache_path the stats are read
+    from that Parquet file while it matches the CSV and CLUSTER_CACHE_VERSION,
+    and written otherwise.
+    """
     print("Loading data...")
     
     try:
         # Load the main data file
-        df = pd.read_csv('data/high-priority-ZIPs-with-clusters.csv')
-        df['ZCTA5'] = df['ZIP'].astype(str).str.zfill(5)
-        
-        # Initialize clusters dictionary
-        clusters = {}
-        
-        # Define the cluster analysis types we want to track
-        analysis_types = ['A_5mi', 'A_10mi', 'AB_5mi', 'AB_10mi', 'ABC_5mi', 'ABC_10mi', 'BC_5mi', 'BC_10mi']
-        
-        # For each analysis type, extract its clusters
-        for analysis_type in analysis_types:
-            # Get all columns that contain this analysis type
-            matching_cols = [col for col in df.columns if analysis_type in col]
-            if matching_cols:
-                # Use the first matching column (there should only be one)
-                cluster_col = matching_cols[0]
-                # Create a copy of the data with only rows that have a cluster for this analysis
-                analysis_df = df[df[cluster_col].notna()].copy()
-                
-                # Extract just the cluster number from the value (e.g., "A_5mi_C1" -> "1")
-                analysis_df['cluster'] = analysis_df[cluster_col].str.extract(r'C(\d+)$')
-                
-                # Store cluster data
-                if not analysis_df.empty:
-                    clusters[analysis_type] = analysis_df[['ZCTA5', 'latitude', 'longitude', 'cluster', 'Total Pop', 'Median Income']]
-                    print(f"Found {len(analysis_df)} ZIPs in {analysis_type} clusters")
-        
+        df = read_zips(ZIPS_CSV, usecols=zip_map_column)
+        df['ZCTA5'] = df['ZIP']
+
+        source_hash = f'{file_hash(ZIPS_CSV)}|{CLUSTER_CACHE_VERSION}' if cache_path else None
+        clusters = read_cluster_cache(cache_path, source_hash) if cache_path else None
+        if clusters is None:
+            clusters = cluster_stats(cluster_members(df), workers)
+            if cache_path:
+                write_cluster_cache(clusters, cache_path, source_hash)
+
+        for analysis_type, zip_count in clusters.groupby('analysis_type', sort=False)['zips'].sum().items():
+            print(f"Found {zip_count} ZIPs in {analysis_type} clusters")
+
         # Fill missing values
         df['Total Pop'] = df['Total Pop'].fillna(0)
         df['Median Income'] = df['Median Income'].fillna(0)
-        
+
         return df, clusters
     except Exception as e:
         print(f"Error loading data: {str(e)}")
         raise
 
-def create_convex_hull(points):
-    """Create a convex hull from a set of points"""
-    if len(points) < 3:
-        return points
-    hull = ConvexHull(points)
-    return [points[i] for i in hull.vertices]
+def cluster_members(df):
+    """One row per (analysis_type, cluster, ZIP) from the Cluster_<type> columns
 
-def create_cluster_map(all_zips, cluster_data):
-    """Create an interactive map with cluster boundaries and ZIP points"""
-    # Create base map centered on US
-    m = folium.Map(location=[39.8283, -98.5795], zoom_start=4)
-    
-    # Define colors for different analyses
-    cluster_colors = {
-        'A_5mi': '#2ECC40',    # Green
-        'A_10mi': '#3D9970',   # Dark Green
-        'AB_5mi': '#0074D9',   # Blue
-        'AB_10mi': '#001f3f',  # Dark Blue
-        'ABC_5mi': '#FFDC00',  # Yellow
-        'ABC_10mi': '#FF851B', # Orange
-        'BC_5mi': '#B10DC9',   # Purple
-        'BC_10mi': '#85144b'   # Maroon
-    }
-    
-    # Define colors for ZIP grades
-    grade_colors = {
-        'A': '#2ECC40',  # Green
-        'B': '#0074D9',  # Blue
-        'C': '#FFDC00',  # Yellow
-        'D': '#FF851B',  # Orange
-        'F': '#FF4136',  # Red
-        'Ungraded': '#AAAAAA'  # Gray
+    Only the exact Cluster_<type> column is used: a substring match would
+    pick Cluster_ABC_5mi for BC_5mi.
+    """
+    columns = {f'Cluster_{t}': t for t in ANALYSIS_TYPES if f'Cluster_{t}' in df.columns}
+    members = df[MEMBER_COLUMNS + list(columns)].melt(
+        id_vars=MEMBER_COLUMNS, var_name='analysis_type', value_name='cluster'
+    ).dropna(subset=['cluster'])
+    members['analysis_type'] = members['analysis_type'].map(columns)
+
+    # Extract just the cluster number from each distinct value (e.g., "A_5mi_C1" -> "1")
+    codes, labels = pd.factorize(members['cluster'])
+    members['cluster'] = pd.Index(labels).str.extract(r'C(\d+)$')[0].to_numpy()[codes]
+    return members.dropna(subset=['cluster'])
+
+def cluster_stats(members, workers=1):
+    """Counts, sums, means, centroid and convex hull per (analysis_type, cluster)
+
+    Hulls are only drawn for clusters of three or more ZIPs; the rest get
+    None. workers > 1 computes them in a process pool.
+    """
+    groups = members.groupby(['analysis_type', 'cluster'], sort=False)
+    stats = groups.agg(
+        zips=('ZCTA5', 'size'),
+        pop=('Total Pop', 'sum'),
+        income=('Median Income', 'mean'),
+        lat=('latitude', 'mean'),
+        lon=('longitude', 'mean'),
+    ).reset_index()
+
+    coords = members[['latitude', 'longitude']].to_numpy()
+    member_coords = [coords[groups.indices[key]] for key in zip(stats['analysis_type'], stats['cluster'])]
+    drawn = [c for c in member_coords if len(c) >= 3]
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            hulls = iter(pool.map(hull_points, drawn, chunksize=32))
+    else:
+        hulls = map(hull_points, drawn)
+    stats['hull'] = [np.round(next(hulls), 5).tolist() if len(c) >= 3 else None for c in member_coords]
+    return stats
+
+def read_cluster_cache(cache_path, source_hash):
+    """Cached cluster stats, or None when missing, stale or unreadable"""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        cached = pd.read_parquet(cache_path)
+    except ImportError as e:
+        print(f"Not using the cluster cache: {e}")
+        return None
+    if cached.empty or (cached['source_hash'] != source_hash).any():
+        return None
+    print(f"Using cached cluster stats from {cache_path}")
+    cached['hull'] = [None if hull is None else [list(p) for p in hull] for hull in cached['hull']]
+    return cached.drop(columns='source_hash')
+
+def write_cluster_cache(clusters, cache_path, source_hash):
+    try:
+        clusters.assign(source_hash=source_hash).to_parquet(cache_path, index=False)
+    except ImportError as e:
+        print(f"Not writing the cluster cache: {e}")
+
+def json_column(series, decimals=None):
+    """A column as a JSON-ready list with NaN as null"""
+    if decimals is not None:
+        series = series.round(decimals)
+    return series.astype(object).where(series.notna(), None).tolist()
+
+def lite_map_data(all_zips, cluster_data, athletic_centers):
+    """Column-oriented ZIP and center data plus precomputed hulls for the lite map"""
+    zips = all_zips[all_zips['latitude'].notna() & all_zips['longitude'].notna()]
+    clusters = {}
+    for analysis_name, group in cluster_data.groupby('analysis_type', sort=False):
+        drawn = group[group['hull'].notna()]
+        clusters[analysis_name] = [
+            {'id': cluster_id, 'zips': int(zip_count), 'pop': float(pop), 'income': float(income), 'hull': hull}
+            for cluster_id, zip_count, pop, income, hull in zip(
+                drawn['cluster'], drawn['zips'], drawn['pop'], drawn['income'], drawn['hull']
+            )
+        ]
+
+    centers = athletic_centers[athletic_centers['Latitude'].notna() & athletic_centers['Longitude'].notna()]
+    return {
+        'zips': {
+            'zip': zips['ZCTA5'].tolist(),
+            'lat': json_column(zips['latitude'], 5),
+            'lon': json_column(zips['longitude'], 5),
+            'grade': zips['grade'].tolist(),
+            'pop': json_column(zips['Total Pop']),
+            'income': json_column(zips['Median Income']),
+            'families': json_column(zips['Families with Children <18']),
+        },
+        'centers': {
+            'name': json_column(centers['Organization']),
+            'address': json_column(centers['Address']),
+            'phone': json_column(centers['Phone']),
+            'website': json_column(centers['Website']),
+            'lat': json_column(centers['Latitude'], 5),
+            'lon': json_column(centers['Longitude'], 5),
+            'pop': json_column(centers['Population']),
+            'income': json_column(centers['Median HH Income']),
+        },
+        'clusters': clusters,
     }
 
-    # Create feature groups for ZIP grades with clustering
-    grade_groups = {}
-    for grade in grade_colors.keys():
-        group = folium.FeatureGroup(name=f'Grade {grade}', show=False)
-        marker_cluster = MarkerCluster().add_to(group)
-        grade_groups[grade] = {'group': group, 'cluster': marker_cluster}
-        m.add_child(group)
-    
-    # Add ZIP points to appropriate grade groups
-    for _, row in all_zips.iterrows():
+class LiteDataLayers(MacroElement):
+    """Draws window.MAP_DATA on one canvas renderer and registers the layers with the layer control.
+
+    Popups are built when opened instead of being inlined per marker.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this.map_name }};
+            var control = {{ this.control_name }};
+            var data = window.MAP_DATA;
+            var renderer = L.canvas({ padding: 0.5 });
+            var gradeColors = {{ this.grade_colors }};
+            var clusterColors = {{ this.cluster_colors }};
+
+            function number(value) {
+                return value == null ? 'N/A' : Math.round(value).toLocaleString('en-US');
+            }
+
+            var zips = data.zips;
+            function zipPopup(i) {
+                return '<b>ZIP: ' + zips.zip[i] + '</b><br>' +
+                    'Grade: ' + zips.grade[i] + '<br>' +
+                    'Population: ' + number(zips.pop[i]) + '<br>' +
+                    'Income: $' + number(zips.income[i]) + '<br>' +
+                    'Families with Children: ' + number(zips.families[i]);
+            }
+            var gradeLayers = {};
+            Object.keys(gradeColors).forEach(function(grade) { gradeLayers[grade] = L.layerGroup(); });
+            for (var i = 0; i < zips.zip.length; i++) {
+                var gradeLayer = gradeLayers[zips.grade[i]];
+                if (!gradeLayer) continue;
+                L.circleMarker([zips.lat[i], zips.lon[i]], {
+                    renderer: renderer, radius: 3, color: 'black', weight: 1, fill: true,
+                    fillColor: gradeColors[zips.grade[i]], fillOpacity: 0.7, opacity: 1
+                }).bindPopup(zipPopup.bind(null, i)).addTo(gradeLayer);
+            }
+            Object.keys(gradeLayers).forEach(function(grade) {
+                control.addOverlay(gradeLayers[grade], 'Grade ' + grade);
+            });
+
+            Object.keys(clusterColors).forEach(function(analysisName) {
+                var layer = L.layerGroup();
+                (data.clusters[analysisName] || []).forEach(function(cluster) {
+                    L.polygon(cluster.hull, {
+                        renderer: renderer, color: clusterColors[analysisName], weight: 2, fill: true,
+                        fillColor: clusterColors[analysisName], fillOpacity: 0.2
+                    }).bindPopup(function() {
+                        return '<b>Cluster Information</b><br>' +
+                            'Analysis: ' + analysisName + '<br>' +
+                            'Cluster ID: ' + cluster.id + '<br>' +
+                            'Number of ZIPs: ' + cluster.zips + '<br>' +
+                            'Total Population: ' + number(cluster.pop) + '<br>' +
+                            'Avg Income: $' + number(cluster.income);
+                    }).addTo(layer);
+                });
+                control.addOverlay(layer, analysisName);
+                if (analysisName === 'A_10mi') layer.addTo(map);
+            });
+
+            var centers = data.centers;
+            var centerLayer = L.layerGroup();
+            for (var j = 0; j < centers.name.length; j++) {
+                L.circleMarker([centers.lat[j], centers.lon[j]], {
+                    renderer: renderer, radius: 6, color: 'white', weight: 1, fill: true,
+                    fillColor: '#FF0000', fillOpacity: 0.9
+                }).bindPopup(function(k) {
+                    return '<b>' + centers.name[k] + '</b><br>' +
+                        'Address: ' + centers.address[k] + '<br>' +
+                        'Phone: ' + centers.phone[k] + '<br>' +
+                        'Website: <a href="' + centers.website[k] + '" target="_blank">' + centers.website[k] + '</a><br>' +
+                        'Population: ' + number(centers.pop[k]) + '<br>' +
+                        'Median HH Income: $' + number(centers.income[k]);
+                }.bind(null, j)).addTo(centerLayer);
+            }
+            control.addOverlay(centerLayer, 'Athletic Centers');
+            centerLayer.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, m, layer_control, grade_colors, cluster_colors):
+        super().__init__()
+        self._name = 'LiteDataLayers'
+        self.map_name = m.get_name()
+        self.control_name = layer_control.get_name()
+        self.grade_colors = json.dumps(grade_colors)
+        self.cluster_colors = json.dumps(cluster_colors)
+
+# Define colors for different analyses
+CLUSTER_COLORS = {
+    'A_5mi': '#2ECC40',    # Green
+    'A_10mi': '#3D9970',   # Dark Green
+    'AB_5mi': '#0074D9',   # Blue
+    'AB_10mi': '#001f3f',  # Dark Blue
+    'ABC_5mi': '#FFDC00',  # Yellow
+    'ABC_10mi': '#FF851B', # Orange
+    'BC_5mi': '#B10DC9',   # Purple
+    'BC_10mi': '#85144b'   # Maroon
+}
+
+# Define colors for ZIP grades
+GRADE_COLORS = {
+    'A': '#2ECC40',  # Green
+    'B': '#0074D9',  # Blue
+    'C': '#FFDC00',  # Yellow
+    'D': '#FF851B',  # Orange
+    'F': '#FF4136',  # Red
+    'Ungraded': '#AAAAAA'  # Gray
+}
+
+LAYER_CACHE_DIR = 'data/map_layers'
+# Bump when the layer builders change, so cached layers are rebuilt
+LAYER_CACHE_VERSION = 2
+# Layers are rendered separately and stitched together, so every stage
+# refers to the map by this fixed name instead of a random one
+MAP_ID = 'cluster_map'
+
+def load_athletic_centers():
+    """Load athletic centers data"""
+    return read_targets(TARGETS_CSV, usecols=ATHLETIC_CENTER_COLUMNS)
+
+def grade_layer(zips, grade):
+    """ZIP points of one grade, with clustering"""
+    group = folium.FeatureGroup(name=f'Grade {grade}', show=False)
+    marker_cluster = MarkerCluster().add_to(group)
+
+    for _, row in zips.iterrows():
         # Skip if coordinates are missing
         if pd.isna(row['latitude']) or pd.isna(row['longitude']):
             continue
-            
-        grade = row['grade']
+
         popup_html = f"""
         <b>ZIP: {row['ZCTA5']}</b><br>
         Grade: {grade}<br>
@@ -102,105 +308,59 @@ def create_cluster_map(all_zips, cluster_data):
         Income: ${float(str(row['Median Income']).replace('+', '').replace(',', '')):,.0f}<br>
         Families with Children: {row['Families with Children <18']:,.0f}
         """
-        
+
         folium.CircleMarker(
             location=[row['latitude'], row['longitude']],
             radius=3,
             color='black',  # Stroke color
             weight=1,      # Stroke width
             fill=True,
-            fillColor=grade_colors[grade],
+            fillColor=GRADE_COLORS[grade],
             fillOpacity=0.7,
             popup=popup_html,
             opacity=1
-        ).add_to(grade_groups[grade]['cluster'])
-    
-    # Load athletic centers data
-    athletic_centers = pd.read_csv('data/athletic-center-targets-2024-01-02.csv')
-    athletic_centers['Population'] = pd.to_numeric(athletic_centers['Population'].str.replace(',', ''), errors='coerce')
-    athletic_centers['Median HH Income'] = pd.to_numeric(athletic_centers['Median HH Income'].str.replace('$', '').str.replace(',', ''), errors='coerce')
-    
-    # Create legend
-    legend_html = '''
-    <div style="position: fixed; bottom: 50px; left: 50px; z-index: 1000; 
-         background-color: white; padding: 10px; border: 2px solid grey; border-radius: 5px">
-    <h4>Legend</h4>
-    <h5>Cluster Types</h5>
-    '''
-    for name, color in cluster_colors.items():
-        legend_html += f'<p><i class="fa fa-square fa-1x" style="color:{color}"></i> {name}</p>'
-    legend_html += '<h5>ZIP Grades</h5>'
-    for grade, color in grade_colors.items():
-        legend_html += f'<p><i class="fa fa-circle fa-1x" style="color:{color}"></i> Grade {grade}</p>'
-    legend_html += '<h5>Categories</h5>'
-    legend_html += '<p><i class="fa fa-map-marker fa-1x" style="color:#FF0000"></i> Athletic Centers</p>'
-    legend_html += '</div>'
-    m.get_root().html.add_child(folium.Element(legend_html))
-    
-    # Create cluster groups
-    cluster_groups = {}
-    for analysis_name, df in cluster_data.items():
-        show_layer = analysis_name == 'A_10mi'
-        group = folium.FeatureGroup(name=analysis_name, show=show_layer)
-        cluster_groups[analysis_name] = group
-        
-        # Process each cluster in this analysis
-        for cluster_id in df['cluster'].unique():
-            if pd.isna(cluster_id):
-                print(f"Skipping null cluster ID in {analysis_name}")
-                continue
-                
-            cluster_df = df[df['cluster'] == cluster_id]
-            print(f"\nCluster {cluster_id} in {analysis_name}:")
-            print(f"Number of ZIPs: {len(cluster_df)}")
-            
-            # Get coordinates for cluster
-            coords = cluster_df[['latitude', 'longitude']].values
-            print(f"Number of coordinates: {len(coords)}")
-            
-            # Create convex hull for cluster boundary
-            if len(coords) >= 3:
-                hull_points = create_convex_hull(coords)
-                print(f"Number of hull points: {len(hull_points)}")
-                
-                # Calculate cluster center for label
-                center = np.mean(coords, axis=0)
-                
-                # Create popup content
-                popup_html = f"""
-                <b>Cluster Information</b><br>
-                Analysis: {analysis_name}<br>
-                Cluster ID: {cluster_id}<br>
-                Number of ZIPs: {len(cluster_df)}<br>
-                Total Population: {cluster_df['Total Pop'].sum():,.0f}<br>
-                Avg Income: ${cluster_df['Median Income'].mean():,.0f}
-                """
-                
-                # Draw polygon for cluster boundary
-                folium.Polygon(
-                    locations=[[p[0], p[1]] for p in hull_points],
-                    color=cluster_colors[analysis_name],
-                    weight=2,
-                    fill=True,
-                    fillColor=cluster_colors[analysis_name],
-                    fillOpacity=0.2,
-                    popup=popup_html
-                ).add_to(group)
-        
-        # Add group to map after all polygons are added
-        m.add_child(group)
+        ).add_to(marker_cluster)
+    return group
+
+def cluster_layer(clusters, analysis_name):
+    """Hull polygons for one analysis type from its cluster stats rows"""
+    show_layer = analysis_name == 'A_10mi'
+    group = folium.FeatureGroup(name=analysis_name, show=show_layer)
 
-    # Create athletic centers group with clustering
-    athletic_centers_group = folium.FeatureGroup(name='Athletic Centers', show=True)
-    athletic_centers_cluster = MarkerCluster().add_to(athletic_centers_group)
-    m.add_child(athletic_centers_group)
+    # Hulls are precomputed for clusters of three or more ZIPs
+    for cluster in clusters[clusters['hull'].notna()].itertuples():
+        # Create popup content
+        popup_html = f"""
+        <b>Cluster Information</b><br>
+        Analysis: {analysis_name}<br>
+        Cluster ID: {cluster.cluster}<br>
+        Number of ZIPs: {cluster.zips}<br>
+        Total Population: {cluster.pop:,.0f}<br>
+        Avg Income: ${cluster.income:,.0f}
+        """
+
+        # Draw polygon for cluster boundary
+        folium.Polygon(
+            locations=cluster.hull,
+            color=CLUSTER_COLORS[analysis_name],
+            weight=2,
+            fill=True,
+            fillColor=CLUSTER_COLORS[analysis_name],
+            fillOpacity=0.2,
+            popup=popup_html
+        ).add_to(group)
+    return group
+
+def athletic_centers_layer(athletic_centers):
+    """Athletic centers, with clustering"""
+    group = folium.FeatureGroup(name='Athletic Centers', show=True)
+    athletic_centers_cluster = MarkerCluster().add_to(group)
 
-    # Add athletic centers to map
     for _, row in athletic_centers.iterrows():
         # Skip if coordinates are missing
         if pd.isna(row['Latitude']) or pd.isna(row['Longitude']):
             continue
-            
+
         popup_html = f"""
         <b>{row['Organization']}</b><br>
         Address: {row['Address']}<br>
@@ -209,19 +369,206 @@ def create_cluster_map(all_zips, cluster_data):
         Population: {row['Population']:,.0f}<br>
         Median HH Income: ${row['Median HH Income']:,.0f}
         """
-        
+
         folium.Marker(
             location=[row['Latitude'], row['Longitude']],
             popup=popup_html,
             icon=folium.Icon(color='red', icon='info-sign')
         ).add_to(athletic_centers_cluster)
+    return group
+
+def layer_stages():
+    """The map's layers in display order, each with the input files and parameters it is built from"""
+    stages = [
+        {'id': f'grade_{grade}', 'kind': 'grade', 'inputs': [ZIPS_CSV],
+         'params': {'grade': grade, 'color': color}}
+        for grade, color in GRADE_COLORS.items()
+    ]
+    stages += [
+        {'id': f'cluster_{name}', 'kind': 'cluster', 'inputs': [ZIPS_CSV],
+         'params': {'analysis': name, 'color': color}}
+        for name, color in CLUSTER_COLORS.items()
+    ]
+    stages.append({'id': 'athletic_centers', 'kind': 'centers', 'inputs': [TARGETS_CSV], 'params': {}})
+    return stages
+
+def stage_key(stage, input_hashes):
+    """Cache key over the stage's input files, parameters and the builder version"""
+    key = {
+        'version': LAYER_CACHE_VERSION,
+        'folium': folium.__version__,
+        'inputs': {path: input_hashes[path] for path in stage['inputs']},
+        'params': stage['params'],
+    }
+    return hashlib.blake2b(json.dumps(key, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+def render_layer(stage, data):
+    """Build one stage's layer and render it on a scratch map.
+
+    Returns the layer's variable and display names plus the header, html
+    and script fragments it adds to the page, for PrerenderedLayers.
+    """
+    if stage['kind'] == 'grade':
+        group = grade_layer(data, stage['params']['grade'])
+    elif stage['kind'] == 'cluster':
+        group = cluster_layer(data, stage['params']['analysis'])
+    else:
+        group = athletic_centers_layer(data)
+    group._id = stage['id']
+
+    m = folium.Map()
+    m._id = MAP_ID
+    m.add_child(group)
+    figure = m.get_root()
+    sections = ('header', 'html', 'script')
+    before = {section: set(getattr(figure, section)._children) for section in sections}
+    group.render()
+
+    parts = [
+        [section, name, element.render()]
+        for section in sections
+        for name, element in getattr(figure, section)._children.items()
+        if name not in before[section]
+    ]
+    return {'var': group.get_name(), 'name': group.layer_name, 'parts': parts}
+
+def build_layers(cache_dir=LAYER_CACHE_DIR, workers=None, cluster_cache=None):
+    """Rendered layers for every stage, reusing cached ones whose inputs and parameters are unchanged.
+
+    Stale layers are rendered in a pool of workers processes (default: one
+    per CPU) and written back to cache_dir.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stages = layer_stages()
+    input_hashes = {path: file_hash(path) for stage in stages for path in stage['inputs']}
+
+    layers = {}
+    stale = []
+    for stage in stages:
+        path = os.path.join(cache_dir, f"{stage['id']}-{stage_key(stage, input_hashes)}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                layers[stage['id']] = json.load(f)
+        else:
+            stale.append((stage, path))
+    print(f"Layers: {len(stages) - len(stale)} cached, {len(stale)} to build")
+
+    if stale:
+        # Load only the inputs the stale layers need
+        kinds = {stage['kind'] for stage, _ in stale}
+        if kinds & {'grade', 'cluster'}:
+            all_zips, cluster_data = load_cluster_data(cluster_cache)
+        if 'centers' in kinds:
+            athletic_centers = load_athletic_centers()
+
+        def stage_data(stage):
+            if stage['kind'] == 'grade':
+                return all_zips[all_zips['grade'] == stage['params']['grade']]
+            if stage['kind'] == 'cluster':
+                return cluster_data[cluster_data['analysis_type'] == stage['params']['analysis']]
+            return athletic_centers
+
+        args = [(stage, stage_data(stage)) for stage, _ in stale]
+        workers = min(workers or os.cpu_count() or 1, len(stale))
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                rendered = list(pool.map(render_layer, *zip(*args)))
+        else:
+            rendered = [render_layer(*arg) for arg in args]
+
+        for (stage, path), layer in zip(stale, rendered):
+            # Drop this stage's older artifacts before writing the new one
+            for name in os.listdir(cache_dir):
+                if name.startswith(f"{stage['id']}-") and name.endswith('.json'):
+                    os.remove(os.path.join(cache_dir, name))
+            with open(path, 'w') as f:
+                json.dump(layer, f)
+            layers[stage['id']] = layer
+            print(f"  built {stage['id']}")
+
+    return [layers[stage['id']] for stage in stages]
+
+class RawElement(Element):
+    """Pre-rendered markup, output as-is rather than as a template"""
+
+    def __init__(self, content):
+        super().__init__()
+        self.content = content
+
+    def render(self, **kwargs):
+        return self.content
+
+class PrerenderedLayers(MacroElement):
+    """Stitches layers from render_layer into the page and registers them with the layer control"""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {%- for layer in this.layers %}
+            {{ this.control_name }}.addOverlay({{ layer.var }}, {{ layer.name|tojson }});
+        {%- endfor %}
+        {% endmacro %}
+    """)
+
+    def __init__(self, layers, layer_control):
+        super().__init__()
+        self._name = 'PrerenderedLayers'
+        self.layers = layers
+        self.control_name = layer_control.get_name()
+
+    def render(self, **kwargs):
+        figure = self.get_root()
+        for layer in self.layers:
+            for section, name, content in layer['parts']:
+                getattr(figure, section).add_child(RawElement(content), name=name)
+        super().render(**kwargs)
+
+def create_cluster_map(layers=None, map_data=None, data_path=None):
+    """Assemble the interactive map with cluster boundaries and ZIP points.
+
+    layers come from build_layers. In lite mode map_data (from
+    lite_map_data) is written once to the side-car script data_path and
+    drawn by LiteDataLayers, instead of one Folium object with inline
+    popup HTML per marker.
+    """
+    lite = data_path is not None
+    # Create base map centered on US
+    m = folium.Map(location=[39.8283, -98.5795], zoom_start=4)
+    m._id = MAP_ID
+    cluster_colors = CLUSTER_COLORS
+    grade_colors = GRADE_COLORS
+    
+    # Create legend
+    legend_html = '''
+    <div style="position: fixed; bottom: 50px; left: 50px; z-index: 1000; 
+         background-color: white; padding: 10px; border: 2px solid grey; border-radius: 5px">
+    <h4>Legend</h4>
+    <h5>Cluster Types</h5>
+    '''
+    for name, color in cluster_colors.items():
+        legend_html += f'<p><i class="fa fa-square fa-1x" style="color:{color}"></i> {name}</p>'
+    legend_html += '<h5>ZIP Grades</h5>'
+    for grade, color in grade_colors.items():
+        legend_html += f'<p><i class="fa fa-circle fa-1x" style="color:{color}"></i> Grade {grade}</p>'
+    legend_html += '<h5>Categories</h5>'
+    legend_html += '<p><i class="fa fa-map-marker fa-1x" style="color:#FF0000"></i> Athletic Centers</p>'
+    legend_html += '</div>'
+    m.get_root().html.add_child(folium.Element(legend_html))
     
     # Add layer control (hidden but functional)
-    folium.LayerControl(
+    layer_control = folium.LayerControl(
         position='topright',
         collapsed=True,
         overlay=True
     ).add_to(m)
+
+    if lite:
+        with open(data_path, 'w') as f:
+            f.write('window.MAP_DATA = ')
+            json.dump(map_data, f, separators=(',', ':'))
+            f.write(';\n')
+        m.get_root().header.add_child(folium.Element(f'<script src="{os.path.basename(data_path)}"></script>'))
+        m.add_child(LiteDataLayers(m, layer_control, grade_colors, cluster_colors))
+    else:
+        m.add_child(PrerenderedLayers(layers, layer_control))
     
     # Add custom control panel HTML
     custom_control_html = """
@@ -411,15 +758,43 @@ def create_cluster_map(all_zips, cluster_data):
     return m
 
 def main():
-    print("Loading data...")
-    all_zips, cluster_data = load_cluster_data()
-    
-    print("Creating map...")
-    m = create_cluster_map(all_zips, cluster_data)
+    parser = argparse.ArgumentParser(description="Generate the static cluster map")
+    parser.add_argument('--lite', action='store_true',
+                        help="write the data once to a side-car script and draw it on a canvas")
+    parser.add_argument('--output', default='index.html')
+    parser.add_argument('--cache', metavar='PARQUET',
+                        help="reuse the cluster stats and hulls from this file while the CSV is unchanged")
+    parser.add_argument('--layer-cache', default=LAYER_CACHE_DIR,
+                        help="directory of rendered layers, reused while their inputs are unchanged")
+    parser.add_argument('--workers', type=int,
+                        help="processes for building layers (default: one per CPU), "
+                             "or for the hull computation in lite mode (default: 1)")
+    args = parser.parse_args()
+    data_path = os.path.splitext(args.output)[0] + '_data.js' if args.lite else None
+
+    start = time.perf_counter()
+    if args.lite:
+        all_zips, cluster_data = load_cluster_data(args.cache, args.workers or 1)
+        print(f"Data ready in {time.perf_counter() - start:.2f}s")
+        map_data = lite_map_data(all_zips, cluster_data, load_athletic_centers())
+        print("Creating map...")
+        m = create_cluster_map(map_data=map_data, data_path=data_path)
+    else:
+        print("Building layers...")
+        layers = build_layers(args.layer_cache, args.workers, args.cache)
+        print(f"Layers ready in {time.perf_counter() - start:.2f}s")
+        print("Creating map...")
+        m = create_cluster_map(layers=layers)
     
     print("Saving map...")
-    m.save('index.html')
-    print("Done! Open index.html to view the map")
+    m.save(args.output)
+    elapsed = time.perf_counter() - start
+
+    size = os.path.getsize(args.output)
+    print(f"Generated in {elapsed:.1f}s: {args.output} {size / 1e6:.2f} MB")
+    if data_path:
+        print(f"  + {data_path} {os.path.getsize(data_path) / 1e6:.2f} MB")
+    print(f"Done! Open {args.output} to view the map")
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,10 @@
 import sqlite3
 import os
-import shutil
 import datetime
 import logging
 from pathlib import Path
+from contextlib import closing
+import db
 
 # Set up logging
 logging.basicConfig(
@@ -15,6 +16,7 @@ logging.basicConfig(
 class DatabaseManager:
     def __init__(self, db_path='data/targets.db'):
         self.db_path = db_path
+        self.pool = db.get_pool(db_path)
         self.backup_dir = 'data/backups'
         self.log_dir = 'data/logs'
         
@@ -31,7 +33,14 @@ class DatabaseManager:
             
             # Create backup only if source database exists
             if os.path.exists(self.db_path):
-                shutil.copy2(self.db_path, backup_path)
+                # Online backup API: a consistent snapshot that includes pages
+                # still in the WAL file, even while the server is writing
+                conn = self.pool.acquire()
+                try:
+                    with closing(sqlite3.connect(backup_path)) as backup_conn:
+                        conn.backup(backup_conn)
+                finally:
+                    conn.close()
                 logging.info(f'Database backup created: {backup_path}')
                 
                 # Clean up old backups (keep last 5)
@@ -67,8 +76,9 @@ class DatabaseManager:
 
     def verify_database_integrity(self):
         """Verify the integrity of the database"""
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.pool.acquire()
             cursor = conn.cursor()
             cursor.execute("PRAGMA integrity_check")
             result = cursor.fetchone()[0]
@@ -84,7 +94,8 @@ class DatabaseManager:
             logging.error(f'Database integrity check failed: {str(e)}')
             return False
         finally:
-            conn.close()
+            if conn is not None:
+                conn.close()
 
 # Create a global instance
 db_manager = DatabaseManager()
@@ -0,0 +1,174 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DB_PATH = 'data/targets.db'
+
+# WAL lets the map readers keep going while a kanban write commits.
+# synchronous=NORMAL is durable across application crashes in WAL mode.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,       # 64 MB page cache per connection
+    'mmap_size': 268435456,     # 256 MB memory-mapped reads
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,       # wait up to 5s on a lock instead of failing
+}
+
+STATEMENT_CACHE_SIZE = 256
+
+# Cached API responses are keyed on these generations: 'targets' covers the
+# targets table (including kanban status), 'zips' covers zip_data, zip_cluster
+# and cluster_summary. Every writer bumps the scopes it touched.
+DATA_SCOPES = ('targets', 'zips')
+
+DATA_VERSION_QUERY = 'SELECT scope, generation FROM data_version'
+
+BUMP_GENERATION_QUERY = '''
+    INSERT INTO data_version (scope, generation) VALUES (?, ?)
+    ON CONFLICT(scope) DO UPDATE SET generation = MAX(generation + 1, excluded.generation)
+'''
+
+
+def connect(db_path=DB_PATH, pragmas=None):
+    """Open a tuned connection.
+
+    Connections are in autocommit mode (isolation_level=None); use
+    write_transaction() to group writes. Each keeps a cache of prepared
+    statements keyed by SQL text, which pays off for long-lived connections.
+    """
+    conn = sqlite3.connect(
+        db_path,
+        timeout=5,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.row_factory = sqlite3.Row
+    for name, value in (PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+@contextmanager
+def write_transaction(conn, retries=3):
+    """BEGIN IMMEDIATE ... COMMIT, rolling back on error.
+
+    Taking the write lock up front avoids the SQLITE_BUSY a deferred
+    transaction gets when it tries to upgrade from reading to writing.
+    """
+    for attempt in range(retries):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            break
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or attempt == retries - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+    try:
+        yield conn
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def data_generation(conn):
+    """{scope: generation} as last bumped by a writer"""
+    return dict(conn.execute(DATA_VERSION_QUERY).fetchall())
+
+
+def bump_generation(conn, *scopes):
+    """Mark scopes as changed; call inside the writing transaction.
+
+    Generations are seeded from the clock so a rebuilt database never
+    reuses a generation a running server has already cached.
+    """
+    now = time.time_ns()
+    conn.executemany(BUMP_GENERATION_QUERY, [(scope, now) for scope in scopes or DATA_SCOPES])
+
+
+class PooledConnection:
+    """A pooled connection; close() hands it back to the pool instead of closing it"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class ConnectionPool:
+    """Bounded pool of tuned SQLite connections shared across request threads"""
+
+    def __init__(self, db_path=DB_PATH, size=8, pragmas=None):
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=30):
+        """Borrow a connection; call close() on the result to return it"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = connect(self.db_path, self.pragmas)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get(timeout=timeout)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        pooled = self.acquire()
+        try:
+            yield pooled
+        finally:
+            pooled.close()
+
+    def close_all(self):
+        """Close the idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    """Shared pool for a database file"""
+    with _pools_lock:
+        if db_path not in _pools:
+            _pools[db_path] = ConnectionPool(db_path)
+        return _pools[db_path]
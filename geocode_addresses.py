@@ -1,10 +1,23 @@
 import pandas as pd
-from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
 import time
 import re
 import os
 from math import radians, sin, cos, sqrt, atan2
+import argparse
+from spatial_index import ZipSpatialIndex
+from geocode_cache import GeocodeCache, DAY_SECONDS
+from geocoders import NominatimBackend, StubBackend, RateLimitedGeocoder, geocode_all
+from ingest import read_zips
+
+_default_geolocator = None
+
+def get_default_geolocator():
+    """Shared rate-limited public Nominatim client, created on first use"""
+    global _default_geolocator
+    if _default_geolocator is None:
+        _default_geolocator = RateLimitedGeocoder(NominatimBackend(user_agent="my_app"))
+    return _default_geolocator
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calculate the distance between two points on Earth"""
@@ -20,40 +33,26 @@ def haversine_distance(lat1, lon1, lat2, lon2):
 
     return distance
 
-def find_nearby_zip(target_zip, zip_data, max_distance=10):
+def find_nearby_zip(target_zip, zip_data, max_distance=10, zip_index=None, cache=None, geolocator=None):
     """Find the nearest ZIP code in our data within max_distance km"""
-    if target_zip in zip_data.index:
-        return zip_data.loc[target_zip, 'latitude'], zip_data.loc[target_zip, 'longitude']
-    
-    target_loc = None
-    geolocator = Nominatim(user_agent="my_app")
-    try:
-        location = geolocator.geocode({"postalcode": target_zip, "country": "USA"})
-        if location:
-            target_loc = (location.latitude, location.longitude)
-    except GeocoderTimedOut:
-        return None, None
+    if zip_index is None:
+        zip_index = ZipSpatialIndex.from_frame(zip_data)
+
+    lat, lon = zip_index.coords(target_zip)
+    if lat is not None:
+        return lat, lon
     
-    if not target_loc:
+    if geolocator is None:
+        geolocator = get_default_geolocator()
+    target_lat, target_lon = geocode_with_retry(geolocator, {"postalcode": target_zip, "country": "USA"},
+                                                max_retries=1, cache=cache)
+    if target_lat is None or target_lon is None:
         return None, None
     
-    nearest_distance = float('inf')
-    nearest_coords = None
-    
-    for idx, row in zip_data.iterrows():
-        if pd.isna(row['latitude']) or pd.isna(row['longitude']):
-            continue
-        
-        distance = haversine_distance(target_loc[0], target_loc[1], 
-                                    row['latitude'], row['longitude'])
-        
-        if distance < nearest_distance and distance <= max_distance:
-            nearest_distance = distance
-            nearest_coords = (row['latitude'], row['longitude'])
-    
-    if nearest_coords:
-        print(f"Found nearby ZIP within {nearest_distance:.2f} km")
-        return nearest_coords
+    distances, positions = zip_index.query_nearest(target_lat, target_lon, max_distance_km=max_distance)
+    if positions[0, 0] >= 0:
+        print(f"Found nearby ZIP within {distances[0, 0]:.2f} km")
+        return zip_index.latitudes[positions[0, 0]], zip_index.longitudes[positions[0, 0]]
     return None, None
 
 def extract_zip(address):
@@ -81,13 +80,23 @@ def extract_street_city_state(address):
         return f"{street}, {match.group(2)}, {match.group(3)}"
     return None
 
-def geocode_with_retry(geolocator, query, max_retries=3):
-    """Try geocoding with retries and longer timeout"""
+def geocode_with_retry(geolocator, query, max_retries=3, cache=None):
+    """Try geocoding with retries and longer timeout, consulting the cache first"""
+    if cache is not None:
+        cached, coords = cache.get(query)
+        if cached:
+            return coords
+
     for attempt in range(max_retries):
         try:
             location = geolocator.geocode(query, timeout=10)
             if location:
+                if cache is not None:
+                    cache.put(query, location.latitude, location.longitude)
                 return location.latitude, location.longitude
+            if attempt == max_retries - 1 and cache is not None:
+                # The service answered but found nothing; remember the miss
+                cache.put(query, None, None)
         except (GeocoderTimedOut, Exception) as e:
             if attempt == max_retries - 1:  # Last attempt
                 print(f"Failed after {max_retries} attempts: {str(e)}")
@@ -96,7 +105,7 @@ def geocode_with_retry(geolocator, query, max_retries=3):
             time.sleep(2)  # Wait before retry
     return None, None
 
-def geocode_address(address, zip_code=None, zip_data=None):
+def geocode_address(address, zip_code=None, zip_data=None, zip_index=None, cache=None, geolocator=None):
     """Geocode an address using Nominatim, fall back to ZIP if address fails"""
     # Special cases for problematic addresses
     if "11594 Old Georgetown Rd Rockville, MD" in address:
@@ -106,29 +115,31 @@ def geocode_address(address, zip_code=None, zip_data=None):
         print("Using hardcoded coordinates for Eich's Sports Complex")
         return 41.6297, -88.2435  # Correct coordinates for Plainfield, IL location
         
-    geolocator = Nominatim(user_agent="my_app")
+    if geolocator is None:
+        geolocator = get_default_geolocator()
     
     # Try full address first
-    lat, lon = geocode_with_retry(geolocator, address)
+    lat, lon = geocode_with_retry(geolocator, address, cache=cache)
     if lat and lon:
         return lat, lon
     
     # If full address fails and we have a ZIP code, try that
     if zip_code:
-        lat, lon = geocode_with_retry(geolocator, {"postalcode": zip_code, "country": "USA"})
+        lat, lon = geocode_with_retry(geolocator, {"postalcode": zip_code, "country": "USA"}, cache=cache)
         if lat and lon:
             return lat, lon
         
         # If direct ZIP lookup fails, try finding a nearby ZIP from our data
         if zip_data is not None:
-            lat, lon = find_nearby_zip(zip_code, zip_data)
+            lat, lon = find_nearby_zip(zip_code, zip_data, zip_index=zip_index, cache=cache,
+                                       geolocator=geolocator)
             if lat and lon:
                 return lat, lon
     
     # If ZIP fails, try street, city and state
     street_city_state = extract_street_city_state(address)
     if street_city_state:
-        lat, lon = geocode_with_retry(geolocator, street_city_state)
+        lat, lon = geocode_with_retry(geolocator, street_city_state, cache=cache)
         if lat and lon:
             print(f"Using street/city/state coordinates for: {street_city_state}")
             return lat, lon
@@ -136,56 +147,122 @@ def geocode_address(address, zip_code=None, zip_data=None):
     # If street fails, try just city and state
     city_state = extract_city_state(address)
     if city_state:
-        lat, lon = geocode_with_retry(geolocator, city_state)
+        lat, lon = geocode_with_retry(geolocator, city_state, cache=cache)
         if lat and lon:
             print(f"Using city/state coordinates for: {city_state}")
             return lat, lon
     
     return None, None
 
-# Load the CSV
-csv_path = 'data/athletic-center-targets-2024-01-02.csv'
-df = pd.read_csv(csv_path, encoding='latin1')
-
-# Load ZIP data from clusters
-zip_data = None
-cluster_file = 'data/A_5mi.csv'
-if os.path.exists(cluster_file):
-    zip_data = pd.read_csv(cluster_file, encoding='latin1')
-    zip_data.set_index('ZIP', inplace=True)
-    print("Loaded ZIP code data for nearby location lookup")
-
-# Initialize Latitude and Longitude columns if they don't exist
-if 'Latitude' not in df.columns:
-    df['Latitude'] = None
-if 'Longitude' not in df.columns:
-    df['Longitude'] = None
-
-# Force rerun of all addresses
-print(f"Processing all {len(df)} addresses")
-for i, (idx, row) in enumerate(df.iterrows(), 1):
-    address = row['Address']
-    zip_code = extract_zip(address)
-    
-    print(f"Processing {i} of {len(df)}: {address}")
-    
-    # Try full address first, fall back to ZIP, then nearby ZIPs
-    lat, lon = geocode_address(address, zip_code, zip_data)
-    
-    if lat and lon:
-        df.loc[idx, 'Latitude'] = lat
-        df.loc[idx, 'Longitude'] = lon
-        print(f"Successfully geocoded to: {lat}, {lon}")
+def build_geolocator(backend_name, domain=None, rate=None):
+    """Create the shared, rate-limited geocoder client for a run"""
+    if backend_name == 'stub':
+        backend = StubBackend.from_zip_csv()
     else:
-        print(f"Failed to geocode address: {address}")
-    
-    time.sleep(1)  # Be nice to the geocoding service
+        backend = NominatimBackend(user_agent="my_app", domain=domain)
+    return RateLimitedGeocoder(backend, rate=rate)
+
+def main():
+    parser = argparse.ArgumentParser(description="Geocode athletic center addresses")
+    parser.add_argument('--fresh', action='store_true',
+                        help="ignore checkpoints from an interrupted run and start over")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="bypass the persistent geocode cache")
+    parser.add_argument('--miss-ttl-days', type=float, default=7,
+                        help="how long a failed lookup is remembered (default: 7)")
+    parser.add_argument('--backend', choices=['nominatim', 'stub'], default='nominatim',
+                        help="geocoding backend; 'stub' answers from local ZIP centroids with no network")
+    parser.add_argument('--domain',
+                        help="host of a self-hosted Nominatim server (no public rate limit)")
+    parser.add_argument('--rate', type=float,
+                        help="requests per second (default: whatever the backend allows)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="concurrent geocoding workers (default: 4)")
+    parser.add_argument('--output',
+                        help="write results here instead of updating the targets CSV in place")
+    args = parser.parse_args()
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+
+    # Load the CSV
+    csv_path = 'data/athletic-center-targets-2024-01-02.csv'
+    df = pd.read_csv(csv_path, encoding='latin1')
+
+    # Load ZIP data from clusters
+    zip_data = None
+    zip_index = None
+    cluster_file = 'data/A_5mi.csv'
+    if os.path.exists(cluster_file):
+        zip_data = read_zips(cluster_file, usecols=['ZIP', 'latitude', 'longitude'])
+        zip_data.set_index('ZIP', inplace=True)
+        zip_index = ZipSpatialIndex.from_frame(zip_data)
+        print("Loaded ZIP code data for nearby location lookup")
+
+    # Initialize Latitude and Longitude columns if they don't exist
+    if 'Latitude' not in df.columns:
+        df['Latitude'] = None
+    if 'Longitude' not in df.columns:
+        df['Longitude'] = None
+
+    # Answers are cached across runs; progress is checkpointed per address so
+    # an interrupted run picks up where it stopped
+    backend_key = args.domain or args.backend
+    cache = None
+    if not args.no_cache:
+        cache = GeocodeCache(miss_ttl=args.miss_ttl_days * DAY_SECONDS, namespace=backend_key)
+    run_id = f"{backend_key}|{os.path.abspath(csv_path)}"
+    completed = {}
+    if cache is not None:
+        if args.fresh:
+            cache.clear_run(run_id)
+        completed = cache.completed_rows(run_id)
+        if completed:
+            print(f"Resuming run: {len(completed)} addresses already processed")
+
+    # One client for the whole run; the token bucket inside it paces requests
+    geolocator = build_geolocator(args.backend, args.domain, args.rate)
+
+    pending = []
+    for idx, row in df.iterrows():
+        address = row['Address']
+        if address in completed:
+            lat, lon = completed[address]
+            if lat is not None and lon is not None:
+                df.loc[idx, 'Latitude'] = lat
+                df.loc[idx, 'Longitude'] = lon
+        else:
+            pending.append((idx, address))
+
+    def geocode_row(task):
+        idx, address = task
+        lat, lon = geocode_address(address, extract_zip(address), zip_data, zip_index, cache, geolocator)
+        if cache is not None:
+            cache.checkpoint(run_id, address, lat or None, lon or None)
+        return lat, lon
+
+    print(f"Processing {len(pending)} of {len(df)} addresses with {args.workers} workers")
+    for i, ((idx, address), (lat, lon)) in enumerate(geocode_all(pending, geocode_row, args.workers), 1):
+        print(f"Processed {i} of {len(pending)}: {address}")
+        if lat and lon:
+            df.loc[idx, 'Latitude'] = lat
+            df.loc[idx, 'Longitude'] = lon
+            print(f"Successfully geocoded to: {lat}, {lon}")
+        else:
+            print(f"Failed to geocode address: {address}")
+
+    # Save updated CSV
+    df.to_csv(args.output or csv_path, index=False, encoding='latin1')
+
+    if cache is not None:
+        cache.clear_run(run_id)
+        print(f"Geocode cache: {cache.hits} hits, {cache.misses} lookups sent to the geocoder")
+        cache.close()
 
-# Save updated CSV
-df.to_csv(csv_path, index=False, encoding='latin1')
+    # Report results
+    missing = df[df['Latitude'].isna() | df['Longitude'].isna()].shape[0]
+    print(f"\nGeocoding complete!")
+    print(f"Successfully geocoded: {len(df) - missing}")
+    print(f"Failed to geocode: {missing}")
 
-# Report results
-missing = df[df['Latitude'].isna() | df['Longitude'].isna()].shape[0]
-print(f"\nGeocoding complete!")
-print(f"Successfully geocoded: {len(df) - missing}")
-print(f"Failed to geocode: {missing}")
+if __name__ == "__main__":
+    main()
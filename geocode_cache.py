@@ -0,0 +1,148 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = 'data/geocode_cache.db'
+DAY_SECONDS = 24 * 60 * 60
+
+
+def normalize_query(query):
+    """Build a stable cache key for a geocoder query.
+
+    Handles the query forms geocode_addresses.py sends: a free-text address,
+    a structured dict such as {"postalcode": ..., "country": "USA"}, and the
+    street/city/state and city/state strings.
+    """
+    if isinstance(query, dict):
+        items = sorted((str(k).strip().lower(), str(v).strip().lower()) for k, v in query.items())
+        return 'dict:' + json.dumps(items, separators=(',', ':'))
+    text = re.sub(r'\s+', ' ', str(query)).strip().lower()
+    text = re.sub(r'\s*,\s*', ', ', text)
+    return 'text:' + text
+
+
+class GeocodeCache:
+    """Persistent SQLite cache of geocoder answers plus per-run checkpoints.
+
+    Hits are kept for hit_ttl seconds (None keeps them forever). Misses,
+    where the service answered but found nothing, are kept for miss_ttl
+    seconds so a bad address isn't retried on every run. Errors and timeouts
+    are never cached. One instance can be shared by geocoding worker threads.
+    Keys are prefixed with `namespace` so answers from different backends
+    never mix.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, hit_ttl=None, miss_ttl=7 * DAY_SECONDS, namespace='nominatim'):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            query_key TEXT PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            found INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS geocode_progress (
+            run_id TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            latitude REAL,
+            longitude REAL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (run_id, row_key)
+        )
+        ''')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _key(self, query):
+        return f'{self.namespace}|{normalize_query(query)}'
+
+    def get(self, query):
+        """Look up a query.
+
+        Returns (cached, (lat, lon)). cached is False when the caller still
+        has to ask the geocoder; a cached miss comes back as (True, (None, None)).
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT latitude, longitude, found, created_at FROM geocode_cache WHERE query_key = ?',
+                (self._key(query),)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return False, (None, None)
+
+            latitude, longitude, found, created_at = row
+            ttl = self.hit_ttl if found else self.miss_ttl
+            if ttl is not None and time.time() - created_at > ttl:
+                self.misses += 1
+                return False, (None, None)
+
+            self.hits += 1
+            if not found:
+                return True, (None, None)
+            return True, (latitude, longitude)
+
+    def put(self, query, latitude, longitude):
+        """Store an answer; pass None coordinates to record a miss"""
+        with self.lock:
+            found = latitude is not None and longitude is not None
+            self.conn.execute('''
+                INSERT OR REPLACE INTO geocode_cache (query_key, latitude, longitude, found, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (self._key(query), latitude, longitude, int(found), time.time()))
+            self.conn.commit()
+            self.stored += 1
+
+    def purge_expired(self):
+        """Delete entries whose TTL has passed"""
+        with self.lock:
+            now = time.time()
+            if self.miss_ttl is not None:
+                self.conn.execute('DELETE FROM geocode_cache WHERE found = 0 AND created_at < ?',
+                                  (now - self.miss_ttl,))
+            if self.hit_ttl is not None:
+                self.conn.execute('DELETE FROM geocode_cache WHERE found = 1 AND created_at < ?',
+                                  (now - self.hit_ttl,))
+            self.conn.commit()
+
+    def checkpoint(self, run_id, row_key, latitude, longitude):
+        """Record that a row of a run has been processed"""
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO geocode_progress (run_id, row_key, latitude, longitude, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (run_id, row_key, latitude, longitude, time.time()))
+            self.conn.commit()
+
+    def completed_rows(self, run_id):
+        """Return {row_key: (lat, lon)} for rows already processed in a run"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT row_key, latitude, longitude FROM geocode_progress WHERE run_id = ?',
+                (run_id,)
+            ).fetchall()
+            return {row_key: (latitude, longitude) for row_key, latitude, longitude in rows}
+
+    def clear_run(self, run_id):
+        """Forget the checkpoints of a run once it has finished"""
+        with self.lock:
+            self.conn.execute('DELETE FROM geocode_progress WHERE run_id = ?', (run_id,))
+            self.conn.commit()
@@ -0,0 +1,144 @@
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from geocode_cache import normalize_query
+from ingest import read_zips
+from spatial_index import normalize_zip
+
+# Minimal stand-in for geopy's Location; geocode_with_retry only reads these two fields
+Location = namedtuple('Location', ['latitude', 'longitude'])
+
+
+class TokenBucket:
+    """Thread-safe token bucket: sustained `rate` requests/second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        if not float(rate) > 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        if self.rate == float('inf'):
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeocoderBackend:
+    """Interface for geocoding services.
+
+    Backends follow geopy's calling convention so geocode_with_retry works
+    with any of them: geocode(query, timeout=None) takes a free-text string
+    or a structured dict and returns an object with latitude/longitude, or
+    None when nothing was found. Transient failures should raise.
+    `max_rate` is the request rate the service allows, in requests/second.
+    """
+
+    max_rate = 1.0
+
+    def geocode(self, query, timeout=None):
+        raise NotImplementedError
+
+
+class NominatimBackend(GeocoderBackend):
+    """Nominatim through a single reusable geopy client.
+
+    Point `domain` at a self-hosted Nominatim to lift the public server's
+    one request per second limit.
+    """
+
+    def __init__(self, user_agent="my_app", domain=None, scheme=None, max_rate=None):
+        from geopy.geocoders import Nominatim
+
+        kwargs = {'user_agent': user_agent}
+        if domain:
+            kwargs['domain'] = domain
+        if scheme:
+            kwargs['scheme'] = scheme
+        self.client = Nominatim(**kwargs)
+        if max_rate is not None:
+            self.max_rate = max_rate
+        elif domain:
+            self.max_rate = float('inf')
+
+    def geocode(self, query, timeout=None):
+        return self.client.geocode(query, timeout=timeout)
+
+
+class StubBackend(GeocoderBackend):
+    """Offline backend for dry runs and tests.
+
+    Answers queries from an explicit {query: (lat, lon)} mapping, and
+    postal-code queries (or any text ending in a known ZIP) from ZIP
+    centroids. Unknown queries return None, like a real geocoder miss.
+    """
+
+    max_rate = float('inf')
+
+    def __init__(self, answers=None, zip_centroids=None, latency=0.0):
+        self.answers = {normalize_query(q): coords for q, coords in (answers or {}).items()}
+        self.zip_centroids = zip_centroids or {}
+        self.latency = latency
+
+    @classmethod
+    def from_zip_csv(cls, path='data/high-priority-ZIPs-with-clusters.csv', **kwargs):
+        """Answer ZIP lookups from the centroids in one of the ZIP CSVs"""
+        df = read_zips(path, usecols=['ZIP', 'latitude', 'longitude']).dropna()
+        centroids = {normalize_zip(z): (lat, lon) for z, lat, lon in df.itertuples(index=False)}
+        return cls(zip_centroids=centroids, **kwargs)
+
+    def geocode(self, query, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+
+        coords = self.answers.get(normalize_query(query))
+        if coords is None:
+            if isinstance(query, dict):
+                zip_code = query.get('postalcode')
+            else:
+                match = re.search(r'\b(\d{5})\s*$', str(query))
+                zip_code = match.group(1) if match else None
+            if zip_code:
+                coords = self.zip_centroids.get(normalize_zip(zip_code))
+        return Location(*coords) if coords else None
+
+
+class RateLimitedGeocoder:
+    """Wrap a backend so every request first takes a token from a shared bucket"""
+
+    def __init__(self, backend, rate=None, burst=1):
+        self.backend = backend
+        self.bucket = TokenBucket(backend.max_rate if rate is None else rate, burst)
+
+    def geocode(self, query, timeout=None):
+        self.bucket.acquire()
+        return self.backend.geocode(query, timeout=timeout)
+
+
+def geocode_all(tasks, geocode_fn, workers=4):
+    """Run geocode_fn over tasks on a bounded thread pool.
+
+    Yields (task, (lat, lon)) in completion order. Throughput is set by the
+    geocoder's rate limiter, not by the pool size, so the pool only needs to
+    be big enough to keep requests in flight.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(geocode_fn, task): task for task in tasks}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
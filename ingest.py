@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+ZIPS_CSV = 'data/high-priority-ZIPs-with-clusters.csv'
+TARGETS_CSV = 'data/athletic-center-targets-2024-01-02.csv'
+CACHE_DIR = 'data/cache'
+
+ANALYSIS_TYPES = ['A_5mi', 'A_10mi', 'AB_5mi', 'AB_10mi', 'ABC_5mi', 'ABC_10mi', 'BC_5mi', 'BC_10mi']
+
+# Column types. 'zip' is a zero-padded 5 character string and 'number' is
+# numeric text such as '80,725', '$179,146 ' or '250,000+', parsed by
+# clean_number. Columns not listed are read as the schema's default.
+ZIP_SCHEMA = {
+    'ZIP': 'zip',
+    'Geographic Area Name': 'str',
+    'Number HH': 'Int64',
+    'Families with Children <18': 'Int64',
+    'Median Income': 'float64',
+    'Median Family Income': 'number',
+    'Median Family With Children': 'number',
+    'Median Family No Kids': 'number',
+    'Median Married': 'number',
+    'Median Married Kids': 'number',
+    'Media Married No Kids': 'number',
+    'Total Pop': 'Int64',
+    'ZCTA5': 'zip',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'grade': 'category',
+    # Only in the per-analysis CSVs (data/<analysis type>.csv)
+    'cluster_id': 'category',
+    'cluster_grades': 'str',
+    **{f'Cluster_{analysis_type}': 'category' for analysis_type in ANALYSIS_TYPES},
+}
+# Everything else in the ZIP CSVs is a census count, ratio or score
+ZIP_DEFAULT_DTYPE = 'float64'
+
+TARGET_SCHEMA = {
+    'Organization': 'str',
+    'Address': 'str',
+    'Region': 'str',
+    'Phone': 'str',
+    'Website': 'str',
+    'Notes': 'str',
+    'Drive Radius': 'str',
+    'Population': 'number',
+    'Households': 'number',
+    'Household Size': 'float64',
+    'Median HH Income': 'number',
+    'Latitude': 'float64',
+    'Longitude': 'float64',
+    'status': 'str',
+}
+# Columns outside the schema are empty spreadsheet columns ('Unnamed: 11', ...)
+TARGET_DEFAULT_DTYPE = None
+
+
+def clean_number(series):
+    """Parse numbers stored as text such as '80,725' or '$179,146 ' or '250,000+'"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    cleaned = series.astype(str).str.replace(r'[$,+\s]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def resolve_columns(columns, schema, default_dtype, usecols=None):
+    """The source columns to load: usecols (a list or a predicate) over the
+    CSV's columns, minus columns outside the schema when it has no default"""
+    if usecols is None:
+        selected = list(columns)
+    elif callable(usecols):
+        selected = [col for col in columns if usecols(col)]
+    else:
+        missing = set(usecols) - set(columns)
+        if missing:
+            raise ValueError(f"Columns not in the CSV: {', '.join(sorted(missing))}")
+        selected = [col for col in columns if col in set(usecols)]
+    if default_dtype is None:
+        selected = [col for col in selected if col in schema]
+    return selected
+
+
+def parse_csv(path, schema, default_dtype, usecols=None):
+    """Read the CSV with explicit dtypes, then apply the 'zip' and 'number' conversions"""
+    header = pd.read_csv(path, encoding='latin1', nrows=0).columns
+    columns = resolve_columns(header, schema, default_dtype, usecols)
+    read_as = {'zip': 'str', 'number': 'str'}
+    dtype = defaultdict(
+        lambda: default_dtype or 'str',
+        {col: read_as.get(kind, kind) for col, kind in schema.items() if col in columns},
+    )
+    df = pd.read_csv(path, encoding='latin1', usecols=columns, dtype=dtype)
+    for col in df.columns:
+        kind = schema.get(col)
+        if kind == 'zip':
+            df[col] = df[col].str.split('.').str[0].str.strip().str.zfill(5)
+        elif kind == 'number':
+            df[col] = clean_number(df[col])
+    return df
+
+
+def cache_path(path, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, os.path.basename(path) + '.parquet')
+
+
+def source_fingerprint(path, schema, default_dtype):
+    """What a cache file must have been built from: the file's stat and the schema"""
+    stat = os.stat(path)
+    schema_key = json.dumps([schema, default_dtype], sort_keys=True)
+    return {
+        'size': str(stat.st_size),
+        'mtime_ns': str(stat.st_mtime_ns),
+        'schema': hashlib.blake2b(schema_key.encode('utf-8'), digest_size=8).hexdigest(),
+    }
+
+
+def read_cache(path, cached, fingerprint, usecols):
+    """The cached frame, or None when the cache is missing or stale.
+
+    A changed mtime or size alone does not invalidate it: the source is then
+    hashed and compared, so touching or re-saving an unchanged CSV keeps the
+    cache (at the cost of hashing it on each load until the cache is rebuilt).
+    Returns (frame or None, the source hash if it was computed).
+    """
+    if not os.path.exists(cached):
+        return None, None
+    metadata = {k.decode(): v.decode() for k, v in (pq.read_schema(cached).metadata or {}).items()}
+    if metadata.get('schema') != fingerprint['schema']:
+        return None, None
+    source_hash = None
+    if (metadata.get('size'), metadata.get('mtime_ns')) != (fingerprint['size'], fingerprint['mtime_ns']):
+        source_hash = file_hash(path)
+        if metadata.get('hash') != source_hash:
+            return None, source_hash
+    names = pq.read_schema(cached).names
+    columns = [col for col in names if col != '__index_level_0__']
+    columns = resolve_columns(columns, {}, 'any', usecols)
+    return pq.read_table(cached, columns=columns).to_pandas(), source_hash
+
+
+def write_cache(df, cached, fingerprint, source_hash):
+    os.makedirs(os.path.dirname(cached) or '.', exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata.update({k.encode(): v.encode() for k, v in dict(fingerprint, hash=source_hash).items()})
+    # Written under a temporary name so a concurrent reader never sees half a file
+    tmp = f'{cached}.{os.getpid()}.tmp'
+    pq.write_table(table.replace_schema_metadata(metadata), tmp)
+    os.replace(tmp, cached)
+
+
+def read_table(path, schema, default_dtype, usecols=None, cache=True, cache_dir=CACHE_DIR):
+    """Load a CSV as a typed frame, through a Parquet cache of the whole table.
+
+    usecols is a list of columns or a predicate on the column name; with
+    the cache only those columns are read from disk. The cache is rebuilt
+    when the CSV's content or the schema changes, and skipped when pyarrow
+    is not installed.
+    """
+    if not cache or pq is None:
+        return parse_csv(path, schema, default_dtype, usecols)
+
+    cached = cache_path(path, cache_dir)
+    fingerprint = source_fingerprint(path, schema, default_dtype)
+    df, source_hash = read_cache(path, cached, fingerprint, usecols)
+    if df is not None:
+        return df
+
+    full = parse_csv(path, schema, default_dtype)
+    write_cache(full, cached, fingerprint, source_hash or file_hash(path))
+    columns = resolve_columns(full.columns, {}, 'any', usecols)
+    return full[columns]
+
+
+def read_zips(path=ZIPS_CSV, usecols=None, cache=True):
+    """The ZIP CSV, or one of the per-analysis CSVs (data/<analysis type>.csv)"""
+    return read_table(path, ZIP_SCHEMA, ZIP_DEFAULT_DTYPE, usecols, cache)
+
+
+def read_targets(path=TARGETS_CSV, usecols=None, cache=True):
+    """The athletic-center targets CSV"""
+    return read_table(path, TARGET_SCHEMA, TARGET_DEFAULT_DTYPE, usecols, cache)
@@ -1,23 +1,94 @@
 import sqlite3
 import pandas as pd
 import os
+import time
+import argparse
+from catchment import rebuild_catchments
+from cluster_summary import rebuild_cluster_summary
+from db import bump_generation
+from ingest import ANALYSIS_TYPES, clean_number, read_targets, read_zips
+from scoring import SCORE_COLUMNS
 
-def init_database():
-    # Create database file if it doesn't exist
-    db_path = 'data/targets.db'
-    
-    # Create the database directory if it doesn't exist
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    
-    # Connect to database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Drop existing tables if they exist
-    cursor.execute('DROP TABLE IF EXISTS targets')
-    cursor.execute('DROP TABLE IF EXISTS zip_data')
-    cursor.execute('DROP TABLE IF EXISTS activity_log')
-    
+TARGET_COLUMNS = [
+    'organization', 'address', 'region', 'phone', 'website', 'notes', 'drive_radius',
+    'population', 'households', 'median_income', 'latitude', 'longitude', 'status'
+]
+
+# Columns the CSV owns. status, last_updated and activity_log belong to the
+# kanban users and are never overwritten by a sync.
+TARGET_SOURCE_COLUMNS = [col for col in TARGET_COLUMNS if col != 'status']
+
+ZIP_COLUMNS = [
+    'zip_code', 'geographic_area', 'households', 'total_pop', 'median_income',
+    'latitude', 'longitude', 'grade'
+] + [f'cluster_{analysis_type.lower()}' for analysis_type in ANALYSIS_TYPES] + [
+    'families_with_children', 'area_land_sqmi'
+] + SCORE_COLUMNS
+
+# Columns added after the first release, added to older databases by ensure_schema
+ADDED_COLUMNS = {
+    'targets': {'row_hash': 'TEXT'},
+    'zip_data': {
+        'row_hash': 'TEXT',
+        'families_with_children': 'INTEGER',
+        'area_land_sqmi': 'REAL',
+        **{col: 'REAL' for col in SCORE_COLUMNS},
+    },
+    'target_catchment': {'drive_minutes': 'REAL'},
+}
+
+ZIP_CLUSTER_COLUMNS = ['zip_code', 'analysis_type', 'cluster_id']
+
+# Indexes are created after the bulk insert so SQLite builds each one in a
+# single sorted pass instead of maintaining it row by row
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_zip_data_grade ON zip_data(grade)',
+    'CREATE INDEX IF NOT EXISTS idx_targets_status ON targets(status)',
+    'CREATE INDEX IF NOT EXISTS idx_targets_lat_lon ON targets(latitude, longitude)',
+    'CREATE INDEX IF NOT EXISTS idx_zip_cluster_zip_code ON zip_cluster(zip_code)',
+]
+
+# Superseded by zip_cluster; dropped from databases built before it existed
+RETIRED_INDEXES = [
+    f'idx_zip_data_cluster_{analysis_type.lower()}' for analysis_type in ANALYSIS_TYPES
+]
+
+# R*Tree over ZIP centroids keyed by zip_data.rowid, kept in step by triggers
+SPATIAL_INDEX = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS zip_rtree USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS zip_data_rtree_insert AFTER INSERT ON zip_data
+    WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO zip_rtree VALUES (new.rowid, new.latitude, new.latitude, new.longitude, new.longitude);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS zip_data_rtree_update AFTER UPDATE OF latitude, longitude ON zip_data
+    BEGIN
+        DELETE FROM zip_rtree WHERE id = old.rowid;
+        INSERT INTO zip_rtree SELECT new.rowid, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS zip_data_rtree_delete AFTER DELETE ON zip_data
+    BEGIN
+        DELETE FROM zip_rtree WHERE id = old.rowid;
+    END''',
+]
+
+# Durability is traded for speed while loading; a failed load is simply rerun
+FAST_LOAD_PRAGMAS = {'journal_mode': 'MEMORY', 'synchronous': 'OFF'}
+
+STATUS_MAPPING = {
+    'not-contacted': 'not contacted',
+    'initial-contact': 'initial contact',
+    'in-discussion': 'in discussion',
+    'partnership-agreed': 'partnership agreed',
+    'partnership-active': 'partnership active',
+    'not-interested': 'not interested'
+}
+
+def create_schema(cursor):
+    """Create the tables (without secondary indexes)"""
     # Create targets table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS targets (
@@ -34,10 +105,11 @@ def init_database():
         latitude REAL,
         longitude REAL,
         status TEXT DEFAULT 'not contacted',
-        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        row_hash TEXT
     )
     ''')
-    
+
     # Create zip_data table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS zip_data (
@@ -56,10 +128,93 @@ def init_database():
         cluster_abc_5mi TEXT,
         cluster_abc_10mi TEXT,
         cluster_bc_5mi TEXT,
-        cluster_bc_10mi TEXT
+        cluster_bc_10mi TEXT,
+        families_with_children INTEGER,
+        area_land_sqmi REAL,
+        wealth_score REAL,
+        population_score REAL,
+        children_score REAL,
+        area_score REAL,
+        composite_score REAL,
+        row_hash TEXT
     )
     ''')
 
+    # Long-format cluster membership: one row per (analysis, cluster, ZIP).
+    # The primary key makes each analysis type a single range scan, and new
+    # analysis types need no schema change.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS zip_cluster (
+        zip_code TEXT NOT NULL,
+        analysis_type TEXT NOT NULL,
+        cluster_id TEXT NOT NULL,
+        PRIMARY KEY (analysis_type, cluster_id, zip_code)
+    ) WITHOUT ROWID
+    ''')
+
+    # Service-area overlap between ZIPs of the same cluster, see coverage.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS zip_coverage (
+        analysis_type TEXT NOT NULL,
+        zip_code TEXT NOT NULL,
+        neighbor TEXT NOT NULL,
+        overlap_pct REAL NOT NULL,
+        PRIMARY KEY (analysis_type, zip_code, neighbor)
+    ) WITHOUT ROWID
+    ''')
+
+    # Each target's catchment (ZIPs within its drive radius or drive time), aggregated, see catchment.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS target_catchment (
+        organization TEXT PRIMARY KEY,
+        radius_miles REAL,
+        drive_minutes REAL,
+        home_zip TEXT,
+        zip_count INTEGER,
+        total_pop INTEGER,
+        households INTEGER,
+        families_with_children INTEGER,
+        median_income REAL,
+        composite_score REAL,
+        best_grade TEXT,
+        mean_grade TEXT
+    ) WITHOUT ROWID
+    ''')
+
+    # The ZIPs of each target's catchment, see catchment.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS target_catchment_zip (
+        organization TEXT NOT NULL,
+        zip_code TEXT NOT NULL,
+        PRIMARY KEY (organization, zip_code)
+    ) WITHOUT ROWID
+    ''')
+
+    # Materialized per-cluster statistics and hulls, see cluster_summary.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS cluster_summary (
+        analysis_type TEXT NOT NULL,
+        cluster_id TEXT NOT NULL,
+        zip_count INTEGER,
+        total_pop INTEGER,
+        mean_income REAL,
+        centroid_lat REAL,
+        centroid_lon REAL,
+        hull TEXT,
+        source_hash TEXT,
+        PRIMARY KEY (analysis_type, cluster_id)
+    ) WITHOUT ROWID
+    ''')
+
+    # Generation per data scope, bumped by every writer; the server keys its
+    # response cache on it. Never dropped, so generations survive a rebuild.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_version (
+        scope TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
     # Create activity_log table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS activity_log (
@@ -71,111 +226,338 @@ def init_database():
         FOREIGN KEY (organization) REFERENCES targets(organization)
     )
     ''')
-    
-    # Load and process targets data
-    targets_df = pd.read_csv('data/athletic-center-targets-2024-01-02.csv', encoding='latin1')
-    
-    # Clean up the data
-    targets_df['Population'] = targets_df['Population'].str.replace(',', '').astype(float).astype(int)
-    targets_df['Households'] = targets_df['Households'].str.replace(',', '').astype(float).astype(int)
-    targets_df['Household Size'] = targets_df['Household Size'].astype(float)
-    
-    # Handle income with '+' symbol
-    targets_df['Median HH Income'] = targets_df['Median HH Income'].str.replace('$', '').str.replace(',', '').str.replace('+', '').str.strip().astype(float).astype(int)
-    
-    # Add status column if it doesn't exist
-    if 'status' not in targets_df.columns:
-        targets_df['status'] = 'not contacted'  # Changed from 'not-contacted' to match kanban
-    
+
+def ensure_schema(conn):
+    """Bring an existing database up to the current schema without losing data"""
+    cursor = conn.cursor()
+    create_schema(cursor)
+    for table, added in ADDED_COLUMNS.items():
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+        for col, col_type in added.items():
+            if col not in columns:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {col} {col_type}')
+    create_indexes(cursor)
+    migrate_wide_clusters(cursor)
+    conn.commit()
+    if not cursor.execute('SELECT 1 FROM cluster_summary LIMIT 1').fetchone():
+        rebuild_cluster_summary(conn)
+
+def migrate_wide_clusters(cursor):
+    """Fill an empty zip_cluster table from the wide cluster_* columns of zip_data"""
+    if cursor.execute('SELECT 1 FROM zip_cluster LIMIT 1').fetchone():
+        return
+    for analysis_type in ANALYSIS_TYPES:
+        col = f'cluster_{analysis_type.lower()}'
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO zip_cluster (zip_code, analysis_type, cluster_id)
+            SELECT zip_code, ?, {col} FROM zip_data WHERE {col} IS NOT NULL
+        ''', (analysis_type.lower(),))
+
+def create_indexes(cursor):
+    """Create secondary indexes and the spatial index; run after the tables are loaded"""
+    for statement in INDEXES:
+        cursor.execute(statement)
+    for name in RETIRED_INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+    rtree_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'zip_rtree'"
+    ).fetchone()
+    for statement in SPATIAL_INDEX:
+        cursor.execute(statement)
+    if not rtree_exists:
+        rebuild_spatial_index(cursor)
+
+def rebuild_spatial_index(cursor):
+    """Repopulate zip_rtree from zip_data in one pass"""
+    cursor.execute('DELETE FROM zip_rtree')
+    cursor.execute('''
+        INSERT INTO zip_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT rowid, latitude, latitude, longitude, longitude
+        FROM zip_data
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''')
+
+def resolve_cluster_columns(columns):
+    """Map each analysis type to its cluster column in the CSV (or None)
+
+    Prefer the exact Cluster_<type> column: a substring match alone would
+    pick Cluster_ABC_5mi for BC_5mi.
+    """
+    resolved = {}
+    for analysis_type in ANALYSIS_TYPES:
+        exact = f'Cluster_{analysis_type}'
+        matching_cols = [col for col in columns if col == exact] or \
+                        [col for col in columns if col.endswith(f'_{analysis_type}')]
+        resolved[analysis_type] = matching_cols[0] if matching_cols else None
+    return resolved
+
+def cluster_columns(columns):
+    """Map every analysis type found in the CSV (Cluster_<type> columns) to its column"""
+    return {col[len('Cluster_'):].lower(): col for col in columns if col.startswith('Cluster_')}
+
+def to_rows(df):
+    """Convert a frame to a list of tuples of plain Python values for sqlite3"""
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+def with_row_hash(df, columns):
+    """Add a row_hash column: a content hash of `columns` for each row"""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False)
+    return df.assign(row_hash=hashes.map('{:016x}'.format).to_numpy())
+
+def prepare_targets(targets_df):
+    """Clean the targets CSV into rows matching TARGET_COLUMNS"""
+    out = pd.DataFrame({
+        'organization': targets_df['Organization'],
+        'address': targets_df['Address'],
+        'region': targets_df['Region'],
+        'phone': targets_df['Phone'],
+        'website': targets_df['Website'],
+        'notes': targets_df['Notes'],
+        'drive_radius': targets_df['Drive Radius'],
+        'population': clean_number(targets_df['Population']).round().astype('Int64'),
+        'households': clean_number(targets_df['Households']).round().astype('Int64'),
+        'median_income': clean_number(targets_df['Median HH Income']).round().astype('Int64'),
+        'latitude': targets_df['Latitude'],
+        'longitude': targets_df['Longitude'],
+    })
+
     # Clean up any existing statuses to match kanban format
-    status_mapping = {
-        'not-contacted': 'not contacted',
-        'initial-contact': 'initial contact',
-        'in-discussion': 'in discussion',
-        'partnership-agreed': 'partnership agreed',
-        'partnership-active': 'partnership active',
-        'not-interested': 'not interested'
-    }
-    
-    targets_df['status'] = targets_df['status'].map(status_mapping).fillna('not contacted')
-    
-    # Insert targets data
-    for _, row in targets_df.iterrows():
-        cursor.execute('''
-        INSERT OR REPLACE INTO targets (
-            organization, address, region, phone, website, notes, drive_radius,
-            population, households, median_income, latitude, longitude, status
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            row['Organization'],
-            row['Address'],
-            row['Region'],
-            row['Phone'],
-            row['Website'],
-            row['Notes'],
-            row['Drive Radius'],
-            row['Population'],
-            row['Households'],
-            row['Median HH Income'],
-            row['Latitude'],
-            row['Longitude'],
-            row.get('status', 'not contacted')
-        ))
-    
-    # Load and process ZIP data
-    zips_df = pd.read_csv('data/high-priority-ZIPs-with-clusters.csv', encoding='latin1')
-    
-    # Clean up the data
-    zips_df['Number HH'] = zips_df['Number HH'].astype(int)
-    zips_df['ZCTA5'] = zips_df['ZIP'].astype(str).str.zfill(5)
+    if 'status' in targets_df.columns:
+        out['status'] = targets_df['status'].map(STATUS_MAPPING).fillna('not contacted')
+    else:
+        out['status'] = 'not contacted'
+    out = out.drop_duplicates('organization', keep='last')
+    return with_row_hash(out[TARGET_COLUMNS], TARGET_SOURCE_COLUMNS)
+
+def zip_source_column(col):
+    """usecols filter: only parse the ZIP CSV columns the loader needs"""
+    return (col in ('ZIP', 'Geographic Area Name', 'Number HH', 'Total Pop', 'latitude', 'longitude', 'grade',
+                    'Families with Children <18', 'area_land_sqmi')
+            or col in SCORE_COLUMNS
+            or col.startswith('Median') or col.startswith('Cluster_')
+            or any(analysis_type in col for analysis_type in ANALYSIS_TYPES))
+
+def prepare_zip_data(zips_df):
+    """Clean the ZIP CSV into rows matching ZIP_COLUMNS"""
     median_income_col = [col for col in zips_df.columns if 'Median' in col][0]
-    zips_df[median_income_col] = zips_df[median_income_col].astype(float)
-    
-    # Extract cluster information
-    analysis_types = ['A_5mi', 'A_10mi', 'AB_5mi', 'AB_10mi', 'ABC_5mi', 'ABC_10mi', 'BC_5mi', 'BC_10mi']
-    
-    # Insert ZIP data
-    for _, row in zips_df.iterrows():
-        # Get cluster values for each analysis type
-        cluster_values = {}
-        for analysis_type in analysis_types:
-            matching_cols = [col for col in zips_df.columns if analysis_type in col]
-            if matching_cols:
-                cluster_values[f'cluster_{analysis_type.lower()}'] = row[matching_cols[0]]
-            else:
-                cluster_values[f'cluster_{analysis_type.lower()}'] = None
-
-        cursor.execute('''
-        INSERT OR REPLACE INTO zip_data (
-            zip_code, geographic_area, households, total_pop, median_income,
-            latitude, longitude, grade,
-            cluster_a_5mi, cluster_a_10mi, cluster_ab_5mi, cluster_ab_10mi,
-            cluster_abc_5mi, cluster_abc_10mi, cluster_bc_5mi, cluster_bc_10mi
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            row['ZCTA5'],
-            row['Geographic Area Name'],
-            row['Number HH'],
-            row['Total Pop'] if 'Total Pop' in row else None,
-            row[median_income_col],
-            row['latitude'],
-            row['longitude'],
-            row.get('grade', 'Ungraded'),
-            cluster_values['cluster_a_5mi'],
-            cluster_values['cluster_a_10mi'],
-            cluster_values['cluster_ab_5mi'],
-            cluster_values['cluster_ab_10mi'],
-            cluster_values['cluster_abc_5mi'],
-            cluster_values['cluster_abc_10mi'],
-            cluster_values['cluster_bc_5mi'],
-            cluster_values['cluster_bc_10mi']
-        ))
-    
-    # Commit changes and close connection
+    cluster_cols = resolve_cluster_columns(zips_df.columns)
+
+    out = pd.DataFrame({
+        'zip_code': zips_df['ZIP'].astype(str).str.zfill(5),
+        'geographic_area': zips_df['Geographic Area Name'],
+        'households': clean_number(zips_df['Number HH']).round().astype('Int64'),
+        'total_pop': clean_number(zips_df['Total Pop']).round().astype('Int64') if 'Total Pop' in zips_df else None,
+        'median_income': clean_number(zips_df[median_income_col]),
+        'latitude': zips_df['latitude'],
+        'longitude': zips_df['longitude'],
+        'grade': zips_df['grade'] if 'grade' in zips_df else 'Ungraded',
+    })
+    for analysis_type, col in cluster_cols.items():
+        out[f'cluster_{analysis_type.lower()}'] = zips_df[col] if col else None
+    families_col = 'Families with Children <18'
+    out['families_with_children'] = (clean_number(zips_df[families_col]).round().astype('Int64')
+                                     if families_col in zips_df else None)
+    out['area_land_sqmi'] = zips_df['area_land_sqmi'] if 'area_land_sqmi' in zips_df else None
+    # Scores as delivered in the CSV; scoring.py recomputes them from the inputs
+    for col in SCORE_COLUMNS:
+        out[col] = zips_df[col] if col in zips_df else None
+    out = out.drop_duplicates('zip_code', keep='last')
+    return with_row_hash(out[ZIP_COLUMNS], ZIP_COLUMNS)
+
+def prepare_zip_clusters(zips_df):
+    """Melt the Cluster_<type> columns into (zip_code, analysis_type, cluster_id) rows"""
+    columns = cluster_columns(zips_df.columns)
+    if not columns:
+        return pd.DataFrame(columns=ZIP_CLUSTER_COLUMNS)
+    wide = zips_df[list(columns.values())].rename(columns={col: t for t, col in columns.items()})
+    wide.insert(0, 'zip_code', zips_df['ZIP'].astype(str).str.zfill(5))
+    long = wide.melt(id_vars='zip_code', var_name='analysis_type', value_name='cluster_id')
+    long = long.dropna(subset=['cluster_id']).drop_duplicates(['analysis_type', 'cluster_id', 'zip_code'])
+    return long[ZIP_CLUSTER_COLUMNS]
+
+def sync_zip_clusters(conn, clusters_df, zip_codes, delete_missing=True):
+    """Apply the difference between clusters_df and zip_cluster; return (inserted, deleted)
+
+    zip_codes are the ZIPs present in the source CSV; memberships of other
+    ZIPs are only removed when delete_missing is set.
+    """
+    existing = set(conn.execute('SELECT zip_code, analysis_type, cluster_id FROM zip_cluster').fetchall())
+    incoming = set(clusters_df.itertuples(index=False, name=None))
+    added = sorted(incoming - existing)
+    removed = sorted(existing - incoming)
+    if not delete_missing:
+        zip_codes = set(zip_codes)
+        removed = [row for row in removed if row[0] in zip_codes]
+    bulk_execute(conn, 'DELETE FROM zip_cluster WHERE zip_code = ? AND analysis_type = ? AND cluster_id = ?', removed)
+    bulk_insert(conn, 'zip_cluster', ZIP_CLUSTER_COLUMNS, added)
+    return len(added), len(removed)
+
+def bulk_insert(conn, table, columns, rows, chunk_size=5000):
+    """Insert rows with executemany, one transaction per chunk"""
+    placeholders = ', '.join('?' for _ in columns)
+    sql = f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) VALUES ({placeholders})'
+    bulk_execute(conn, sql, rows, chunk_size)
+
+def bulk_execute(conn, sql, rows, chunk_size=5000):
+    """Run one statement over many rows, one transaction per chunk"""
+    for start in range(0, len(rows), chunk_size):
+        with conn:
+            conn.executemany(sql, rows[start:start + chunk_size])
+
+def set_pragmas(conn, pragmas):
+    """Apply PRAGMAs and return their previous values so they can be restored"""
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.execute(f'PRAGMA {name}').fetchone()[0]
+        conn.execute(f'PRAGMA {name} = {value}')
+    return previous
+
+def init_database(db_path='data/targets.db',
+                  targets_csv='data/athletic-center-targets-2024-01-02.csv',
+                  zips_csv='data/high-priority-ZIPs-with-clusters.csv',
+                  fast=True):
+    # Create the database directory if it doesn't exist
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+    # Connect to database
+    conn = sqlite3.connect(db_path)
+    previous_pragmas = set_pragmas(conn, FAST_LOAD_PRAGMAS) if fast else {}
+    cursor = conn.cursor()
+
+    # Drop existing tables if they exist
+    cursor.execute('DROP TABLE IF EXISTS targets')
+    cursor.execute('DROP TABLE IF EXISTS zip_data')
+    cursor.execute('DROP TABLE IF EXISTS activity_log')
+    cursor.execute('DROP TABLE IF EXISTS zip_rtree')
+    cursor.execute('DROP TABLE IF EXISTS zip_cluster')
+    cursor.execute('DROP TABLE IF EXISTS cluster_summary')
+    cursor.execute('DROP TABLE IF EXISTS zip_coverage')
+    cursor.execute('DROP TABLE IF EXISTS target_catchment')
+    cursor.execute('DROP TABLE IF EXISTS target_catchment_zip')
+    create_schema(cursor)
     conn.commit()
+
+    # Load and process targets data
+    start = time.perf_counter()
+    targets_rows = to_rows(prepare_targets(read_targets(targets_csv)))
+    bulk_insert(conn, 'targets', TARGET_COLUMNS + ['row_hash'], targets_rows)
+
+    # Load and process ZIP data
+    zips_df = read_zips(zips_csv, usecols=zip_source_column)
+    zip_rows = to_rows(prepare_zip_data(zips_df))
+    bulk_insert(conn, 'zip_data', ZIP_COLUMNS + ['row_hash'], zip_rows)
+    cluster_rows = to_rows(prepare_zip_clusters(zips_df))
+    bulk_insert(conn, 'zip_cluster', ZIP_CLUSTER_COLUMNS, cluster_rows)
+
+    create_indexes(cursor)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    rebuild_cluster_summary(conn, full=True)
+    rebuild_catchments(conn)
+    with conn:
+        bump_generation(conn)
+
+    set_pragmas(conn, previous_pragmas)
     conn.close()
-    
+
+    total_rows = len(targets_rows) + len(zip_rows) + len(cluster_rows)
+    print(f"Loaded {len(targets_rows)} targets, {len(zip_rows)} ZIPs and {len(cluster_rows)} cluster memberships "
+          f"in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/s)")
     print("Database initialized successfully!")
+    return total_rows, elapsed
+
+def sync_table(conn, table, key, frame, update_columns, delete_missing=True):
+    """Upsert new and changed rows of `frame` into `table` by row_hash.
+
+    Only update_columns (plus row_hash) are overwritten on existing rows.
+    Rows in the table whose key is no longer in the frame are deleted when
+    delete_missing is set. Returns (stats, changed_keys, deleted_keys).
+    """
+    existing = dict(conn.execute(f'SELECT {key}, row_hash FROM {table}').fetchall())
+    stored_hash = frame[key].map(existing)
+    is_new = stored_hash.isna() & ~frame[key].isin(existing.keys())
+    is_changed = ~is_new & (stored_hash != frame['row_hash'])
+    upserts = frame[is_new | is_changed]
+
+    columns = list(frame.columns)
+    assignments = ', '.join(f'{col} = excluded.{col}' for col in update_columns + ['row_hash'])
+    sql = f'''
+        INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join('?' for _ in columns)})
+        ON CONFLICT({key}) DO UPDATE SET {assignments}
+    '''
+    bulk_execute(conn, sql, to_rows(upserts))
+
+    deleted_keys = sorted(set(existing) - set(frame[key]))
+    if deleted_keys and delete_missing:
+        bulk_execute(conn, f'DELETE FROM {table} WHERE {key} = ?', [(k,) for k in deleted_keys])
+
+    stats = {
+        'inserted': int(is_new.sum()),
+        'updated': int(is_changed.sum()),
+        'deleted': len(deleted_keys) if delete_missing else 0,
+        'unchanged': int(len(frame) - is_new.sum() - is_changed.sum()),
+    }
+    return stats, list(upserts[key]), deleted_keys if delete_missing else []
+
+def sync_database(db_path='data/targets.db',
+                  targets_csv='data/athletic-center-targets-2024-01-02.csv',
+                  zips_csv='data/high-priority-ZIPs-with-clusters.csv',
+                  delete_missing=True):
+    """Incrementally bring the database in line with the CSVs.
+
+    Unlike init_database nothing is dropped: kanban status, last_updated and
+    the activity log survive, and only rows whose content changed are written.
+    """
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    ensure_schema(conn)
+
+    start = time.perf_counter()
+    targets_df = prepare_targets(read_targets(targets_csv))
+    target_stats, _, deleted_targets = sync_table(
+        conn, 'targets', 'organization', targets_df, TARGET_SOURCE_COLUMNS, delete_missing)
+
+    raw_zips_df = read_zips(zips_csv, usecols=zip_source_column)
+    zips_df = prepare_zip_data(raw_zips_df)
+    zip_stats, _, _ = sync_table(
+        conn, 'zip_data', 'zip_code', zips_df, [col for col in ZIP_COLUMNS if col != 'zip_code'], delete_missing)
+    clusters_added, clusters_removed = sync_zip_clusters(
+        conn, prepare_zip_clusters(raw_zips_df), zips_df['zip_code'], delete_missing)
+    summaries_updated, summaries_removed = rebuild_cluster_summary(conn)
+    catchments_updated, catchments_removed = rebuild_catchments(conn)
+
+    changed_scopes = []
+    if any(target_stats[k] for k in ('inserted', 'updated', 'deleted')) or catchments_updated or catchments_removed:
+        changed_scopes.append('targets')
+    if (any(zip_stats[k] for k in ('inserted', 'updated', 'deleted'))
+            or clusters_added or clusters_removed or summaries_updated or summaries_removed):
+        changed_scopes.append('zips')
+    if changed_scopes:
+        with conn:
+            bump_generation(conn, *changed_scopes)
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    for table, stats in (('targets', target_stats), ('zip_data', zip_stats)):
+        print(f"{table}: {stats['inserted']} inserted, {stats['updated']} updated, "
+              f"{stats['deleted']} deleted, {stats['unchanged']} unchanged")
+    print(f"zip_cluster: {clusters_added} memberships added, {clusters_removed} removed")
+    for organization in deleted_targets:
+        print(f"Removed target no longer in CSV (activity history kept): {organization}")
+    print(f"Database synced in {elapsed:.2f}s")
+    return {'targets': target_stats, 'zip_data': zip_stats}
 
 if __name__ == "__main__":
-    init_database()
+    parser = argparse.ArgumentParser(description="Load the CSVs into data/targets.db")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="drop and reload every table (wipes kanban status and activity history)")
+    parser.add_argument('--keep-missing', action='store_true',
+                        help="when syncing, keep rows that are no longer in the CSVs")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        init_database()
+    else:
+        sync_database(delete_missing=not args.keep_missing)
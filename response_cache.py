@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first; brotli is only offered when the package is installed
+ENCODINGS = (['br'] if brotli is not None else []) + ['gzip']
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=9)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+class CachedBody:
+    """A serialized response body with lazily built compressed variants"""
+
+    def __init__(self, body, headers=None, mimetype='application/json'):
+        self.body = body
+        self.headers = headers or {}
+        self.mimetype = mimetype
+        self.digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def etag(self, encoding=None):
+        # Each content-coding is a different representation, so it gets its own strong tag
+        return self.digest if encoding is None else f'{self.digest}-{encoding}'
+
+    def encoded(self, encoding):
+        with self._lock:
+            if encoding not in self._encoded:
+                self._encoded[encoding] = compress(self.body, encoding)
+            return self._encoded[encoding]
+
+    def matches(self, if_none_match):
+        if if_none_match.star_tag:
+            return True
+        return any(if_none_match.contains(self.etag(encoding)) for encoding in [None] + ENCODINGS)
+
+class ResponseCache:
+    """Serialized API responses keyed by route and query, valid for one data generation.
+
+    Viewport queries make the key space open-ended, so the least recently
+    used entries are dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation, build, encode=None):
+        """Cached body for key at this generation.
+
+        On a miss build() returns the payload, or (payload, headers) for
+        responses that carry extra headers such as a pagination cursor.
+        The payload is serialized as JSON unless encode(payload) is given
+        to return (body, mimetype).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+        payload = build()
+        payload, headers = payload if isinstance(payload, tuple) else (payload, None)
+        if encode is None:
+            body, mimetype = json.dumps(payload, separators=(',', ':')).encode('utf-8'), 'application/json'
+        else:
+            body, mimetype = encode(payload)
+        cached = CachedBody(body, headers, mimetype)
+        with self._lock:
+            self.misses += 1
+            # Only the latest generation is kept per key
+            self._entries[key] = (generation, cached)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def make_response(cached, request):
+    """304 when the client's ETag still matches, else the best encoding it accepts"""
+    if cached.matches(request.if_none_match):
+        response = Response(status=304)
+        response.set_etag(cached.etag(pick_encoding(request)))
+    else:
+        encoding = pick_encoding(request)
+        body = cached.body if encoding is None else cached.encoded(encoding)
+        response = Response(body, mimetype=cached.mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(cached.etag(encoding))
+    response.headers.update(cached.headers)
+    # Always revalidate: a repeat load costs one round trip and an empty 304
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+def pick_encoding(request):
+    for encoding in ENCODINGS:
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
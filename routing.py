@@ -0,0 +1,314 @@
+import argparse
+import bz2
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+import db
+from ingest import CACHE_DIR, file_hash
+from spatial_index import KM_PER_MILE, ZipSpatialIndex, chord_to_km, haversine_km, to_unit_vectors
+
+ISOCHRONE_CACHE_PATH = 'data/isochrone_cache.db'
+# Bump when the graph build or the isochrone rules change
+ROUTING_VERSION = 3
+
+# Free-flow speed by OSM highway type, km/h, used when a way has no maxspeed
+HIGHWAY_SPEEDS = {
+    'motorway': 105, 'motorway_link': 60,
+    'trunk': 90, 'trunk_link': 50,
+    'primary': 65, 'primary_link': 45,
+    'secondary': 55, 'secondary_link': 40,
+    'tertiary': 45, 'tertiary_link': 35,
+    'unclassified': 40, 'residential': 30,
+    'living_street': 10, 'service': 15,
+}
+
+# A target starts from its nearest few road nodes, so a snap onto a one-way
+# or dead-end street doesn't strand it
+SNAP_NODES = 3
+# Speed for the straight-line legs between a target or ZIP centroid and the
+# road nodes it snaps to
+ACCESS_SPEED_KMH = 25
+# Origins per Dijkstra call; each holds a row of times over the whole graph
+ISOCHRONE_BATCH = 16
+
+
+def open_extract(path):
+    """Open an OSM XML extract, optionally .gz or .bz2 compressed"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def way_speed(tags):
+    """km/h for a way: its maxspeed ('50', '35 mph') or the highway type's speed"""
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', tags.get('maxspeed', ''))
+    if match:
+        return float(match.group(1)) * (KM_PER_MILE if match.group(2) else 1)
+    return HIGHWAY_SPEEDS[tags['highway']]
+
+
+def parse_osm(path):
+    """Read the drivable ways of an OSM XML extract in one streaming pass.
+
+    Returns (node ids, latitudes, longitudes, edges) where edges is an
+    (m, 3) array of (from node id, to node id, km/h), both directions
+    for two-way roads. Nodes come before ways in OSM files, so all node
+    coordinates are kept; unused ones are dropped when the graph is built.
+    """
+    node_ids, latitudes, longitudes = [], [], []
+    edges = []
+    with open_extract(path) as f:
+        for _, elem in ET.iterparse(f, events=('end',)):
+            if elem.tag == 'node':
+                node_ids.append(int(elem.get('id')))
+                latitudes.append(float(elem.get('lat')))
+                longitudes.append(float(elem.get('lon')))
+                elem.clear()
+            elif elem.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+                if tags.get('highway') in HIGHWAY_SPEEDS and tags.get('access') not in ('no', 'private'):
+                    refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                    speed = way_speed(tags)
+                    oneway = tags.get('oneway')
+                    if oneway == '-1':
+                        refs = refs[::-1]
+                    for a, b in zip(refs, refs[1:]):
+                        edges.append((a, b, speed))
+                        if oneway not in ('yes', 'true', '1', '-1') and tags['highway'] != 'motorway':
+                            edges.append((b, a, speed))
+                elem.clear()
+    return (np.array(node_ids, dtype=np.int64), np.array(latitudes), np.array(longitudes),
+            np.array(edges, dtype=float).reshape(-1, 3))
+
+
+class RoadGraph:
+    """Drive-time graph of an OSM extract: CSR adjacency with edge weights in
+    seconds, over the road nodes only, plus a spatial index of those nodes.
+
+    Build it with from_osm(), which caches the arrays next to the ingest
+    cache so later loads skip the XML parse.
+    """
+
+    def __init__(self, latitudes, longitudes, indptr, indices, seconds, key):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.graph = csr_matrix((seconds, indices, indptr), shape=(len(latitudes), len(latitudes)))
+        self.key = key
+        self.tree = cKDTree(to_unit_vectors(latitudes, longitudes))
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @classmethod
+    def build(cls, node_ids, latitudes, longitudes, edges, key):
+        """Keep the nodes that some edge uses and weight each edge by its travel time"""
+        # Ways clipped at the extract's edge reference nodes it doesn't contain
+        ends = edges[:, :2].astype(np.int64)
+        edges = edges[np.isin(ends, node_ids).all(axis=1)]
+        used, inverse = np.unique(edges[:, :2].astype(np.int64), return_inverse=True)
+        inverse = inverse.reshape(-1, 2)
+        sorter = np.argsort(node_ids)
+        order = sorter[np.searchsorted(node_ids, used, sorter=sorter)]
+        lat, lon = latitudes[order], longitudes[order]
+
+        a, b = inverse[:, 0], inverse[:, 1]
+        km = haversine_km(lat[a], lon[a], lat[b], lon[b])
+        # A zero weight would read as no edge
+        seconds = np.maximum(km / edges[:, 2] * 3600, 1e-3)
+        # Parallel ways between two nodes keep the fastest
+        fastest = pd.DataFrame({'a': a, 'b': b, 's': seconds}).groupby(['a', 'b'])['s'].min()
+        graph = csr_matrix(
+            (fastest.to_numpy(), (fastest.index.get_level_values(0), fastest.index.get_level_values(1))),
+            shape=(len(used), len(used)),
+        )
+        return cls(lat, lon, graph.indptr, graph.indices, graph.data, key)
+
+    @classmethod
+    def from_osm(cls, path, cache_dir=CACHE_DIR):
+        """Load the graph of an OSM extract, from the .npz cache when the extract is unchanged"""
+        key = hashlib.blake2b(f'{file_hash(path)}|{ROUTING_VERSION}'.encode(), digest_size=8).hexdigest()
+        cached = os.path.join(cache_dir, f'{os.path.basename(path)}.{key}.graph.npz')
+        if os.path.exists(cached):
+            arrays = np.load(cached)
+            return cls(arrays['latitudes'], arrays['longitudes'], arrays['indptr'], arrays['indices'],
+                       arrays['seconds'], key)
+
+        road_graph = cls.build(*parse_osm(path), key)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{cached}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, latitudes=road_graph.latitudes, longitudes=road_graph.longitudes,
+                 indptr=road_graph.graph.indptr, indices=road_graph.graph.indices, seconds=road_graph.graph.data)
+        os.replace(tmp, cached)
+        return road_graph
+
+    def snap(self, latitudes, longitudes, k=1):
+        """(distances_km, node positions) of the k nearest road nodes, shaped (n, k)"""
+        chord, nodes = self.tree.query(to_unit_vectors(latitudes, longitudes), k=min(k, len(self)))
+        return chord_to_km(chord).reshape(len(nodes), -1), np.asarray(nodes).reshape(len(nodes), -1)
+
+    def isochrones(self, latitudes, longitudes, minutes, zip_index):
+        """For each origin, the positions in zip_index of the ZIPs reachable
+        within minutes of driving, or None when no road node is.
+
+        Each origin becomes a virtual node with an edge to each of its
+        nearest road nodes, weighted by the straight leg to it at
+        ACCESS_SPEED_KMH, so one Dijkstra from the virtual node, cut off at
+        the time budget, covers every snapped node with its access time
+        charged. Nodes the origin can't reach in time get no edge, and an
+        origin left without any, such as one off the extract, gets None.
+        A ZIP is reachable when its
+        centroid's nearest road node is, counting the leg from that node to
+        the centroid the same way.
+        """
+        budget = minutes * 60
+        zip_km, zip_nodes = self.snap(zip_index.latitudes, zip_index.longitudes)
+        zip_access = zip_km[:, 0] / ACCESS_SPEED_KMH * 3600
+        zip_nodes = zip_nodes[:, 0]
+        origin_km, origins = self.snap(latitudes, longitudes, k=SNAP_NODES)
+        origin_access = origin_km / ACCESS_SPEED_KMH * 3600
+
+        n = len(self)
+        virtual, k = np.nonzero(origin_access <= budget)
+        graph = self.graph.tocoo()
+        graph = csr_matrix(
+            (np.concatenate([graph.data, np.maximum(origin_access[virtual, k], 1e-3)]),
+             (np.concatenate([graph.row, n + virtual]), np.concatenate([graph.col, origins[virtual, k]]))),
+            shape=(n + len(origins), n + len(origins)))
+
+        routed = np.zeros(len(origins), dtype=bool)
+        routed[virtual] = True
+        reachable = []
+        # Batches bound the dense (batch, nodes) distance matrix
+        for start in range(0, len(origins), ISOCHRONE_BATCH):
+            sources = n + np.arange(start, min(start + ISOCHRONE_BATCH, len(origins)))
+            times = dijkstra(graph, indices=sources, limit=budget).reshape(len(sources), -1)
+            reachable.extend(np.flatnonzero(row[zip_nodes] + zip_access <= budget) if routed[i] else None
+                             for i, row in zip(range(start, start + len(sources)), times))
+        return reachable
+
+
+class IsochroneCache:
+    """ZIP sets of past isochrones in SQLite, keyed by graph, ZIP centroids,
+    target (name and coordinates) and time budget"""
+
+    def __init__(self, db_path=ISOCHRONE_CACHE_PATH):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS isochrones (
+            graph_key TEXT NOT NULL,
+            target_key TEXT NOT NULL,
+            minutes REAL NOT NULL,
+            zip_codes TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (graph_key, target_key, minutes)
+        ) WITHOUT ROWID
+        ''')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, graph_key, target_keys, minutes):
+        rows = self.conn.execute(
+            'SELECT target_key, zip_codes FROM isochrones WHERE graph_key = ? AND minutes = ?', (graph_key, minutes)
+        ).fetchall()
+        wanted = set(target_keys)
+        return {key: zip_codes.split(',') if zip_codes else [] for key, zip_codes in rows if key in wanted}
+
+    def put_many(self, graph_key, minutes, zip_sets):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO isochrones VALUES (?, ?, ?, ?, ?)',
+                [(graph_key, key, minutes, ','.join(zip_codes), now) for key, zip_codes in zip_sets.items()]
+            )
+
+
+def target_key(organization, latitude, longitude):
+    return f'{organization}|{latitude:.6f},{longitude:.6f}'
+
+
+def zip_set_key(road_graph, zip_index):
+    """The cache namespace: the graph plus the ZIP centroids it was matched against"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(road_graph.key.encode())
+    digest.update(np.asarray(zip_index.zip_codes, dtype=str).tobytes())
+    digest.update(np.round(np.column_stack([zip_index.latitudes, zip_index.longitudes]), 6).tobytes())
+    return digest.hexdigest()
+
+
+def target_isochrones(targets, road_graph, zip_index, minutes, cache=None):
+    """{organization: [ZIP codes reachable within minutes]} for the targets
+    frame (organization, latitude, longitude), computing only cache misses.
+    Targets with no road node within minutes are left out, and not cached,
+    so callers fall back to their drive radius."""
+    keys = [target_key(*row) for row in targets[['organization', 'latitude', 'longitude']].itertuples(index=False)]
+    graph_key = zip_set_key(road_graph, zip_index)
+    found = cache.get_many(graph_key, keys, minutes) if cache else {}
+
+    missing = [i for i, key in enumerate(keys) if key not in found]
+    if missing:
+        rows = targets.iloc[missing]
+        reachable = road_graph.isochrones(rows['latitude'], rows['longitude'], minutes, zip_index)
+        computed = {keys[i]: list(zip_index.zip_codes[positions])
+                    for i, positions in zip(missing, reachable) if positions is not None}
+        if cache:
+            cache.put_many(graph_key, minutes, computed)
+        found.update(computed)
+    return {organization: found[key] for organization, key in zip(targets['organization'], keys) if key in found}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive-time isochrones of the targets over a local OSM extract")
+    parser.add_argument('osm', help="OSM XML extract (.osm, .osm.gz or .osm.bz2)")
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('--minutes', type=float, default=15)
+    parser.add_argument('--cache', default=ISOCHRONE_CACHE_PATH)
+    parser.add_argument('--no-cache', action='store_true', help="recompute every isochrone")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    road_graph = RoadGraph.from_osm(args.osm)
+    print(f"Road graph: {len(road_graph)} nodes, {road_graph.graph.nnz} edges in {time.perf_counter() - start:.2f}s")
+
+    conn = db.connect(args.db)
+    try:
+        targets = pd.read_sql_query(
+            'SELECT organization, latitude, longitude FROM targets WHERE latitude IS NOT NULL', conn)
+        zip_index = ZipSpatialIndex.from_db(conn)
+    finally:
+        conn.close()
+
+    cache = None if args.no_cache else IsochroneCache(args.cache)
+    start = time.perf_counter()
+    zip_sets = target_isochrones(targets, road_graph, zip_index, args.minutes, cache)
+    print(f"Isochrones for {len(zip_sets)} targets ({args.minutes:g} min) in {time.perf_counter() - start:.2f}s")
+    for organization, zip_codes in list(zip_sets.items())[:10]:
+        print(f"  {organization}: {len(zip_codes)} ZIPs")
+    off_graph = [organization for organization in targets['organization'] if organization not in zip_sets]
+    if off_graph:
+        print(f"{len(off_graph)} targets are outside the extract or too far from a road, "
+              f"e.g. {', '.join(off_graph[:3])}")
+    unreached = [organization for organization, zip_codes in zip_sets.items() if not zip_codes]
+    if unreached:
+        print(f"{len(unreached)} targets reach a road but no ZIP centroid, e.g. {', '.join(unreached[:3])}")
+    if cache:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+
+# Component score name -> (zip_data input column, whether larger inputs score lower).
+# Each input is min-max scaled over the ZIPs that have every input.
+COMPONENTS = {
+    'wealth': ('median_income', False),
+    'population': ('total_pop', False),
+    'children': ('families_with_children', False),
+    # Compact ZIPs are easier to serve, so land area counts against a ZIP
+    'area': ('area_land_sqmi', True),
+}
+INPUT_COLUMNS = [col for col, _ in COMPONENTS.values()]
+SCORE_COLUMNS = [f'{name}_score' for name in COMPONENTS] + ['composite_score']
+
+# The weights behind the scores delivered in the ZIP CSVs
+DEFAULT_WEIGHTS = {'wealth': 0.35, 'population': 0.2, 'children': 0.3, 'area': 0.15}
+
+# Worst to best; ZIPs missing an input are UNGRADED
+GRADES = ['F', 'D', 'C', 'B', 'A']
+UNGRADED = 'Ungraded'
+
+# Lower bound of each grade above F: composite-score quantiles by default,
+# so each grade holds a fifth of the scored ZIPs, or composite scores when
+# absolute. A score on a bound falls in the lower grade, as with pandas.qcut.
+DEFAULT_CUTOFFS = {'D': 0.2, 'C': 0.4, 'B': 0.6, 'A': 0.8}
+
+SCORE_INPUTS_QUERY = f'SELECT zip_code, {", ".join(INPUT_COLUMNS + SCORE_COLUMNS)}, grade FROM zip_data'
+
+UPDATE_SCORES_QUERY = f'''
+    UPDATE zip_data
+    SET {", ".join(f"{col} = ?" for col in SCORE_COLUMNS)}, grade = ?
+    WHERE zip_code = ?
+'''
+
+
+def component_scores(inputs):
+    """(n, components) array of min-max scaled inputs, NaN for ZIPs missing any input"""
+    raw = inputs[INPUT_COLUMNS].to_numpy(dtype=float)
+    complete = ~np.isnan(raw).any(axis=1)
+    if not complete.any():
+        return np.full(raw.shape, np.nan)
+    low, high = raw[complete].min(axis=0), raw[complete].max(axis=0)
+    scores = (raw - low) / np.where(high > low, high - low, 1.0)
+    inverted = np.array([inverted for _, inverted in COMPONENTS.values()])
+    scores[:, inverted] = 1 - scores[:, inverted]
+    scores[~complete] = np.nan
+    return scores
+
+
+def weight_vector(weights):
+    unknown = set(weights) - set(COMPONENTS)
+    if unknown:
+        raise ValueError(f"Unknown score components: {', '.join(sorted(unknown))}")
+    return np.array([float(weights.get(name, 0)) for name in COMPONENTS])
+
+
+def grade_thresholds(composite, cutoffs=DEFAULT_CUTOFFS, absolute=False):
+    """Ascending composite-score lower bounds of GRADES[1:]"""
+    bounds = np.array([float(cutoffs[grade]) for grade in GRADES[1:]])
+    if absolute:
+        return bounds
+    scored = composite[~np.isnan(composite)]
+    if not len(scored):
+        return bounds
+    return np.quantile(scored, bounds)
+
+
+def assign_grades(composite, thresholds):
+    """Index into GRADES for each composite score (any shape), -1 where unscored.
+
+    Both sides are rounded first: a quantile bound is often some ZIP's own
+    score, and that ZIP must not change grade with the summation order.
+    """
+    codes = np.searchsorted(np.round(thresholds, 12), np.round(composite, 12), side='left')
+    return np.where(np.isnan(composite), -1, codes)
+
+
+def score_zips(inputs, weights=DEFAULT_WEIGHTS, cutoffs=DEFAULT_CUTOFFS, absolute=False):
+    """Component scores, composite score and grade for each row of inputs"""
+    components = component_scores(inputs)
+    composite = components @ weight_vector(weights)
+    thresholds = grade_thresholds(composite, cutoffs, absolute)
+
+    scores = pd.DataFrame(np.column_stack([components, composite]), columns=SCORE_COLUMNS, index=inputs.index)
+    # -1 (unscored) picks the trailing UNGRADED
+    scores['grade'] = np.array(GRADES + [UNGRADED], dtype=object)[assign_grades(composite, thresholds)]
+    return scores
+
+
+def changed_rows(stored, scores):
+    """Rows whose stored scores or grade differ from scores (NULL matches NaN).
+
+    Differences below 1e-12 are rounding noise, e.g. in scores imported from the CSV.
+    """
+    old = stored[SCORE_COLUMNS].to_numpy(dtype=float)
+    new = scores[SCORE_COLUMNS].to_numpy(dtype=float)
+    same = np.isclose(old, new, rtol=0, atol=1e-12, equal_nan=True)
+    return ~same.all(axis=1) | (stored['grade'].to_numpy() != scores['grade'].to_numpy())
+
+
+def rescore_database(conn, weights=DEFAULT_WEIGHTS, cutoffs=DEFAULT_CUTOFFS, absolute=False, full=False):
+    """Recompute scores and grades in zip_data; returns the number of rows written.
+
+    Scoring the whole table is a few vectorized operations, and the
+    scaling bounds and quantile thresholds depend on every row, so it is
+    always recomputed. Only rows whose scores or grade changed are written,
+    unless full is set: a new income rewrites that ZIP, and a new weight
+    rewrites the ZIPs it moves. The target catchments aggregate these scores
+    and grades, so they are rebuilt too when any row changed. conn must be
+    in autocommit mode, as from db.connect().
+    """
+    # catchment.py imports GRADES from here
+    from catchment import rebuild_catchments
+
+    start = time.perf_counter()
+    inputs = pd.read_sql_query(SCORE_INPUTS_QUERY, conn)
+    scores = score_zips(inputs, weights, cutoffs, absolute)
+
+    changed = changed_rows(inputs, scores) if not full else np.ones(len(inputs), dtype=bool)
+    out = scores[changed].assign(zip_code=inputs['zip_code'][changed])
+    out = out.astype(object).where(out.notna(), None)
+    rows = list(out.itertuples(index=False, name=None))
+
+    with db.write_transaction(conn):
+        conn.executemany(UPDATE_SCORES_QUERY, rows)
+
+    elapsed = time.perf_counter() - start
+    grades = scores['grade'].value_counts()
+    print(f"Scored {len(inputs)} ZIPs, {len(rows)} rows written in {elapsed:.2f}s")
+    print('  ' + ', '.join(f"{grade}: {grades.get(grade, 0)}" for grade in GRADES[::-1] + [UNGRADED]))
+
+    if rows:
+        # Bump after the catchments are rebuilt, so no request caches stale target grades
+        scopes = ['zips'] + (['targets'] if any(rebuild_catchments(conn)) else [])
+        with db.write_transaction(conn):
+            db.bump_generation(conn, *scopes)
+    return len(rows)
+
+
+def weight_grid(step=0.05):
+    """Every weight vector on a step grid whose weights sum to 1"""
+    steps = int(round(1 / step))
+    return pd.DataFrame(
+        [[n / steps for n in combo] for combo in itertools.product(range(steps + 1), repeat=len(COMPONENTS))
+         if sum(combo) == steps],
+        columns=list(COMPONENTS),
+    )
+
+
+def what_if(inputs, weight_sets, cutoffs=DEFAULT_CUTOFFS, absolute=False, baseline=DEFAULT_WEIGHTS):
+    """Grade distribution for each weight vector, all scored in one matrix product.
+
+    weight_sets has one column per component. The grade bounds are held
+    fixed so the distributions are comparable: absolute cutoffs as given,
+    else the quantile bounds under the baseline weights (quantiles per
+    weight vector would always give equal fifths). 'changed' counts the
+    ZIPs whose grade differs from the baseline.
+    """
+    weight_sets = pd.DataFrame(weight_sets).reindex(columns=list(COMPONENTS), fill_value=0.0)
+    components = component_scores(inputs)
+    components = components[~np.isnan(components).any(axis=1)]
+
+    baseline_composite = components @ weight_vector(baseline)
+    thresholds = grade_thresholds(baseline_composite, cutoffs, absolute)
+    baseline_codes = assign_grades(baseline_composite, thresholds)
+
+    # (ZIPs, weight vectors)
+    codes = assign_grades(components @ weight_sets.to_numpy(dtype=float).T, thresholds)
+    result = weight_sets.copy()
+    for code, grade in reversed(list(enumerate(GRADES))):
+        result[grade] = (codes == code).sum(axis=0)
+    result['changed'] = (codes != baseline_codes[:, None]).sum(axis=0)
+    return result
+
+
+def parse_mapping(text):
+    """'wealth=0.4,area=0.1' -> {'wealth': 0.4, 'area': 0.1}"""
+    mapping = {}
+    for item in text.split(','):
+        key, _, value = item.partition('=')
+        mapping[key.strip()] = float(value)
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score and grade the ZIPs in zip_data")
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('--weights', type=parse_mapping, default=DEFAULT_WEIGHTS,
+                        help="component weights, e.g. wealth=0.35,population=0.2,children=0.3,area=0.15")
+    parser.add_argument('--cutoffs', type=parse_mapping, default=DEFAULT_CUTOFFS,
+                        help="lower bound of each grade above F, e.g. D=0.2,C=0.4,B=0.6,A=0.8")
+    parser.add_argument('--absolute', action='store_true',
+                        help="read the cutoffs as composite scores instead of quantiles")
+    parser.add_argument('--full', action='store_true', help="write every row, not only changed ones")
+    parser.add_argument('--what-if', metavar='CSV',
+                        help="report grade distributions for the weight vectors in this CSV; nothing is written")
+    parser.add_argument('--grid', type=float, metavar='STEP',
+                        help="report grade distributions for every weight vector on this grid; nothing is written")
+    parser.add_argument('--output', help="write the what-if results to this CSV")
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    try:
+        if args.what_if or args.grid:
+            weight_sets = pd.read_csv(args.what_if) if args.what_if else weight_grid(args.grid)
+            inputs = pd.read_sql_query(SCORE_INPUTS_QUERY, conn)
+            start = time.perf_counter()
+            result = what_if(inputs, weight_sets, args.cutoffs, args.absolute, args.weights)
+            print(f"Scored {len(inputs)} ZIPs under {len(result)} weight vectors "
+                  f"in {time.perf_counter() - start:.2f}s")
+            if args.output:
+                result.to_csv(args.output, index=False)
+            print(result.sort_values('A', ascending=False).head(20).to_string(index=False))
+        else:
+            rescore_database(conn, args.weights, args.cutoffs, args.absolute, args.full)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
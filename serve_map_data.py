@@ -1,13 +1,282 @@
 from flask import Flask, send_from_directory, jsonify, request
+import gzip
+import hashlib
 import os
 import sqlite3
+from contextlib import closing
+import db
+from init_database import ensure_schema
+from cluster_summary import hull_features
+from response_cache import ResponseCache, make_response
+from site_evaluation import EvaluatorCache, parse_candidates
+from wire_formats import encode_columns, fetch_columns, requested_format
+from vector_tiles import MBTILES_PATH
 
 app = Flask(__name__, static_folder='.', static_url_path='')
 
+# Every query the server issues lives here so audit_query_plans.py can check them
+# Columns /api/targets can return (?fields=), all of them by default
+TARGET_FIELDS = {
+    'organization': 't.organization',
+    'address': 't.address',
+    'phone': 't.phone',
+    'website': 't.website',
+    'population': 't.population',
+    'median_income': 't.median_income',
+    'status': 't.status',
+    'latitude': 't.latitude',
+    'longitude': 't.longitude',
+    'grade': 'c.mean_grade',
+    'best_grade': 'c.best_grade',
+    'catchment_zips': 'c.zip_count',
+    'catchment_pop': 'c.total_pop',
+    'catchment_income': 'c.median_income',
+}
+
+KANBAN_QUERY = '''
+    SELECT 
+        t.organization,
+        t.address,
+        t.phone,
+        COALESCE(t.status, 'not-contacted') as status,
+        t.population,
+        t.median_income,
+        c.mean_grade
+    FROM targets t
+    LEFT JOIN target_catchment c ON c.organization = t.organization
+'''
+
+STATUS_QUERY = 'SELECT status FROM targets WHERE organization = ?'
+
+UPDATE_STATUS_QUERY = '''
+    UPDATE targets 
+    SET status = ?, last_updated = CURRENT_TIMESTAMP 
+    WHERE organization = ?
+'''
+
+LOG_ACTIVITY_QUERY = '''
+    INSERT INTO activity_log (organization, old_status, new_status)
+    VALUES (?, ?, ?)
+'''
+
+# Columns /api/zips can return (?fields=), all of them by default
+ZIP_FIELDS = {
+    name: f'z.{name}' for name in [
+        'zip_code', 'geographic_area', 'households', 'total_pop',
+        'median_income', 'grade', 'latitude', 'longitude',
+        'cluster_a_5mi', 'cluster_a_10mi', 'cluster_ab_5mi',
+        'cluster_ab_10mi', 'cluster_abc_5mi', 'cluster_abc_10mi',
+        'cluster_bc_5mi', 'cluster_bc_10mi',
+    ]
+}
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# With ?zoom=, ZIPs are thinned to the most populous one per grid cell of
+# about this many screen pixels
+THIN_CELL_PIXELS = 12
+
+ANALYSIS_TYPES_QUERY = '''
+    SELECT analysis_type, COUNT(DISTINCT cluster_id) AS clusters, COUNT(*) AS zips
+    FROM zip_cluster
+    GROUP BY analysis_type
+'''
+
+ANALYSIS_EXISTS_QUERY = 'SELECT 1 FROM zip_cluster WHERE analysis_type = ? LIMIT 1'
+
+CLUSTERS_QUERY = '''
+    SELECT c.cluster_id, z.zip_code, z.latitude, z.longitude,
+           z.total_pop, z.median_income, z.grade
+    FROM zip_cluster c
+    JOIN zip_data z ON z.zip_code = c.zip_code
+    WHERE c.analysis_type = ?
+    AND z.latitude IS NOT NULL AND z.longitude IS NOT NULL
+'''
+
+# JSON keys /api/clusters uses for the CLUSTERS_QUERY columns
+CLUSTER_KEYS = {'zip_code': 'zip', 'latitude': 'lat', 'longitude': 'lng'}
+
+CLUSTER_SUMMARY_QUERY = '''
+    SELECT cluster_id, zip_count, total_pop, mean_income,
+           centroid_lat, centroid_lon, hull
+    FROM cluster_summary
+    WHERE analysis_type = ?
+'''
+
+def parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+def parse_viewport_args(args, fields):
+    """Validate the viewport query parameters shared by /api/zips and /api/targets.
+
+    bbox=min_lon,min_lat,max_lon,max_lat  zoom=<int>  grades=A,B  statuses=...
+    fields=a,b  cursor=<next cursor>  limit=<page size>. Raises ValueError.
+    """
+    viewport = {'bbox': None, 'zoom': None, 'grades': parse_list(args.get('grades')),
+                'statuses': parse_list(args.get('statuses')), 'cursor': 0, 'limit': None}
+
+    if args.get('bbox'):
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(v) for v in args['bbox'].split(','))
+        except ValueError:
+            raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+        viewport['bbox'] = (min_lon, min_lat, max_lon, max_lat)
+
+    viewport['fields'] = parse_list(args.get('fields')) or list(fields)
+    unknown = [name for name in viewport['fields'] if name not in fields]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    try:
+        if args.get('zoom'):
+            viewport['zoom'] = int(args['zoom'])
+        if args.get('cursor'):
+            viewport['cursor'] = int(args['cursor'])
+        if args.get('limit'):
+            viewport['limit'] = min(max(int(args['limit']), 1), MAX_PAGE_SIZE)
+        elif args.get('cursor'):
+            viewport['limit'] = DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError('zoom, cursor and limit must be integers')
+    return viewport
+
+def in_list(column, values):
+    return f"{column} IN ({', '.join('?' for _ in values)})"
+
+def page_query(sql, params, viewport, order_column):
+    """Keyset pagination on rowid: rows after the cursor, one extra to detect a next page"""
+    limit = -1 if viewport['limit'] is None else viewport['limit'] + 1
+    return f'{sql} ORDER BY {order_column} LIMIT ?', params + [limit]
+
+def zips_query(viewport):
+    """SQL and parameters for /api/zips; a bbox is answered from the zip_rtree index"""
+    select = [f'{ZIP_FIELDS[name]} AS {name}' for name in viewport['fields']] + ['z.rowid AS row_id']
+    where = ['z.latitude IS NOT NULL', 'z.longitude IS NOT NULL']
+    params = []
+    join = ''
+    if viewport['bbox']:
+        min_lon, min_lat, max_lon, max_lat = viewport['bbox']
+        join = 'JOIN zip_rtree r ON r.id = z.rowid'
+        where.append('r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?')
+        params += [min_lat, max_lat, min_lon, max_lon]
+    if viewport['grades']:
+        # Unary + keeps the grade index from displacing the R*Tree as the driving index
+        where.append(in_list('+z.grade' if viewport['bbox'] else 'z.grade', viewport['grades']))
+        params += viewport['grades']
+
+    if viewport['zoom'] is None:
+        where.append('z.rowid > ?')
+        params.append(viewport['cursor'])
+        sql = f"SELECT {', '.join(select)} FROM zip_data z {join} WHERE {' AND '.join(where)}"
+        return page_query(sql, params, viewport, 'z.rowid')
+
+    # One ZIP per grid cell: SQLite takes the bare columns from the row holding the MAX
+    cell = 360 / (256 * 2 ** viewport['zoom']) * THIN_CELL_PIXELS
+    select.append('MAX(COALESCE(z.total_pop, 0)) AS weight')
+    sql = f"""
+        SELECT * FROM (
+            SELECT {', '.join(select)} FROM zip_data z {join} WHERE {' AND '.join(where)}
+            GROUP BY CAST((z.latitude + 90) / ? AS INTEGER), CAST((z.longitude + 180) / ? AS INTEGER)
+        ) AS thinned
+        WHERE row_id > ?"""
+    return page_query(sql, params + [cell, cell, viewport['cursor']], viewport, 'row_id')
+
+def targets_query(viewport):
+    """SQL and parameters for /api/targets. Targets are never thinned: every pin is actionable."""
+    select = [f'{TARGET_FIELDS[name]} AS {name}' for name in viewport['fields']] + ['t.rowid AS row_id']
+    where = ['t.latitude IS NOT NULL', 't.longitude IS NOT NULL', 't.rowid > ?']
+    params = [viewport['cursor']]
+    if viewport['bbox']:
+        min_lon, min_lat, max_lon, max_lat = viewport['bbox']
+        where.append('t.latitude BETWEEN ? AND ? AND t.longitude BETWEEN ? AND ?')
+        params += [min_lat, max_lat, min_lon, max_lon]
+    if viewport['statuses']:
+        where.append(in_list('t.status', viewport['statuses']))
+        params += viewport['statuses']
+    if viewport['grades']:
+        where.append(in_list('c.mean_grade', viewport['grades']))
+        params += viewport['grades']
+    sql = f"""
+        SELECT {', '.join(select)} FROM targets t
+        LEFT JOIN target_catchment c ON c.organization = t.organization
+        WHERE {' AND '.join(where)}"""
+    return page_query(sql, params, viewport, 't.rowid')
+
+def viewport_rows(conn, sql, params, viewport):
+    """(rows as dicts, headers) for a viewport query; X-Next-Cursor is set when more pages follow"""
+    rows = conn.execute(sql, params).fetchall()
+    headers = {}
+    if viewport['limit'] is not None and len(rows) > viewport['limit']:
+        rows = rows[:viewport['limit']]
+        headers['X-Next-Cursor'] = str(rows[-1]['row_id'])
+    keep = viewport['fields']
+    return [{name: row[name] for name in keep} for row in rows], headers
+
+def viewport_columns(conn, sql, params, viewport):
+    """((names, columns), headers) for a viewport query, for the columnar formats"""
+    names, columns = fetch_columns(conn, sql, params)
+    headers = {}
+    if viewport['limit'] is not None and len(columns[0]) > viewport['limit']:
+        columns = [values[:viewport['limit']] for values in columns]
+        headers['X-Next-Cursor'] = str(columns[names.index('row_id')][-1])
+    keep = [names.index(name) for name in viewport['fields']]
+    return ([names[i] for i in keep], [columns[i] for i in keep]), headers
+
+def server_queries():
+    """Yield (name, sql, example_params, full_export) for every query the server runs.
+
+    full_export marks queries that return a whole table by design, where a
+    scan is the right plan.
+    """
+    example = parse_viewport_args({}, TARGET_FIELDS)
+    yield '/api/targets', *targets_query(example), True
+    example = parse_viewport_args({'bbox': '-74.1,40.6,-73.8,40.9', 'statuses': 'in discussion',
+                                   'limit': '100'}, TARGET_FIELDS)
+    yield '/api/targets?bbox', *targets_query(example), False
+    yield '/api/kanban_data', KANBAN_QUERY, (), True
+    yield '/api/update_status (read)', STATUS_QUERY, ('org',), False
+    yield '/api/update_status (write)', UPDATE_STATUS_QUERY, ('status', 'org'), False
+    yield '/api/update_status (log)', LOG_ACTIVITY_QUERY, ('org', 'old', 'new'), False
+    yield '/api/zips', *zips_query(parse_viewport_args({}, ZIP_FIELDS)), True
+    example = parse_viewport_args({'bbox': '-74.1,40.6,-73.8,40.9', 'grades': 'A,B',
+                                   'limit': '100', 'cursor': '1'}, ZIP_FIELDS)
+    yield '/api/zips?bbox', *zips_query(example), False
+    example['zoom'] = 8
+    yield '/api/zips?bbox&zoom', *zips_query(example), False
+    yield '/api/analysis_types', ANALYSIS_TYPES_QUERY, (), True
+    yield '/api/clusters/<type> (exists)', ANALYSIS_EXISTS_QUERY, ('a_10mi',), False
+    yield '/api/clusters/<type>', CLUSTERS_QUERY, ('a_10mi',), False
+    yield '/api/cluster_summary/<type>', CLUSTER_SUMMARY_QUERY, ('a_10mi',), False
+    yield 'response cache generation', db.DATA_VERSION_QUERY, (), True
+
+pool = db.get_pool(db.DB_PATH)
+
 def get_db_connection():
-    conn = sqlite3.connect('data/targets.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Borrow a pooled WAL-mode connection; close() returns it to the pool"""
+    return pool.acquire()
+
+response_cache = ResponseCache()
+
+# In-memory spatial model behind /api/evaluate_sites
+site_evaluators = EvaluatorCache()
+
+# Read-only connections to the MBTiles file written by vector_tiles.py
+tile_pool = db.ConnectionPool(MBTILES_PATH, size=4, pragmas={'query_only': 'ON', 'mmap_size': 268435456})
+
+TILE_QUERY = 'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?'
+
+def cached_json(conn, key, scopes, build, encode=None):
+    """Serve the JSON of build() from the response cache until a writer bumps one of scopes"""
+    # Read the generation before building so a cached body is never older than its key
+    generations = db.data_generation(conn)
+    generation = tuple(generations.get(scope, 0) for scope in scopes)
+    return make_response(response_cache.get(key, generation, build, encode), request)
+
+def cached_columns(conn, key, scopes, build, fmt):
+    """Like cached_json for a build() returning ((names, columns), headers), serialized as fmt"""
+    return cached_json(conn, f'{key}|{fmt}', scopes, build,
+                       encode=lambda payload: encode_columns(*payload, fmt))
 
 @app.route('/')
 def root():
@@ -23,17 +292,15 @@ def kanban():
 
 @app.route('/api/targets')
 def get_targets():
+    try:
+        viewport = parse_viewport_args(request.args, TARGET_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db_connection()
     try:
-        targets = conn.execute('''
-            SELECT t.organization, t.address, t.phone, t.website, t.population, 
-                   t.median_income, t.status, t.latitude, t.longitude,
-                   z.grade
-            FROM targets t
-            LEFT JOIN zip_data z ON t.region = z.zip_code
-            WHERE t.latitude IS NOT NULL AND t.longitude IS NOT NULL
-        ''').fetchall()
-        return jsonify([dict(row) for row in targets])
+        return cached_json(conn, f'targets|{viewport}', ('targets', 'zips'),
+                           lambda: viewport_rows(conn, *targets_query(viewport), viewport))
     except Exception as e:
         print(f"Error getting targets: {e}")
         return str(e), 500
@@ -44,32 +311,21 @@ def get_targets():
 def get_kanban_data():
     conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT 
-                t.organization,
-                t.address,
-                t.phone,
-                COALESCE(t.status, 'not-contacted') as status,
-                t.population,
-                t.median_income,
-                z.grade
-            FROM targets t
-            LEFT JOIN zip_data z ON t.region = z.zip_code
-        ''')
-        
-        targets = []
-        for row in cursor.fetchall():
-            targets.append({
-                'organization': row[0],
-                'address': row[1],
-                'phone': row[2] if row[2] else 'N/A',
-                'status': row[3],
-                'population': row[4],
-                'median_income': row[5],
-                'zip_grade': row[6] if row[6] else 'N/A'
-            })
-        return jsonify(targets)
+        def build():
+            targets = []
+            for row in conn.execute(KANBAN_QUERY):
+                targets.append({
+                    'organization': row[0],
+                    'address': row[1],
+                    'phone': row[2] if row[2] else 'N/A',
+                    'status': row[3],
+                    'population': row[4],
+                    'median_income': row[5],
+                    'zip_grade': row[6] if row[6] else 'N/A'
+                })
+            return targets
+
+        return cached_json(conn, 'kanban_data', ('targets', 'zips'), build)
     except Exception as e:
         print(f"Error getting kanban data: {e}")
         return str(e), 500
@@ -87,36 +343,26 @@ def update_status():
 
     conn = get_db_connection()
     try:
-        # Get current status
-        current = conn.execute(
-            'SELECT status FROM targets WHERE organization = ?',
-            (organization,)
-        ).fetchone()
+        with db.write_transaction(conn):
+            # Get current status
+            current = conn.execute(STATUS_QUERY, (organization,)).fetchone()
+            
+            if not current:
+                return jsonify({'error': 'Organization not found'}), 404
+            
+            old_status = current[0]
+            
+            # Update status
+            conn.execute(UPDATE_STATUS_QUERY, (new_status, organization))
+            
+            # Log the change
+            conn.execute(LOG_ACTIVITY_QUERY, (organization, old_status, new_status))
+            db.bump_generation(conn, 'targets')
         
-        if not current:
-            return jsonify({'error': 'Organization not found'}), 404
-        
-        old_status = current[0]
-        
-        # Update status
-        conn.execute('''
-            UPDATE targets 
-            SET status = ?, last_updated = CURRENT_TIMESTAMP 
-            WHERE organization = ?
-        ''', (new_status, organization))
-        
-        # Log the change
-        conn.execute('''
-            INSERT INTO activity_log (organization, old_status, new_status)
-            VALUES (?, ?, ?)
-        ''', (organization, old_status, new_status))
-        
-        conn.commit()
         print(f"Updated status for {organization}: {old_status} -> {new_status}")
         return jsonify({'success': True, 'old_status': old_status, 'new_status': new_status})
     
     except Exception as e:
-        conn.rollback()
         print(f"Error updating status: {e}")
         return str(e), 500
     finally:
@@ -124,19 +370,27 @@ def update_status():
 
 @app.route('/api/zips')
 def get_zips():
+    try:
+        viewport = parse_viewport_args(request.args, ZIP_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        fmt = requested_format(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
+
     conn = get_db_connection()
     try:
-        zips = conn.execute('''
-            SELECT zip_code, geographic_area, households, total_pop,
-                   median_income, grade, latitude, longitude,
-                   cluster_a_5mi, cluster_a_10mi, cluster_ab_5mi, 
-                   cluster_ab_10mi, cluster_abc_5mi, cluster_abc_10mi,
-                   cluster_bc_5mi, cluster_bc_10mi
-            FROM zip_data
-            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-        ''').fetchall()
-        print(f"Retrieved {len([dict(row) for row in zips])} ZIP codes")
-        return jsonify([dict(row) for row in zips])
+        if fmt:
+            return cached_columns(conn, f'zips|{viewport}', ('zips',),
+                                  lambda: viewport_columns(conn, *zips_query(viewport), viewport), fmt)
+
+        def build():
+            zips, headers = viewport_rows(conn, *zips_query(viewport), viewport)
+            print(f"Retrieved {len(zips)} ZIP codes")
+            return zips, headers
+
+        return cached_json(conn, f'zips|{viewport}', ('zips',), build)
     except Exception as e:
         print(f"Error getting ZIP data: {e}")
         return str(e), 500
@@ -145,55 +399,196 @@ def get_zips():
 
 @app.route('/api/clusters/<analysis_type>')
 def get_clusters(analysis_type):
+    try:
+        fmt = requested_format(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
+
     conn = get_db_connection()
     try:
-        cluster_col = f'cluster_{analysis_type.lower()}'
-        
-        # Get all ZIPs that belong to clusters of this type
-        query = f'''
-        SELECT zip_code, latitude, longitude, {cluster_col}, 
-               total_pop, median_income, grade
-        FROM zip_data 
-        WHERE {cluster_col} IS NOT NULL
-        AND latitude IS NOT NULL AND longitude IS NOT NULL
-        '''
-        
-        results = conn.execute(query).fetchall()
-        
-        # Group ZIPs by cluster
-        clusters = {}
-        for row in results:
-            cluster_name = row[cluster_col]
-            if cluster_name not in clusters:
-                clusters[cluster_name] = []
-            clusters[cluster_name].append({
-                'zip': row['zip_code'],
-                'lat': row['latitude'],
-                'lng': row['longitude'],
-                'total_pop': row['total_pop'],
-                'median_income': row['median_income'],
-                'grade': row['grade']
-            })
+        analysis_key = analysis_type.lower()
+        if not conn.execute(ANALYSIS_EXISTS_QUERY, (analysis_key,)).fetchone():
+            return jsonify({'error': f'Unknown analysis type: {analysis_type}'}), 404
+
+        if fmt:
+            # One row per ZIP with its cluster_id, named like the JSON keys
+            def build_columns():
+                names, columns = fetch_columns(conn, CLUSTERS_QUERY, (analysis_key,))
+                return ([CLUSTER_KEYS.get(name, name) for name in names], columns), {}
+
+            return cached_columns(conn, f'clusters/{analysis_key}', ('zips',), build_columns, fmt)
         
-        print(f"Retrieved {len(clusters)} clusters for analysis type {analysis_type}")
-        return jsonify(clusters)
+        def build():
+            # Get all ZIPs that belong to clusters of this type
+            results = conn.execute(CLUSTERS_QUERY, (analysis_key,)).fetchall()
+
+            # Group ZIPs by cluster
+            clusters = {}
+            for row in results:
+                cluster_name = row['cluster_id']
+                if cluster_name not in clusters:
+                    clusters[cluster_name] = []
+                clusters[cluster_name].append({
+                    'zip': row['zip_code'],
+                    'lat': row['latitude'],
+                    'lng': row['longitude'],
+                    'total_pop': row['total_pop'],
+                    'median_income': row['median_income'],
+                    'grade': row['grade']
+                })
+
+            print(f"Retrieved {len(clusters)} clusters for analysis type {analysis_type}")
+            return clusters
+
+        return cached_json(conn, f'clusters/{analysis_key}', ('zips',), build)
     except Exception as e:
         print(f"Error getting clusters: {e}")
         return str(e), 500
     finally:
         conn.close()
 
+@app.route('/api/cluster_summary/<analysis_type>')
+def get_cluster_summary(analysis_type):
+    """Precomputed per-cluster stats; hull is a Google-encoded polyline"""
+    conn = get_db_connection()
+    try:
+        analysis_key = analysis_type.lower()
+        if not conn.execute(ANALYSIS_EXISTS_QUERY, (analysis_key,)).fetchone():
+            return jsonify({'error': f'Unknown analysis type: {analysis_type}'}), 404
+        return cached_json(conn, f'cluster_summary/{analysis_key}', ('zips',),
+                           lambda: [dict(row) for row in conn.execute(CLUSTER_SUMMARY_QUERY, (analysis_key,))])
+    except Exception as e:
+        print(f"Error getting cluster summary: {e}")
+        return str(e), 500
+    finally:
+        conn.close()
+
+@app.route('/api/cluster_hulls/<analysis_type>')
+def get_cluster_hulls(analysis_type):
+    """Ready-to-draw GeoJSON hulls with per-cluster stats, tagged with the data version"""
+    conn = get_db_connection()
+    try:
+        analysis_key = analysis_type.lower()
+        if not conn.execute(ANALYSIS_EXISTS_QUERY, (analysis_key,)).fetchone():
+            return jsonify({'error': f'Unknown analysis type: {analysis_type}'}), 404
+
+        def build():
+            rows = conn.execute(CLUSTER_SUMMARY_QUERY, (analysis_key,)).fetchall()
+            return {
+                'type': 'FeatureCollection',
+                # A string: generations exceed the integers JavaScript represents exactly
+                'version': str(db.data_generation(conn).get('zips', 0)),
+                'features': hull_features(rows),
+            }
+
+        return cached_json(conn, f'cluster_hulls/{analysis_key}', ('zips',), build)
+    except Exception as e:
+        print(f"Error getting cluster hulls: {e}")
+        return str(e), 500
+    finally:
+        conn.close()
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.pbf')
+def get_tile(z, x, y):
+    """Mapbox Vector Tile with 'zips' and 'clusters' layers; 204 where there is no data"""
+    if not os.path.exists(MBTILES_PATH):
+        return jsonify({'error': 'No tiles yet; run python vector_tiles.py'}), 404
+
+    conn = tile_pool.acquire()
+    try:
+        # MBTiles rows count from the bottom (TMS); URLs use XYZ
+        row = conn.execute(TILE_QUERY, (z, x, (1 << z) - 1 - y)).fetchone()
+        if row is None:
+            return '', 204
+
+        data = row[0]
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        send_gzip = bool(request.accept_encodings['gzip'])
+        # One strong tag per content-coding, as in response_cache.CachedBody.etag
+        etag = f'{digest}-gzip' if send_gzip else digest
+        if request.if_none_match.star_tag or any(request.if_none_match.contains(tag)
+                                                 for tag in (digest, f'{digest}-gzip')):
+            response = app.response_class(status=304)
+        elif send_gzip:
+            # Tiles are stored gzipped, as MBTiles readers expect
+            response = app.response_class(data, mimetype='application/vnd.mapbox-vector-tile')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = app.response_class(gzip.decompress(data), mimetype='application/vnd.mapbox-vector-tile')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    except Exception as e:
+        print(f"Error getting tile {z}/{x}/{y}: {e}")
+        return str(e), 500
+    finally:
+        conn.close()
+
+@app.route('/api/evaluate_sites', methods=['POST'])
+def evaluate_sites():
+    """Score a batch of candidate sites: reachable population, grade mix,
+    clusters touched and overlap with the existing targets' catchments"""
+    payload = request.get_json(silent=True)
+    try:
+        candidates = parse_candidates(payload)
+        analysis_types = payload.get('analysis_types') if isinstance(payload, dict) else None
+        if analysis_types is not None and (not isinstance(analysis_types, list)
+                                           or not all(isinstance(t, str) for t in analysis_types)):
+            raise ValueError("analysis_types must be a list of strings")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db_connection()
+    try:
+        return jsonify(site_evaluators.get(conn).evaluate(candidates, analysis_types))
+    except Exception as e:
+        print(f"Error evaluating sites: {e}")
+        return str(e), 500
+    finally:
+        conn.close()
+
+@app.route('/api/data_version')
+def get_data_version():
+    """Current data generations; clients drop cached layers when these change"""
+    conn = get_db_connection()
+    try:
+        generations = db.data_generation(conn)
+        response = jsonify({scope: str(generations.get(scope, 0)) for scope in db.DATA_SCOPES})
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        print(f"Error getting data version: {e}")
+        return str(e), 500
+    finally:
+        conn.close()
+
+@app.route('/api/analysis_types')
+def get_analysis_types():
+    conn = get_db_connection()
+    try:
+        return cached_json(conn, 'analysis_types', ('zips',),
+                           lambda: [dict(row) for row in conn.execute(ANALYSIS_TYPES_QUERY)])
+    except Exception as e:
+        print(f"Error getting analysis types: {e}")
+        return str(e), 500
+    finally:
+        conn.close()
+
 if __name__ == '__main__':
     print("Starting test server...")
     print(f"Current directory: {os.getcwd()}")
     print(f"index_db.html exists: {os.path.exists('index_db.html')}")
     print(f"kanban.html exists: {os.path.exists('kanban.html')}")
     
-    # Test database connection
+    # Bring the schema up to date, then test the pooled connection
     try:
+        with closing(sqlite3.connect(db.DB_PATH)) as schema_conn:
+            ensure_schema(schema_conn)
         conn = get_db_connection()
         print("Database connection successful")
         print("Tables:", [t[0] for t in conn.execute('SELECT name FROM sqlite_master WHERE type="table"').fetchall()])
+        site_evaluators.get(conn)
         conn.close()
     except Exception as e:
         print(f"Database connection error: {e}")
@@ -0,0 +1,194 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+import db
+from catchment import catchment_matrix
+from scoring import GRADES, UNGRADED
+from spatial_index import ZipSpatialIndex
+
+DEFAULT_RADIUS_MILES = 7
+MAX_CANDIDATES = 1000
+
+ZIPS_QUERY = '''
+    SELECT zip_code, latitude, longitude, total_pop, grade
+    FROM zip_data
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+MEMBERSHIP_QUERY = 'SELECT zip_code, analysis_type, cluster_id FROM zip_cluster'
+
+# The stored catchments, so overlaps match target_catchment whether it holds
+# drive radii or drive-time isochrones
+TARGETS_QUERY = '''
+    SELECT t.organization, t.status
+    FROM targets t
+    JOIN target_catchment c ON c.organization = t.organization
+'''
+
+CATCHMENT_ZIPS_QUERY = 'SELECT organization, zip_code FROM target_catchment_zip'
+
+GRADE_ORDER = GRADES[::-1] + [UNGRADED]
+
+
+def read_frame(conn, query):
+    """Query results as a DataFrame; works with the server's pooled connections,
+    which pd.read_sql_query does not recognise"""
+    cursor = conn.execute(query)
+    return pd.DataFrame([tuple(row) for row in cursor], columns=[c[0] for c in cursor.description])
+
+
+def parse_candidates(payload):
+    """Validate the request body: a list of {lat, lon, radius_miles?, id?}, bare
+    or under 'sites'. Raises ValueError with a message for the client."""
+    sites = payload.get('sites') if isinstance(payload, dict) else payload
+    if not isinstance(sites, list) or not sites:
+        raise ValueError("Expected a non-empty list of sites, each with lat and lon")
+    if len(sites) > MAX_CANDIDATES:
+        raise ValueError(f"At most {MAX_CANDIDATES} sites per request")
+    rows = []
+    for i, site in enumerate(sites):
+        try:
+            lat, lon = float(site['lat']), float(site['lon'])
+            radius = float(site.get('radius_miles', DEFAULT_RADIUS_MILES))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Site {i}: lat and lon (and radius_miles if given) must be numbers")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not 0 < radius <= 100:
+            raise ValueError(f"Site {i}: lat/lon out of range or radius_miles not in (0, 100]")
+        rows.append((site.get('id', i), lat, lon, radius))
+    return pd.DataFrame(rows, columns=['id', 'latitude', 'longitude', 'radius_miles'])
+
+
+class SiteEvaluator:
+    """In-memory model for scoring candidate sites: the ZIP spatial index and,
+    as sparse matrices over the ZIPs, the grade of each ZIP, its cluster
+    memberships and the existing targets' catchments, as stored in
+    target_catchment_zip.
+
+    A batch of candidates becomes one sparse candidate x ZIP matrix and
+    every answer is a product of it with one of these.
+    """
+
+    def __init__(self, zips, memberships, targets, catchment_zips):
+        zips = zips.reset_index(drop=True)
+        self.index = ZipSpatialIndex.from_frame(zips, 'zip_code')
+        self.population = zips['total_pop'].astype(float).fillna(0).to_numpy()
+
+        grade = pd.Categorical(zips['grade'].fillna(UNGRADED), categories=GRADE_ORDER)
+        self.grades = self._indicator(grade.codes, len(GRADE_ORDER))
+
+        positions = memberships['zip_code'].map(self.index.position)
+        memberships = memberships[positions.notna()]
+        cluster_codes, self.clusters = pd.factorize(
+            pd.MultiIndex.from_frame(memberships[['analysis_type', 'cluster_id']]))
+        self.memberships = self._membership_matrix(positions.dropna(), cluster_codes, len(self.clusters))
+        self.cluster_sizes = np.asarray(self.memberships.sum(axis=0)).ravel()
+
+        self.targets = targets.reset_index(drop=True)
+        target_codes = catchment_zips['organization'].map(
+            pd.Series(self.targets.index, index=self.targets['organization']))
+        positions = catchment_zips['zip_code'].map(self.index.position)
+        known = positions.notna() & target_codes.notna()
+        self.target_catchments = self._membership_matrix(
+            positions[known], target_codes[known].astype(np.int64).to_numpy(), len(self.targets))
+
+    def _membership_matrix(self, positions, codes, n):
+        """Sparse (ZIP, group) 0/1 matrix from parallel ZIP positions and group codes"""
+        return csr_matrix((np.ones(len(codes)), (np.asarray(positions, dtype=np.int64), codes)),
+                          shape=(len(self.index), n))
+
+    @staticmethod
+    def _indicator(codes, n):
+        rows = np.flatnonzero(codes >= 0)
+        return csr_matrix((np.ones(len(rows)), (rows, codes[rows])), shape=(len(codes), n))
+
+    @classmethod
+    def from_db(cls, conn):
+        return cls(
+            read_frame(conn, ZIPS_QUERY),
+            read_frame(conn, MEMBERSHIP_QUERY),
+            read_frame(conn, TARGETS_QUERY),
+            read_frame(conn, CATCHMENT_ZIPS_QUERY),
+        )
+
+    def evaluate(self, candidates, analysis_types=None):
+        """One result dict per candidate row (id, latitude, longitude, radius_miles)"""
+        no_home = np.full(len(candidates), -1)
+        cover = catchment_matrix(candidates['latitude'], candidates['longitude'],
+                                 candidates['radius_miles'].to_numpy(dtype=float), self.index, no_home)
+        weighted = cover.multiply(self.population).tocsr()
+
+        zip_counts = np.diff(cover.indptr)
+        population = np.asarray(weighted.sum(axis=1)).ravel()
+        grade_zips = (cover @ self.grades).toarray()
+        grade_pop = (weighted @ self.grades).toarray()
+        in_clusters = (cover @ self.memberships).tocsr()
+        shared_zips = (cover @ self.target_catchments).tocsr()
+        shared_pop = (weighted @ self.target_catchments).tocsr()
+
+        wanted = None if analysis_types is None else {t.lower() for t in analysis_types}
+        results = []
+        for i, site in enumerate(candidates.itertuples(index=False)):
+            clusters = []
+            row = slice(in_clusters.indptr[i], in_clusters.indptr[i + 1])
+            for k, count in zip(in_clusters.indices[row], in_clusters.data[row]):
+                analysis_type, cluster_id = self.clusters[k]
+                if wanted is None or analysis_type in wanted:
+                    clusters.append({'analysis_type': analysis_type, 'cluster_id': cluster_id,
+                                     'zips': int(count), 'cluster_zips': int(self.cluster_sizes[k])})
+
+            overlaps = []
+            row = slice(shared_zips.indptr[i], shared_zips.indptr[i + 1])
+            pop_by_target = dict(zip(shared_pop.indices[shared_pop.indptr[i]:shared_pop.indptr[i + 1]],
+                                     shared_pop.data[shared_pop.indptr[i]:shared_pop.indptr[i + 1]]))
+            for t, count in zip(shared_zips.indices[row], shared_zips.data[row]):
+                shared = float(pop_by_target.get(t, 0.0))
+                overlaps.append({
+                    'organization': self.targets.at[t, 'organization'],
+                    'status': self.targets.at[t, 'status'],
+                    'shared_zips': int(count),
+                    'shared_population': int(shared),
+                    'overlap_pct': round(100 * shared / population[i], 1) if population[i] else 0.0,
+                })
+            overlaps.sort(key=lambda o: o['shared_population'], reverse=True)
+
+            results.append({
+                'id': site.id,
+                'lat': site.latitude,
+                'lon': site.longitude,
+                'radius_miles': site.radius_miles,
+                'zip_count': int(zip_counts[i]),
+                'population': int(population[i]),
+                'grade_mix': {grade: {'zips': int(grade_zips[i, g]), 'population': int(grade_pop[i, g])}
+                              for g, grade in enumerate(GRADE_ORDER) if grade_zips[i, g]},
+                'clusters': clusters,
+                'target_overlap': overlaps,
+            })
+        return results
+
+
+class EvaluatorCache:
+    """One SiteEvaluator per data generation: built at startup and rebuilt on
+    the first request after a writer bumps 'zips' or 'targets'"""
+
+    SCOPES = ('zips', 'targets')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._evaluator = None
+        self._key = None
+
+    def get(self, conn):
+        generations = db.data_generation(conn)
+        key = tuple(generations.get(scope, 0) for scope in self.SCOPES)
+        with self._lock:
+            if self._key != key:
+                start = time.perf_counter()
+                self._evaluator = SiteEvaluator.from_db(conn)
+                self._key = key
+                print(f"Site evaluator built over {len(self._evaluator.index)} ZIPs "
+                      f"in {time.perf_counter() - start:.2f}s")
+            return self._evaluator
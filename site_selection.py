@@ -0,0 +1,267 @@
+import argparse
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import csr_matrix, hstack
+
+import db
+from catchment import catchment_matrix, target_radius
+from clustering import parse_analysis
+from coverage import COVERAGE_RADIUS_MILES, cluster_order, write_flagged_csv
+from spatial_index import KM_PER_MILE, ZipSpatialIndex
+
+WEIGHT_COLUMNS = ['total_pop', 'composite_score']
+
+# Targets already at this status are counted as selected when ranking the rest
+COMMITTED_STATUSES = ['partnership agreed']
+
+MEMBERS_QUERY = '''
+    SELECT c.zip_code, c.cluster_id, z.latitude, z.longitude, z.total_pop, z.composite_score
+    FROM zip_cluster c
+    JOIN zip_data z ON z.zip_code = c.zip_code
+    WHERE c.analysis_type = ? AND z.latitude IS NOT NULL AND z.longitude IS NOT NULL
+    ORDER BY z.rowid
+'''
+
+TARGETS_QUERY = '''
+    SELECT organization, status, drive_radius, latitude, longitude
+    FROM targets
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+
+def coverage_matrix(site_lats, site_lons, index, radius_km):
+    """Sparse (sites, indexed ZIPs) matrix, 1 where the ZIP is within the site's
+    radius (a scalar or one per site)"""
+    hits = index.query_radius(site_lats, site_lons, radius_km)
+    rows = np.repeat(np.arange(len(hits)), [len(h) for h in hits])
+    cols = np.concatenate(hits) if hits else np.empty(0, dtype=np.int64)
+    return csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(hits), len(index)))
+
+
+def lazy_greedy(cover, weights, budget=None, target=1.0, covered=None):
+    """Weighted maximum coverage by lazy greedy: (sites in pick order, their gains).
+
+    Picks the site covering the most uncovered weight until budget sites are
+    picked or target (a fraction of the total weight) is covered. Gains only
+    shrink as ZIPs get covered, so a popped site whose recomputed gain still
+    tops the heap is the true best and most sites are never re-evaluated.
+    covered marks ZIPs that count as covered before the first pick.
+    """
+    uncovered = np.ones(cover.shape[1], dtype=bool) if covered is None else ~covered
+    goal = target * weights.sum() - weights[~uncovered].sum()
+    indptr, indices = cover.indptr, cover.indices
+
+    heap = [(-gain, site) for site, gain in enumerate(cover @ (weights * uncovered))]
+    heapq.heapify(heap)
+    picked, gains, total = [], [], 0.0
+    while heap and (budget is None or len(picked) < budget) and total < goal - 1e-9:
+        _, site = heapq.heappop(heap)
+        zips = indices[indptr[site]:indptr[site + 1]]
+        gain = weights[zips][uncovered[zips]].sum()
+        if heap and gain < -heap[0][0] - 1e-12:
+            heapq.heappush(heap, (-gain, site))
+            continue
+        if gain <= 0:
+            break
+        picked.append(site)
+        gains.append(gain)
+        uncovered[zips] = False
+        total += gain
+    return picked, gains
+
+
+def solve_exact(cover, weights, budget=None, target=1.0, time_limit=None):
+    """The same problem as an integer program, solved with HiGHS through scipy's milp.
+
+    With a budget: maximize the covered weight with at most budget sites.
+    Without: the fewest sites that cover target of the weight. x are the
+    sites (binary) and y the ZIPs (0..1, at most the number of sites
+    covering it). Returns the sites with their gains in greedy order, or
+    the greedy's own picks when time_limit runs out before any solution.
+    """
+    n_sites, n_zips = cover.shape
+    linking = hstack([-cover.T, csr_matrix(np.eye(n_zips))])  # y_j - sum of x_i covering j <= 0
+    integrality = np.r_[np.ones(n_sites), np.zeros(n_zips)]
+    if budget is not None:
+        c = np.r_[np.zeros(n_sites), -weights]
+        extra = LinearConstraint(csr_matrix(np.r_[np.ones(n_sites), np.zeros(n_zips)]), -np.inf, budget)
+    else:
+        c = np.r_[np.ones(n_sites), np.zeros(n_zips)]
+        goal = target * weights.sum() - 1e-9
+        extra = LinearConstraint(csr_matrix(np.r_[np.zeros(n_sites), weights]), goal, np.inf)
+    constraints = [LinearConstraint(linking, -np.inf, 0), extra]
+    options = {'time_limit': time_limit} if time_limit else {}
+    result = milp(c, constraints=constraints, integrality=integrality, bounds=Bounds(0, 1), options=options)
+    if result.x is None and result.status == 1:
+        # Out of time before any feasible solution
+        return lazy_greedy(cover, weights, budget, target)
+    if result.x is None:
+        raise RuntimeError(f"milp found no solution: {result.message}")
+    chosen = np.flatnonzero(result.x[:n_sites] > 0.5)
+    # Report the chosen sites in greedy order so gains add up like the greedy's
+    order, gains = lazy_greedy(cover[chosen], weights)
+    return [int(chosen[i]) for i in order], gains
+
+
+def select_cluster(args):
+    """Pick sites among one cluster's ZIPs; returns (positions, gains)"""
+    latitudes, longitudes, weights, radius_km, budget, target, exact, time_limit = args
+    index = ZipSpatialIndex(np.arange(len(weights)), latitudes, longitudes)
+    cover = coverage_matrix(latitudes, longitudes, index, radius_km)
+    if exact:
+        picked, gains = solve_exact(cover, weights, budget, target, time_limit)
+    else:
+        picked, gains = lazy_greedy(cover, weights, budget, target)
+    return picked, gains
+
+
+def zip_weights(frame, weight):
+    """The weight column as floats; missing values weigh nothing"""
+    return frame[weight].astype(float).fillna(0).clip(lower=0).to_numpy()
+
+
+def select_sites(members, weight='total_pop', radius_miles=COVERAGE_RADIUS_MILES, budget=None, target=1.0,
+                 exact=False, workers=None, time_limit=None):
+    """Pick the ZIPs to search in each cluster so their service circles cover
+    target of the cluster's weight (or the most weight with budget sites).
+
+    Returns members with selected, pick (order within the cluster, 1 =
+    first pick) and gain (weight newly covered by that pick).
+    """
+    members = members.reset_index(drop=True)
+    groups = list(members.groupby('cluster_id', sort=False).indices.values())
+    weights = zip_weights(members, weight)
+    jobs = [(members['latitude'].to_numpy()[rows], members['longitude'].to_numpy()[rows], weights[rows],
+             radius_miles * KM_PER_MILE, budget, target, exact, time_limit) for rows in groups]
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(select_cluster, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+    else:
+        results = [select_cluster(job) for job in jobs]
+
+    out = members.assign(selected=False, pick=pd.NA, gain=0.0)
+    out['pick'] = out['pick'].astype('Int64')
+    for rows, (picked, gains) in zip(groups, results):
+        positions = rows[picked]
+        out.loc[positions, 'selected'] = True
+        out.loc[positions, 'pick'] = np.arange(1, len(picked) + 1)
+        out.loc[positions, 'gain'] = gains
+    return out
+
+
+def rank_targets(targets, members, weight='total_pop', zip_index=None, committed=COMMITTED_STATUSES):
+    """Order targets by the weight of clustered ZIPs each would newly cover.
+
+    Each target covers the ZIPs within its drive radius, or only the ZIP it
+    sits in (the nearest one in zip_index) when the radius is not in miles.
+    Targets at a committed status are taken as already covering their ZIPs
+    and rank first. Returns targets with rank, gain and covered_pct
+    (cumulative share of the clustered weight).
+    """
+    targets = targets.reset_index(drop=True)
+    members = members.drop_duplicates('zip_code').reset_index(drop=True)
+    index = ZipSpatialIndex.from_frame(members, 'zip_code')
+    weights = zip_weights(members, weight)
+
+    # A target without a radius in miles covers only its own ZIP, if clustered
+    home = np.full(len(targets), -1)
+    if zip_index is not None:
+        _, nearest = zip_index.query_nearest(targets['latitude'], targets['longitude'])
+        positions = (index.position(zip_index.zip_codes[i]) if i >= 0 else None for i in nearest[:, 0])
+        home = np.array([-1 if p is None else p for p in positions], dtype=np.int64)
+    radii = targets['drive_radius'].map(target_radius).astype(float)
+    cover = catchment_matrix(targets['latitude'], targets['longitude'], radii, index, home)
+
+    # Committed targets come first, in their current order
+    covered = np.zeros(len(index), dtype=bool)
+    committed_rows = np.flatnonzero(targets['status'].isin(committed).to_numpy())
+    committed_gains = []
+    for row in committed_rows:
+        zips = cover[row].indices
+        committed_gains.append(weights[zips][~covered[zips]].sum())
+        covered[zips] = True
+
+    open_rows = np.setdiff1d(np.arange(len(targets)), committed_rows)
+    picked, gains = lazy_greedy(cover[open_rows], weights, covered=covered)
+    rest = sorted(set(range(len(open_rows))) - set(picked))
+    order = list(committed_rows) + [open_rows[i] for i in picked + rest]
+    order_gains = committed_gains + gains + [0.0] * len(rest)
+
+    ranked = targets.iloc[order].reset_index(drop=True)
+    ranked.insert(0, 'rank', np.arange(1, len(ranked) + 1))
+    ranked['gain'] = order_gains
+    total = weights.sum() or 1.0
+    ranked['covered_pct'] = 100 * np.cumsum(order_gains) / total
+    return ranked
+
+
+def load_members(conn, analysis_type):
+    return cluster_order(pd.read_sql_query(MEMBERS_QUERY, conn, params=(analysis_type.lower(),)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick the ZIPs to search in each cluster, or rank the targets")
+    parser.add_argument('--db', default=db.DB_PATH)
+    parser.add_argument('analysis_type', help="an analysis type in zip_cluster, e.g. ABC_10mi")
+    parser.add_argument('--weight', choices=WEIGHT_COLUMNS, default='total_pop')
+    parser.add_argument('--radius', type=float, default=COVERAGE_RADIUS_MILES,
+                        help="service radius of a searched ZIP, in miles")
+    parser.add_argument('--budget', type=int, help="at most this many ZIPs per cluster (maximum coverage)")
+    parser.add_argument('--target', type=float, default=1.0,
+                        help="share of each cluster's weight to cover, in (0, 1] (set cover; default 1.0)")
+    parser.add_argument('--exact', action='store_true', help="solve each cluster as an integer program")
+    parser.add_argument('--time-limit', type=float, metavar='SECONDS',
+                        help="stop each cluster's integer program after this long and keep its best solution")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--csv', nargs='?', const='data', metavar='DIR',
+                        help="write <type>_selected.csv with selected set for the picked ZIPs (default dir: data)")
+    parser.add_argument('--rank-targets', metavar='CSV', nargs='?', const='-',
+                        help="rank the targets by the clustered weight each newly covers; '-' prints only")
+    args = parser.parse_args()
+    if not 0 < args.target <= 1:
+        parser.error("--target must be in (0, 1]")
+
+    parse_analysis(args.analysis_type)
+    conn = db.connect(args.db)
+    try:
+        members = load_members(conn, args.analysis_type)
+        if not len(members):
+            raise SystemExit(f"No clusters for {args.analysis_type} in zip_cluster")
+        start = time.perf_counter()
+
+        if args.rank_targets:
+            targets = pd.read_sql_query(TARGETS_QUERY, conn)
+            ranked = rank_targets(targets, members, args.weight, ZipSpatialIndex.from_db(conn))
+            print(f"Ranked {len(ranked)} targets in {time.perf_counter() - start:.2f}s")
+            if args.rank_targets != '-':
+                ranked.to_csv(args.rank_targets, index=False)
+            print(ranked[['rank', 'organization', 'status', 'drive_radius', 'gain', 'covered_pct']]
+                  .head(20).to_string(index=False))
+            return
+
+        sites = select_sites(members, args.weight, args.radius, args.budget, args.target, args.exact,
+                             args.workers, args.time_limit)
+        elapsed = time.perf_counter() - start
+        weights = zip_weights(sites, args.weight)
+        covered = sites['gain'].sum() / (weights.sum() or 1.0)
+        print(f"{args.analysis_type}: {int(sites['selected'].sum())} of {len(sites)} ZIPs picked in "
+              f"{sites['cluster_id'].nunique()} clusters, {covered:.1%} of {args.weight} covered "
+              f"({'exact' if args.exact else 'greedy'}, {elapsed:.2f}s)")
+        if args.csv:
+            # Not <type>_optimized.csv: coverage.py writes that, with needs_search meaning not can_skip
+            write_flagged_csv(args.analysis_type, sites.set_index('zip_code')['selected'], 'selected', 'selected',
+                              args.csv)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
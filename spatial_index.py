@@ -0,0 +1,149 @@
+import sqlite3
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from ingest import read_zips
+
+EARTH_RADIUS_KM = 6371  # Same radius as geocode_addresses.haversine_distance
+KM_PER_MILE = 1.609344
+
+
+def to_unit_vectors(latitudes, longitudes):
+    """Convert lat/lon degrees to 3D points on the unit sphere"""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def km_to_chord(distance_km):
+    """Convert a great-circle distance to a straight-line chord on the unit sphere"""
+    angle = np.minimum(np.asarray(distance_km, dtype=float) / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+def chord_to_km(chord):
+    """Convert a unit-sphere chord length back to a great-circle distance"""
+    chord = np.clip(np.asarray(chord, dtype=float), 0, 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(chord / 2)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Vectorized haversine distance in kilometers (broadcasts like NumPy)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def normalize_zip(zip_code):
+    """Return a ZIP as a zero-padded 5 character string"""
+    if zip_code is None or (isinstance(zip_code, float) and np.isnan(zip_code)):
+        return None
+    return str(zip_code).split('.')[0].strip().zfill(5)
+
+
+class ZipSpatialIndex:
+    """KD-tree over ZIP centroids projected onto the unit sphere.
+
+    Chord distance on the unit sphere is monotonic in great-circle distance,
+    so nearest and within-radius queries on the tree are exact for haversine
+    distance. Build it once and reuse it for every lookup.
+    """
+
+    def __init__(self, zip_codes, latitudes, longitudes):
+        zip_codes = np.asarray([normalize_zip(z) for z in zip_codes], dtype=object)
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+
+        # ZIPs without coordinates can't be placed on the tree
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        self.zip_codes = zip_codes[valid]
+        self.latitudes = latitudes[valid]
+        self.longitudes = longitudes[valid]
+        self.tree = cKDTree(to_unit_vectors(self.latitudes, self.longitudes))
+        self._positions = {z: i for i, z in enumerate(self.zip_codes)}
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    @classmethod
+    def from_frame(cls, df, zip_col=None, lat_col='latitude', lon_col='longitude'):
+        """Build from a DataFrame; uses the index for ZIPs when zip_col is None"""
+        zip_codes = df.index if zip_col is None else df[zip_col]
+        return cls(zip_codes, df[lat_col], df[lon_col])
+
+    @classmethod
+    def from_csv(cls, path, zip_col='ZIP', lat_col='latitude', lon_col='longitude'):
+        """Build from any of the ZIP CSVs in data/"""
+        df = read_zips(path, usecols=[zip_col, lat_col, lon_col])
+        return cls.from_frame(df, zip_col, lat_col, lon_col)
+
+    @classmethod
+    def from_db(cls, conn_or_path='data/targets.db'):
+        """Build from the zip_data table"""
+        conn = conn_or_path
+        if isinstance(conn_or_path, str):
+            conn = sqlite3.connect(conn_or_path)
+        try:
+            rows = conn.execute('''
+                SELECT zip_code, latitude, longitude
+                FROM zip_data
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ''').fetchall()
+        finally:
+            if isinstance(conn_or_path, str):
+                conn.close()
+        if not rows:
+            return cls([], [], [])
+        zip_codes, latitudes, longitudes = zip(*rows)
+        return cls(zip_codes, latitudes, longitudes)
+
+    def position(self, zip_code):
+        """Return the index position of a ZIP, or None if it isn't indexed"""
+        return self._positions.get(normalize_zip(zip_code))
+
+    def coords(self, zip_code):
+        """Return (lat, lon) for an indexed ZIP, or (None, None)"""
+        i = self.position(zip_code)
+        if i is None:
+            return None, None
+        return self.latitudes[i], self.longitudes[i]
+
+    def query_nearest(self, latitudes, longitudes, k=1, max_distance_km=np.inf):
+        """Batched k-nearest lookup.
+
+        Returns (distances_km, positions), both shaped (n, k). Neighbours
+        beyond max_distance_km come back as distance inf and position -1.
+        """
+        points = to_unit_vectors(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        distances = np.full((len(points), k), np.inf)
+        positions = np.full((len(points), k), -1, dtype=np.int64)
+        if len(self) == 0 or len(points) == 0:
+            return distances, positions
+
+        upper = np.inf if np.isinf(max_distance_km) else float(km_to_chord(max_distance_km))
+        chord, idx = self.tree.query(points, k=k, distance_upper_bound=upper)
+        chord = np.asarray(chord, dtype=float).reshape(len(points), k)
+        idx = np.asarray(idx).reshape(len(points), k)
+
+        found = np.isfinite(chord)
+        distances[found] = chord_to_km(chord[found])
+        positions[found] = idx[found]
+        return distances, positions
+
+    def query_radius(self, latitudes, longitudes, radius_km):
+        """Batched within-radius lookup.
+
+        radius_km may be a scalar or one radius per query point. Returns a
+        list with one array of index positions per query point.
+        """
+        points = to_unit_vectors(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        if len(self) == 0:
+            return [np.empty(0, dtype=np.int64) for _ in range(len(points))]
+        hits = self.tree.query_ball_point(points, r=km_to_chord(radius_km))
+        return [np.asarray(h, dtype=np.int64) for h in hits]
+
+    def query_pairs(self, radius_km):
+        """Return an (m, 2) array of index pairs closer than radius_km"""
+        return self.tree.query_pairs(r=float(km_to_chord(radius_km)), output_type='ndarray')
@@ -0,0 +1,300 @@
+import argparse
+import gzip
+import json
+import math
+import sqlite3
+import struct
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from cluster_summary import decode_polyline
+from db import data_generation
+
+MBTILES_PATH = 'data/tiles.mbtiles'
+
+EXTENT = 4096           # tile coordinate space, per the MVT spec
+TILE_PIXELS = 256
+BUFFER = 64             # tile units drawn beyond each edge so symbols are not cut off
+POINT_CELL_PIXELS = 8   # below max zoom, ZIPs are aggregated per cell of this many screen pixels
+
+ZIP_QUERY = '''
+    SELECT zip_code, grade, total_pop, median_income, latitude, longitude
+    FROM zip_data
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+HULL_QUERY = '''
+    SELECT analysis_type, cluster_id, zip_count, total_pop, mean_income, hull
+    FROM cluster_summary
+'''
+
+MBTILES_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)',
+    '''CREATE TABLE IF NOT EXISTS tiles (
+        zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+        PRIMARY KEY (zoom_level, tile_column, tile_row)
+    )''',
+]
+
+MVT_MOVE_TO, MVT_LINE_TO, MVT_CLOSE_PATH = 1, 2, 7
+MVT_POINT, MVT_POLYGON = 1, 3
+
+
+# --- Protocol buffer encoding (only what vector_tile.proto needs) ---
+
+def varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def varint_field(number, value):
+    return varint(number << 3) + varint(value)
+
+
+def bytes_field(number, data):
+    return varint((number << 3) | 2) + varint(len(data)) + data
+
+
+def packed_field(number, values):
+    return bytes_field(number, b''.join(varint(v) for v in values))
+
+
+def encode_value(value):
+    """A vector_tile Value message"""
+    if isinstance(value, (bool, np.bool_)):
+        return varint_field(7, int(value))
+    if isinstance(value, (int, np.integer)):
+        value = int(value)
+        return varint_field(5, value) if value >= 0 else varint_field(6, zigzag(value))
+    if isinstance(value, (float, np.floating)):
+        return varint((3 << 3) | 1) + struct.pack('<d', value)
+    return bytes_field(1, str(value).encode('utf-8'))
+
+
+def encode_layer(name, features):
+    """A vector_tile Layer from [(geom_type, geometry_commands, properties), ...]"""
+    keys, values = {}, {}
+    encoded = []
+    for geom_type, geometry, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        encoded.append(bytes_field(2, packed_field(2, tags) + varint_field(3, geom_type)
+                                   + packed_field(4, geometry)))
+    return b''.join([
+        varint_field(15, 2),
+        bytes_field(1, name.encode('utf-8')),
+        *encoded,
+        *(bytes_field(3, key.encode('utf-8')) for key in keys),
+        *(bytes_field(4, encode_value(value)) for _, value in values),
+        varint_field(5, EXTENT),
+    ])
+
+
+def encode_tile(layers):
+    """A vector_tile Tile from {layer name: features}; empty layers are left out"""
+    return b''.join(bytes_field(3, encode_layer(name, features))
+                    for name, features in layers.items() if features)
+
+
+# --- Geometry ---
+
+def command(cmd, count):
+    return (cmd & 0x7) | (count << 3)
+
+
+def point_geometry(x, y):
+    return [command(MVT_MOVE_TO, 1), zigzag(x), zigzag(y)]
+
+
+def polygon_geometry(ring):
+    """Commands for one closed ring of integer tile coordinates (no repeated end point)"""
+    x0, y0 = ring[0]
+    geometry = [command(MVT_MOVE_TO, 1), zigzag(x0), zigzag(y0), command(MVT_LINE_TO, len(ring) - 1)]
+    for (px, py), (x, y) in zip(ring, ring[1:]):
+        geometry += [zigzag(x - px), zigzag(y - py)]
+    geometry.append(command(MVT_CLOSE_PATH, 1))
+    return geometry
+
+
+def ring_area(ring):
+    """Shoelace area; positive means clockwise on screen, which MVT requires for exterior rings"""
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def clip_ring(ring, lo, hi):
+    """Sutherland-Hodgman clip of a ring to the square [lo, hi] in both axes"""
+    for axis, bound, keep_below in ((0, lo, False), (0, hi, True), (1, lo, False), (1, hi, True)):
+        if not ring:
+            break
+        clipped = []
+        for i, current in enumerate(ring):
+            previous = ring[i - 1]
+            current_in = (current[axis] <= bound) if keep_below else (current[axis] >= bound)
+            previous_in = (previous[axis] <= bound) if keep_below else (previous[axis] >= bound)
+            if current_in != previous_in:
+                t = (bound - previous[axis]) / (current[axis] - previous[axis])
+                clipped.append(tuple(p + t * (c - p) for p, c in zip(previous, current)))
+            if current_in:
+                clipped.append(current)
+        ring = clipped
+    return ring
+
+
+def lonlat_to_pixels(lons, lats, zoom):
+    """Web Mercator global pixel coordinates at zoom"""
+    scale = TILE_PIXELS * 2 ** zoom
+    x = (np.asarray(lons, dtype=float) + 180) / 360 * scale
+    sin_lat = np.clip(np.sin(np.radians(np.asarray(lats, dtype=float))), -0.9999, 0.9999)
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * scale
+    return x, y
+
+
+# --- Tile building ---
+
+def aggregate_points(zips, zoom, max_zoom):
+    """One point per POINT_CELL_PIXELS cell below max_zoom, represented by its most populous ZIP"""
+    px, py = lonlat_to_pixels(zips['longitude'], zips['latitude'], zoom)
+    points = zips.assign(px=px, py=py, zip_count=1, cell_pop=zips['total_pop'])
+    if zoom >= max_zoom:
+        return points
+
+    cells = [np.floor(px / POINT_CELL_PIXELS), np.floor(py / POINT_CELL_PIXELS)]
+    grouped = points.groupby(cells, sort=False)
+    representatives = points.loc[grouped['total_pop'].idxmax().to_numpy()].reset_index(drop=True)
+    representatives['zip_count'] = grouped.size().to_numpy()
+    representatives['cell_pop'] = grouped['total_pop'].sum().to_numpy()
+    return representatives
+
+
+def point_features(points):
+    """{(x, y) tile: [(type, geometry, properties), ...]} for the ZIP layer"""
+    tiles = defaultdict(list)
+    scale = EXTENT / TILE_PIXELS
+    for row in points.itertuples(index=False):
+        tx, ty = int(row.px // TILE_PIXELS), int(row.py // TILE_PIXELS)
+        x = int(round((row.px - tx * TILE_PIXELS) * scale))
+        y = int(round((row.py - ty * TILE_PIXELS) * scale))
+        properties = {
+            'zip_code': row.zip_code, 'grade': row.grade, 'total_pop': int(row.total_pop),
+            'median_income': row.median_income, 'zip_count': int(row.zip_count), 'cell_pop': int(row.cell_pop),
+        }
+        tiles[(tx, ty)].append((MVT_POINT, point_geometry(x, y), properties))
+    return tiles
+
+
+def hull_features(hulls, zoom):
+    """{(x, y) tile: [(type, geometry, properties), ...]} for the cluster hull layer"""
+    tiles = defaultdict(list)
+    scale = EXTENT / TILE_PIXELS
+    for hull in hulls.itertuples(index=False):
+        coords = decode_polyline(hull.hull)
+        if len(coords) < 3:
+            continue
+        px, py = lonlat_to_pixels([lon for _, lon in coords], [lat for lat, _ in coords], zoom)
+        properties = {
+            'analysis_type': hull.analysis_type, 'cluster_id': hull.cluster_id, 'zip_count': int(hull.zip_count),
+            'total_pop': int(hull.total_pop), 'mean_income': hull.mean_income,
+        }
+        margin = BUFFER / scale
+        for tx in range(int((px.min() - margin) // TILE_PIXELS), int((px.max() + margin) // TILE_PIXELS) + 1):
+            for ty in range(int((py.min() - margin) // TILE_PIXELS), int((py.max() + margin) // TILE_PIXELS) + 1):
+                local = [((x - tx * TILE_PIXELS) * scale, (y - ty * TILE_PIXELS) * scale) for x, y in zip(px, py)]
+                ring = clip_ring(local, -BUFFER, EXTENT + BUFFER)
+                # Quantize and drop vertices that collapse onto their predecessor
+                quantized = []
+                for x, y in ring:
+                    point = (int(round(x)), int(round(y)))
+                    if not quantized or point != quantized[-1]:
+                        quantized.append(point)
+                if len(quantized) > 1 and quantized[0] == quantized[-1]:
+                    quantized.pop()
+                area = ring_area(quantized) if len(quantized) >= 3 else 0
+                if area == 0:
+                    continue
+                if area < 0:
+                    quantized.reverse()
+                tiles[(tx, ty)].append((MVT_POLYGON, polygon_geometry(quantized), properties))
+    return tiles
+
+
+def build_tiles(db_path='data/targets.db', mbtiles_path=MBTILES_PATH, min_zoom=3, max_zoom=12):
+    """Render zip_data points and cluster_summary hulls into an MBTiles file.
+
+    The tiles are replaced in one transaction, so a server reading the file
+    sees either the old or the new set. Returns the number of tiles written.
+    """
+    start = time.perf_counter()
+    source = sqlite3.connect(db_path)
+    zips = pd.read_sql_query(ZIP_QUERY, source)
+    zips['total_pop'] = zips['total_pop'].fillna(0)
+    hulls = pd.read_sql_query(HULL_QUERY, source)
+    generation = data_generation(source).get('zips', 0)
+    source.close()
+
+    out = sqlite3.connect(mbtiles_path)
+    for statement in MBTILES_SCHEMA:
+        out.execute(statement)
+
+    count = 0
+    with out:
+        out.execute('DELETE FROM tiles')
+        for zoom in range(min_zoom, max_zoom + 1):
+            point_tiles = point_features(aggregate_points(zips, zoom, max_zoom))
+            hull_tiles = hull_features(hulls, zoom)
+            rows = []
+            for tx, ty in set(point_tiles) | set(hull_tiles):
+                data = encode_tile({'zips': point_tiles.get((tx, ty)), 'clusters': hull_tiles.get((tx, ty))})
+                # MBTiles rows count from the bottom (TMS)
+                rows.append((zoom, tx, (1 << zoom) - 1 - ty, gzip.compress(data, mtime=0)))
+            out.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', rows)
+            count += len(rows)
+            print(f"zoom {zoom}: {len(rows)} tiles")
+
+        bounds = [zips['longitude'].min(), zips['latitude'].min(), zips['longitude'].max(), zips['latitude'].max()]
+        metadata = {
+            'name': 'targets', 'format': 'pbf', 'type': 'overlay',
+            'minzoom': min_zoom, 'maxzoom': max_zoom,
+            'bounds': ','.join(f'{value:.5f}' for value in bounds),
+            'center': f'{(bounds[0] + bounds[2]) / 2:.5f},{(bounds[1] + bounds[3]) / 2:.5f},{min_zoom}',
+            'generation': generation,
+            'json': json.dumps({'vector_layers': [
+                {'id': 'zips', 'minzoom': min_zoom, 'maxzoom': max_zoom, 'fields': {
+                    'zip_code': 'String', 'grade': 'String', 'total_pop': 'Number', 'median_income': 'Number',
+                    'zip_count': 'Number', 'cell_pop': 'Number'}},
+                {'id': 'clusters', 'minzoom': min_zoom, 'maxzoom': max_zoom, 'fields': {
+                    'analysis_type': 'String', 'cluster_id': 'String', 'zip_count': 'Number',
+                    'total_pop': 'Number', 'mean_income': 'Number'}},
+            ]}),
+        }
+        out.executemany('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)',
+                        [(name, str(value)) for name, value in metadata.items()])
+    out.close()
+
+    print(f"Wrote {count} tiles to {mbtiles_path} in {time.perf_counter() - start:.1f}s")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render ZIP points and cluster hulls into vector tiles (MBTiles)")
+    parser.add_argument('--db', default='data/targets.db')
+    parser.add_argument('--output', default=MBTILES_PATH)
+    parser.add_argument('--min-zoom', type=int, default=3)
+    parser.add_argument('--max-zoom', type=int, default=12)
+    args = parser.parse_args()
+
+    build_tiles(args.db, args.output, args.min_zoom, args.max_zoom)
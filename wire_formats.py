@@ -0,0 +1,99 @@
+import base64
+import json
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+JSON_MEDIA_TYPE = 'application/json'
+COLUMNS_MEDIA_TYPE = 'application/vnd.columns+json'
+MSGPACK_MEDIA_TYPE = 'application/x-msgpack'
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+
+# Sent as little-endian float32: about half a metre of precision at US latitudes
+FLOAT32_COLUMNS = {'latitude', 'longitude', 'lat', 'lng'}
+
+def available_formats():
+    """{format name: media type} for the columnar formats this server can produce"""
+    formats = {'columns': COLUMNS_MEDIA_TYPE}
+    if msgpack is not None:
+        formats['msgpack'] = MSGPACK_MEDIA_TYPE
+    if pa is not None:
+        formats['arrow'] = ARROW_MEDIA_TYPE
+    return formats
+
+def requested_format(request):
+    """Columnar format asked for by ?format= or the Accept header; None means JSON rows.
+
+    Raises ValueError for a format that is unknown or whose package is not installed.
+    """
+    formats = available_formats()
+    name = request.args.get('format')
+    if name:
+        if name == 'json':
+            return None
+        if name not in formats:
+            raise ValueError(f"Unsupported format: {name} (available: json, {', '.join(formats)})")
+        return name
+
+    # JSON is listed first so */* and missing Accept headers keep the row format
+    best = request.accept_mimetypes.best_match([JSON_MEDIA_TYPE] + list(formats.values()))
+    for name, media_type in formats.items():
+        if best == media_type:
+            return name
+    return None
+
+def fetch_columns(conn, sql, params=()):
+    """(names, columns) straight from the cursor's tuples, without building a dict per row"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(sql, params).fetchall()
+    names = [description[0] for description in cursor.description]
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    return names, columns
+
+def float32_column(values):
+    return np.array(values, dtype=float).astype('<f4')
+
+def encode_columns(names, columns, fmt):
+    """Serialize columns as fmt; returns (body, media type).
+
+    columns and msgpack: {"count": n, "columns": {name: values}}, where
+    FLOAT32_COLUMNS are {"dtype": "float32", "data": <little-endian bytes>}
+    (base64 in JSON). arrow: an IPC stream holding one record batch.
+    """
+    count = len(columns[0]) if columns else 0
+
+    if fmt == 'arrow':
+        arrays = [
+            pa.array(float32_column(values)) if name in FLOAT32_COLUMNS else pa.array(list(values))
+            for name, values in zip(names, columns)
+        ]
+        table = pa.Table.from_arrays(arrays, names=names)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_MEDIA_TYPE
+
+    encoded = {}
+    for name, values in zip(names, columns):
+        if name in FLOAT32_COLUMNS:
+            data = float32_column(values).tobytes()
+            if fmt == 'columns':
+                data = base64.b64encode(data).decode('ascii')
+            encoded[name] = {'dtype': 'float32', 'data': data}
+        else:
+            encoded[name] = list(values)
+    payload = {'count': count, 'columns': encoded}
+
+    if fmt == 'msgpack':
+        return msgpack.packb(payload), MSGPACK_MEDIA_TYPE
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8'), COLUMNS_MEDIA_TYPE